@@ -0,0 +1,366 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import pandas as pd
+
+# Parquet and Arrow IPC export need pyarrow; CSV export works without it
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Columns of the analyses table that GET /analyses can filter on directly
+ANALYSIS_FILTERS = ('filename', 'document_hash', 'overall_risk_score', 'pipeline', 'mode')
+
+# Columns of the risk_factors table; an analysis matches if any of its risk factors does
+RISK_FILTERS = ('category', 'severity')
+
+# Flat tables available for bulk export, with the column types they are exported as
+EXPORT_TABLES = {
+    'analyses': {
+        'id': 'string',
+        'filename': 'string',
+        'document_hash': 'string',
+        'overall_risk_score': 'string',
+        'pipeline': 'string',
+        'mode': 'string',
+        'risk_count': 'int64',
+        'text_length': 'Int64',
+        'summary': 'string',
+        'created_at': 'datetime'
+    },
+    'risk_factors': {
+        'analysis_id': 'string',
+        'position': 'int64',
+        'category': 'string',
+        'severity': 'string',
+        'description': 'string',
+        'recommendation': 'string',
+        'cost_impact': 'string',
+        'location': 'string',
+        'created_at': 'datetime'
+    },
+    'traces': {
+        'analysis_id': 'string',
+        'position': 'int64',
+        'section': 'string',
+        'issues_found': 'string',
+        'issue_count': 'int64',
+        'reasoning': 'string',
+        'evidence': 'string',
+        'severity_assessment': 'string',
+        'created_at': 'datetime'
+    }
+}
+
+# Export formats: 'csv' is streamed, the columnar formats are written with pyarrow
+EXPORT_FORMATS = ('csv', 'parquet', 'arrow')
+
+# Groupings supported by severity_counts, as SQL expressions over risk_factors
+AGGREGATE_GROUPS = {
+    'category': "category",
+    'day': "strftime('%Y-%m-%d', created_at, 'unixepoch')",
+    'month': "strftime('%Y-%m', created_at, 'unixepoch')"
+}
+
+
+def document_hash(text):
+    """Return the SHA-256 hex digest of a document's extracted text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def write_columnar(frames, export_format, sink):
+    """Write DataFrames from iter_frames to sink as one Parquet or Arrow IPC file, batch by batch"""
+    if pyarrow is None:
+        raise RuntimeError("Parquet and Arrow export need pyarrow (pip install pyarrow)")
+    writer = None
+    for frame in frames:
+        batch = pyarrow.Table.from_pandas(frame, preserve_index=False)
+        if writer is None:
+            if export_format == 'parquet':
+                writer = pyarrow.parquet.ParquetWriter(sink, batch.schema)
+            else:
+                writer = pyarrow.ipc.new_file(sink, batch.schema)
+        writer.write_table(batch)
+    writer.close()
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+class AnalysisStore:
+    """SQLite history of finished analyses, indexed for lookups by document, score and risk"""
+
+    def __init__(self, path):
+        self.path = path
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT,
+                    document_hash TEXT NOT NULL,
+                    overall_risk_score TEXT,
+                    pipeline TEXT,
+                    mode TEXT,
+                    risk_count INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    value TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS risk_factors (
+                    analysis_id TEXT NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    category TEXT,
+                    severity TEXT,
+                    PRIMARY KEY (analysis_id, position)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS traces (
+                    analysis_id TEXT NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    section TEXT,
+                    issues_found TEXT,
+                    issue_count INTEGER NOT NULL,
+                    reasoning TEXT,
+                    evidence TEXT,
+                    severity_assessment TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (analysis_id, position)
+                )
+            """)
+            # Columns added after the first release of the store
+            self._add_columns(conn, 'analyses', {'text_length': 'INTEGER', 'summary': 'TEXT', 'fingerprint': 'TEXT'})
+            self._add_columns(conn, 'risk_factors', {
+                'description': 'TEXT',
+                'recommendation': 'TEXT',
+                'cost_impact': 'TEXT',
+                'location': 'TEXT',
+                'created_at': 'REAL'
+            })
+            conn.execute("""
+                UPDATE risk_factors SET created_at = (SELECT created_at FROM analyses WHERE id = analysis_id)
+                WHERE created_at IS NULL
+            """)
+
+            for column in ('filename', 'document_hash', 'overall_risk_score', 'created_at'):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_analyses_{column} ON analyses ({column}, created_at)")
+            for column in RISK_FILTERS:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_risk_factors_{column} ON risk_factors ({column}, analysis_id)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_risk_factors_category_severity ON risk_factors (category, severity, analysis_id)"
+            )
+            # Covers the date-range severity aggregation without touching the table
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_risk_factors_created_at ON risk_factors (created_at, category, severity)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def _add_columns(self, conn, table, columns):
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, kind in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+
+    def save(self, analysis, text_hash, fingerprint=None):
+        """Store a finished analysis, with the report fingerprint used to find it as a previous version, and return its new id"""
+        analysis_id = uuid.uuid4().hex
+        now = time.time()
+        risk_factors = [risk for risk in analysis.get('risk_factors', []) if isinstance(risk, dict)]
+        traces = [trace for trace in analysis.get('thinking_traces', []) if isinstance(trace, dict)]
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO analyses (id, filename, document_hash, overall_risk_score, pipeline, mode, risk_count, "
+                "text_length, summary, created_at, value, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    analysis_id,
+                    analysis.get('filename'),
+                    text_hash,
+                    analysis.get('overall_risk_score'),
+                    analysis.get('pipeline'),
+                    analysis.get('mode', 'llm'),
+                    len(risk_factors),
+                    analysis.get('text_length'),
+                    _text(analysis.get('summary')),
+                    now,
+                    json.dumps(analysis),
+                    json.dumps(fingerprint) if fingerprint is not None else None
+                )
+            )
+            conn.executemany(
+                "INSERT INTO risk_factors (analysis_id, position, category, severity, description, recommendation, "
+                "cost_impact, location, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        analysis_id, position, _text(risk.get('category')), _text(risk.get('severity')),
+                        _text(risk.get('description')), _text(risk.get('recommendation')),
+                        _text(risk.get('cost_impact')), _text(risk.get('location')), now
+                    )
+                    for position, risk in enumerate(risk_factors)
+                ]
+            )
+            conn.executemany(
+                "INSERT INTO traces (analysis_id, position, section, issues_found, issue_count, reasoning, evidence, "
+                "severity_assessment, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        analysis_id, position, _text(trace.get('section')),
+                        '; '.join(str(issue) for issue in trace.get('issues_found') or []),
+                        len(trace.get('issues_found') or []), _text(trace.get('reasoning')),
+                        _text(trace.get('evidence')), _text(trace.get('severity_assessment')), now
+                    )
+                    for position, trace in enumerate(traces)
+                ]
+            )
+        return analysis_id
+
+    def get(self, analysis_id):
+        """Return the stored analysis with this id, or None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+        if row is None:
+            return None
+        analysis = json.loads(row[0])
+        analysis['id'] = analysis_id
+        return analysis
+
+    def fingerprints(self, analysis_id=None, limit=200):
+        """Return (id, filename, fingerprint) for the newest analyses stored with a fingerprint, or for one of them"""
+        query = "SELECT id, filename, fingerprint FROM analyses WHERE fingerprint IS NOT NULL"
+        params = []
+        if analysis_id is not None:
+            query += " AND id = ?"
+            params.append(analysis_id)
+        with self._connect() as conn:
+            rows = conn.execute(f"{query} ORDER BY created_at DESC LIMIT ?", params + [limit]).fetchall()
+        return [(row_id, filename, json.loads(fingerprint)) for row_id, filename, fingerprint in rows]
+
+    def _where(self, filters=None, start=None, end=None):
+        """Build the WHERE clause and parameters selecting analyses
+
+        filters maps names in ANALYSIS_FILTERS or RISK_FILTERS to the exact
+        value to match; an analysis matches the risk filters if one of its
+        risk factors matches them all. start and end bound created_at (start
+        inclusive, end exclusive). Unknown filter names raise ValueError.
+        """
+        clauses = []
+        params = []
+        risk_clauses = []
+        risk_params = []
+        for name, value in (filters or {}).items():
+            if name in ANALYSIS_FILTERS:
+                clauses.append(f"{name} = ?")
+                params.append(value)
+            elif name in RISK_FILTERS:
+                risk_clauses.append(f"{name} = ?")
+                risk_params.append(value)
+            else:
+                raise ValueError(f"Unknown filter: {name}")
+        if risk_clauses:
+            # One subquery, so the risk filters must all match the same risk factor
+            clauses.append(f"id IN (SELECT analysis_id FROM risk_factors WHERE {' AND '.join(risk_clauses)})")
+            params.extend(risk_params)
+        if start is not None:
+            clauses.append("created_at >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("created_at < ?")
+            params.append(end)
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def list(self, filters=None, limit=50, offset=0, start=None, end=None):
+        """Return one page of analysis summaries, newest first, plus the total matching"""
+        where, params = self._where(filters, start, end)
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM analyses {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT id, filename, document_hash, overall_risk_score, pipeline, mode, risk_count, created_at "
+                f"FROM analyses {where} ORDER BY created_at DESC, id LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+
+        columns = ('id', 'filename', 'document_hash', 'overall_risk_score', 'pipeline', 'mode', 'risk_count', 'created_at')
+        return {
+            "analyses": [dict(zip(columns, row)) for row in rows],
+            "total": total,
+            "limit": limit,
+            "offset": offset
+        }
+
+    def iter_frames(self, table, filters=None, start=None, end=None, batch_size=10000):
+        """Yield one of EXPORT_TABLES as typed DataFrames of up to batch_size rows
+
+        Rows belong to the analyses selected by filters, start and end. At
+        least one (possibly empty) frame is yielded so callers always see
+        the columns.
+        """
+        columns = EXPORT_TABLES[table]
+        where, params = self._where(filters, start, end)
+        if table == 'analyses':
+            query = f"SELECT {', '.join(columns)} FROM analyses {where} ORDER BY created_at, id"
+        else:
+            query = (
+                f"SELECT {', '.join(columns)} FROM {table} "
+                f"WHERE analysis_id IN (SELECT id FROM analyses {where}) ORDER BY created_at, analysis_id, position"
+            )
+
+        with self._connect() as conn:
+            cursor = conn.execute(query, params)
+            yielded = False
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows and yielded:
+                    return
+                yield self._frame(table, rows)
+                yielded = True
+                if not rows:
+                    return
+
+    def _frame(self, table, rows):
+        columns = EXPORT_TABLES[table]
+        frame = pd.DataFrame.from_records(rows, columns=list(columns))
+        for name, kind in columns.items():
+            if kind == 'datetime':
+                frame[name] = pd.to_datetime(frame[name].astype('float64'), unit='s', utc=True)
+            else:
+                frame[name] = frame[name].astype(kind)
+        return frame
+
+    def severity_counts(self, group_by='category', start=None, end=None):
+        """Count risk factors by severity for each group, within an optional created_at range
+
+        Returns a DataFrame indexed by group with one column per severity.
+        """
+        group = AGGREGATE_GROUPS[group_by]
+        clauses = []
+        params = []
+        if start is not None:
+            clauses.append("created_at >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("created_at < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._connect() as conn:
+            counts = pd.read_sql_query(
+                f"SELECT {group} AS grp, severity, COUNT(*) AS n FROM risk_factors {where} GROUP BY grp, severity",
+                conn,
+                params=params
+            )
+        counts['grp'] = counts['grp'].fillna('Unknown')
+        counts['severity'] = counts['severity'].fillna('Unknown')
+        return counts.pivot_table(index='grp', columns='severity', values='n', aggfunc='sum', fill_value=0)
@@ -1,16 +1,46 @@
 import os
 import json
 import csv
-import PyPDF2
 import io
-from flask import Flask, request, jsonify, render_template, send_file, Response, stream_with_context
+from flask import Flask, request, jsonify, render_template, send_file, Response, stream_with_context, g
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 import openai
 from dotenv import load_dotenv
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, timezone
+import threading
+import uuid
+import zipfile
+import sqlite3
 import time
+import asyncio
+import atexit
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from analysis_cache import AnalysisCache, hash_parts, make_cache_key
+from analysis_store import (
+    AGGREGATE_GROUPS, ANALYSIS_FILTERS, EXPORT_FORMATS, EXPORT_TABLES, RISK_FILTERS,
+    AnalysisStore, document_hash, write_columnar
+)
+from segmenter import ReportSegments
+from revision import changed_sections, find_previous, make_fingerprint, merge_revision, similarity
+from json_stream import ArrayItemParser
+from json_repair import ParseStats, extract_json, invalid_fields
+from offline_scorer import SEVERITY_LEVELS, score_report, section_traces
+from map_reduce import is_duplicate, reduce_analyses, select_chunks, split_chunks
+from batch import REPORT_EXTENSIONS, BatchRunner
+from cascade import (
+    CASCADE_TRIAGES, TRIAGE_SYSTEM_PROMPT, CascadeStats, build_triage_prompt, cleared_trace, keyword_flags,
+    parse_triage_reply, severity_pattern
+)
+from job_queue import JobQueue, JobWorkers
+from single_flight import SingleFlight
+from metrics import Counter, Gauge, new_timings, record_span, registry, span, timing_summary, use_timings
+from pdf_extraction import iter_pdf_pages, extraction_summary, join_pages
+from ingestion import ByteBudget, IngestBusy, UploadTooLarge, decode_text, reserve_upload, spool_upload
+import llm_client
 
 # Load environment variables
 load_dotenv()
@@ -20,6 +50,10 @@ CORS(app)
 
 # Configure OpenAI
 openai.api_key = os.getenv('OPENAI_API_KEY')
+MODEL_NAME = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+
+# Bump whenever a prompt template changes so cached analyses are not reused
+PROMPT_VERSION = "3"
 
 # Risk categories and their keywords
 RISK_CATEGORIES = {
@@ -34,22 +68,425 @@ RISK_CATEGORIES = {
     "Property Condition": ["deferred maintenance", "wear", "deterioration", "age", "condition"]
 }
 
+# Report sections analyzed individually by the streaming endpoint
+ANALYSIS_SECTIONS = [
+    "Structural Assessment",
+    "Electrical Systems",
+    "Plumbing Systems",
+    "HVAC Systems",
+    "Safety Concerns",
+    "Environmental Issues",
+    "Accessibility",
+    "Property Condition"
+]
+
+# Risk categories whose keywords select the report passages sent to each section
+SECTION_CATEGORIES = {
+    "Structural Assessment": ["Structural Issues", "Roofing Issues"],
+    "Electrical Systems": ["Electrical Hazards"],
+    "Plumbing Systems": ["Plumbing Problems"],
+    "HVAC Systems": ["HVAC Concerns"],
+    "Safety Concerns": ["Safety Violations"],
+    "Environmental Issues": ["Environmental Hazards"],
+    "Accessibility": ["Accessibility Issues"],
+    "Property Condition": ["Property Condition"]
+}
+
+# Approximate token budget for the report passages sent with each section
+# prompt (about four characters per token)
+SECTION_TOKEN_BUDGET = int(os.getenv('SECTION_TOKEN_BUDGET', '750'))
+
+# Section traces come from "separate" calls, one per section, or a "single"
+# call that returns every section's trace as one array, sending the shared
+# instructions and passages once; each trace is still streamed as soon as
+# its array element parses. The single reply's token budget is the sum of
+# the per-section budgets, up to SINGLE_CALL_MAX_TOKENS.
+SECTION_CALL_MODES = ("separate", "single")
+SECTION_CALLS = os.getenv('SECTION_CALLS', 'separate')
+SINGLE_CALL_MAX_TOKENS = 3000
+
+# How the final assessment is produced: "full" sends the report text again and
+# runs alongside the sections, "traces" builds it from the section traces and
+# the report excerpts they cite, which costs far fewer input tokens, and
+# "mapreduce" assesses the whole report chunk by chunk and merges the results
+ANALYSIS_PIPELINES = ("full", "traces", "mapreduce")
+ANALYSIS_PIPELINE = os.getenv('ANALYSIS_PIPELINE', 'full')
+
+# Map-reduce pipeline: the report is split into chunks of about
+# MAP_REDUCE_CHUNK_TOKENS, and at most MAP_REDUCE_MAX_CHUNKS of them (those
+# with the most risk keywords) are sent to the model, which bounds the cost
+MAP_REDUCE_CHUNK_TOKENS = int(os.getenv('MAP_REDUCE_CHUNK_TOKENS', '1500'))
+MAP_REDUCE_MAX_CHUNKS = int(os.getenv('MAP_REDUCE_MAX_CHUNKS', '8'))
+
+# "llm" runs the model pipeline; "fast" scores the report locally from the
+# RISK_CATEGORIES keywords in milliseconds. The fast path is also used
+# automatically whenever the model is unavailable.
+ANALYSIS_MODES = ("llm", "fast")
+ANALYSIS_MODE = os.getenv('ANALYSIS_MODE', 'llm')
+
+# Tiered cascade for the section analyses: a cheap triage tier decides per
+# section whether the full section prompt is needed. "keywords" looks for
+# severity phrases of CASCADE_MIN_SEVERITY or above in the section's
+# passages, "model" asks CASCADE_TRIAGE_MODEL for a one-word answer. Only
+# flagged sections are escalated to CASCADE_ESCALATION_MODEL with
+# CASCADE_ESCALATION_TOKENS; "off" sends every section to MODEL_NAME.
+ANALYSIS_CASCADE = os.getenv('ANALYSIS_CASCADE', 'off')
+CASCADE_TRIAGE_MODEL = os.getenv('CASCADE_TRIAGE_MODEL', MODEL_NAME)
+CASCADE_TRIAGE_TOKENS = 5
+CASCADE_MIN_SEVERITY = os.getenv('CASCADE_MIN_SEVERITY', 'Medium')
+CASCADE_ESCALATION_MODEL = os.getenv('CASCADE_ESCALATION_MODEL', MODEL_NAME)
+CASCADE_ESCALATION_TOKENS = int(os.getenv('CASCADE_ESCALATION_TOKENS', '800'))
+SECTION_MAX_TOKENS = 500
+cascade_pattern = severity_pattern(CASCADE_MIN_SEVERITY)
+
+# PDF text extraction: pages are extracted on PDF_EXTRACT_WORKERS processes
+# for long documents, stopping once PDF_MAX_CHARS of text has been collected
+# (0 reads the whole document)
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+PDF_MAX_CHARS = int(os.getenv('PDF_MAX_CHARS', '200000'))
+
+# Upload ingestion: uploads larger than UPLOAD_SPOOL_KB are spooled to
+# UPLOAD_SPOOL_DIR rather than held in memory, and none may exceed
+# UPLOAD_MAX_MB. At most INGEST_MAX_INFLIGHT_MB of uploads are held at once;
+# further uploads wait up to INGEST_WAIT_SECONDS for room, then get a 503.
+# Both are checked against the request's Content-Length before its form is
+# parsed, and UPLOAD_MAX_MB also caps the whole request body
+UPLOAD_MAX_MB = int(os.getenv('UPLOAD_MAX_MB', '100'))
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_MB * 1024 * 1024 or None
+UPLOAD_SPOOL_KB = int(os.getenv('UPLOAD_SPOOL_KB', '1024'))
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', os.path.join(app.root_path, 'uploads'))
+INGEST_MAX_INFLIGHT_MB = int(os.getenv('INGEST_MAX_INFLIGHT_MB', '512'))
+INGEST_WAIT_SECONDS = float(os.getenv('INGEST_WAIT_SECONDS', '30'))
+ingest_budget = ByteBudget(INGEST_MAX_INFLIGHT_MB * 1024 * 1024)
+
+# Batch jobs: results are written as JSONL under BATCH_OUTPUT_DIR
+BATCH_OUTPUT_DIR = os.getenv('BATCH_OUTPUT_DIR', os.path.join(app.root_path, 'batch_results'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+batch_jobs = {}
+
+# Maximum number of model calls in flight for a single analysis
+# (eight sections plus the final assessment by default)
+ANALYSIS_CONCURRENCY = int(os.getenv('ANALYSIS_CONCURRENCY', '9'))
+
+# Expected shape of model replies; fields that fail these checks are
+# re-requested on their own rather than re-running the whole call
+SECTION_TRACE_FIELDS = {
+    "section": str,
+    "issues_found": list,
+    "reasoning": str,
+    "evidence": str,
+    "severity_assessment": str
+}
+FINAL_ANALYSIS_FIELDS = {
+    "risk_factors": list,
+    "overall_risk_score": str,
+    "summary": str
+}
+RISK_FACTOR_FIELDS = {
+    "category": str,
+    "severity": str,
+    "description": str
+}
+
+# Ask for JSON output mode: 'auto' enables it unless the model is known not to support it
+OPENAI_JSON_MODE = os.getenv('OPENAI_JSON_MODE', 'auto')
+JSON_MODE_UNSUPPORTED = ('gpt-4-0314', 'gpt-4-0613', 'gpt-4-32k', 'gpt-3.5-turbo-0301', 'gpt-3.5-turbo-0613', 'gpt-3.5-turbo-16k')
+
+parse_stats = ParseStats()
+
+# Identical documents analyzed at the same time in this process share one run
+single_flight = SingleFlight()
+
+# Cache of finished analyses keyed by document text, model and prompt version,
+# plus a cache of individual section traces keyed by the exact prompt sent
+ANALYSIS_CACHE_PATH = os.getenv('ANALYSIS_CACHE_PATH', os.path.join(app.root_path, 'analysis_cache.db'))
+ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv('ANALYSIS_CACHE_MAX_MB', '100')) * 1024 * 1024
+
+analysis_cache = AnalysisCache(
+    ANALYSIS_CACHE_PATH,
+    table='analyses',
+    ttl_seconds=ANALYSIS_CACHE_TTL,
+    max_bytes=ANALYSIS_CACHE_MAX_BYTES
+)
+section_cache = AnalysisCache(
+    ANALYSIS_CACHE_PATH,
+    table='section_traces',
+    ttl_seconds=ANALYSIS_CACHE_TTL,
+    max_bytes=ANALYSIS_CACHE_MAX_BYTES
+)
+
+# History of every finished analysis, served by GET /analyses
+ANALYSIS_DB_PATH = os.getenv('ANALYSIS_DB_PATH', os.path.join(app.root_path, 'analyses.db'))
+ANALYSES_PAGE_SIZE = 50
+ANALYSES_MAX_PAGE_SIZE = 200
+analysis_store = AnalysisStore(ANALYSIS_DB_PATH)
+
+# Revised reports: given revision_of=auto (or a previous analysis id), an
+# upload is compared with the newest of the last REVISION_CANDIDATES stream
+# analyses for the same property or, failing that, sharing at least
+# REVISION_MIN_SIMILARITY of its passages, and only the sections whose
+# passages changed are analyzed again
+REVISION_MIN_SIMILARITY = float(os.getenv('REVISION_MIN_SIMILARITY', '0.5'))
+REVISION_CANDIDATES = int(os.getenv('REVISION_CANDIDATES', '200'))
+
+# Analyses submitted through /stream-analysis or POST /jobs run as jobs, so
+# they finish even if the client leaves. Up to JOB_CONCURRENCY jobs per
+# process run at once as tasks on the background event loop; the rest wait
+# in the queue. A running job renews its lease every third of
+# JOB_LEASE_SECONDS; one whose lease runs out, because its process died or
+# hung, is retried by another worker.
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', os.path.join(app.root_path, 'jobs.db'))
+JOB_CONCURRENCY = int(os.getenv('JOB_CONCURRENCY', '64'))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+# Finished jobs and their event logs are deleted after JOB_RETENTION_DAYS;
+# the analyses themselves stay in the analysis store
+JOB_RETENTION_DAYS = float(os.getenv('JOB_RETENTION_DAYS', '7'))
+# Streamed model tokens are written to the job log in batches this often
+JOB_EVENT_FLUSH_SECONDS = 0.1
+JOB_KEEPALIVE_SECONDS = 15
+job_queue = JobQueue(JOB_DB_PATH, lease_seconds=JOB_LEASE_SECONDS)
+
+# Metrics are served at GET /metrics. With ANALYSIS_TIMINGS (or a "timings"
+# form field on the upload) the complete event also carries the time spent
+# in each stage of that analysis
+ANALYSIS_TIMINGS = os.getenv('ANALYSIS_TIMINGS', 'off').lower() in ('1', 'true', 'on')
+streams_in_flight = Gauge('streams_in_flight', 'Event streams currently open to clients')
+analyses_in_flight = Gauge('analyses_in_flight', 'Uploaded reports currently being analyzed in this process')
+ingest_bytes = Gauge('ingest_bytes_in_flight', 'Bytes of uploads currently reserved against INGEST_MAX_INFLIGHT_MB')
+job_queue_jobs = Gauge('job_queue_jobs', 'Jobs in the background job queue by status', labels=('status',))
+replies_parsed = Counter('model_replies_parsed_total', 'Model replies by how their JSON was parsed', labels=('outcome',))
+cache_lookups = Counter('analysis_cache_lookups_total', 'Analysis and section trace cache lookups', labels=('cache', 'result'))
+cache_size = Gauge('analysis_cache_size_bytes', 'Size of the cached entries', labels=('cache',))
+shared_analyses = Counter('shared_analyses_total', 'Analyses that led or followed an identical concurrent analysis', labels=('role',))
+model_calls_saved = Counter('shared_analysis_model_calls_saved_total', 'Model calls not made because an identical analysis was shared')
+
+class TokenUsage:
+    """Thread-safe tally of model calls and tokens used by one request"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+    
+    def add(self, response):
+        """Record the usage reported on a ChatCompletion response"""
+        usage = getattr(response, 'usage', None) or {}
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage.get('prompt_tokens', 0)
+            self.completion_tokens += usage.get('completion_tokens', 0)
+    
+    def to_dict(self):
+        with self._lock:
+            return {
+                "model_calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.prompt_tokens + self.completion_tokens,
+                "elapsed_seconds": round(time.perf_counter() - self.started, 3)
+            }
+
+def extract_pdf_pages(pdf_file):
+    """Extract text from uploaded PDF file, returning it with the character offset at which each page starts"""
+    try:
+        with span('pdf_extraction'):
+            return join_pages(list(iter_pdf_pages(pdf_file, max_chars=PDF_MAX_CHARS, workers=PDF_EXTRACT_WORKERS)))
+    except Exception as e:
+        return f"Error extracting text from PDF: {str(e)}", None
+
 def extract_text_from_pdf(pdf_file):
     """Extract text from uploaded PDF file"""
+    return extract_pdf_pages(pdf_file)[0]
+
+def spool_request_upload(stream, filename, expected_bytes=None, reserved=None):
+    """Spool an upload stream within the configured size and in-flight limits; raises UploadTooLarge or IngestBusy
+    
+    reserved is room the request already holds in the in-flight budget (see
+    reserve_request_body()), which the upload then takes over.
+    """
+    return spool_upload(
+        stream,
+        filename,
+        expected_bytes=expected_bytes,
+        max_bytes=UPLOAD_MAX_MB * 1024 * 1024,
+        spool_bytes=UPLOAD_SPOOL_KB * 1024,
+        directory=UPLOAD_SPOOL_DIR,
+        budget=ingest_budget,
+        wait_seconds=INGEST_WAIT_SECONDS,
+        reserved=reserved
+    )
+
+def reserve_request_body(content_length):
+    """Check an upload request's Content-Length against UPLOAD_MAX_MB and reserve it from the in-flight budget
+    
+    Called before the form is parsed, since parsing already buffers and
+    spools the files. Returns the bytes reserved (UPLOAD_MAX_MB without a
+    Content-Length); raises UploadTooLarge or IngestBusy.
+    """
+    return reserve_upload(ingest_budget, content_length, UPLOAD_MAX_MB * 1024 * 1024, INGEST_WAIT_SECONDS)
+
+# Endpoints whose request bodies are uploads, reserved before their form is parsed
+UPLOAD_ENDPOINTS = ('upload_file', 'stream_analysis', 'create_job', 'create_batch')
+
+@app.before_request
+def reserve_upload_body():
+    if request.method != 'POST' or request.endpoint not in UPLOAD_ENDPOINTS:
+        return None
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        g.ingest_reserved = reserve_request_body(request.content_length)
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except IngestBusy as e:
+        return jsonify({'error': str(e)}), 503
+    return None
+
+@app.teardown_request
+def release_upload_body(error=None):
+    # Whatever the request's upload did not take over
+    reserved = g.pop('ingest_reserved', None)
+    if reserved:
+        ingest_budget.release(reserved)
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    # A body without a Content-Length that runs past MAX_CONTENT_LENGTH while the form is parsed
+    return jsonify({'error': f'Upload is larger than the {UPLOAD_MAX_MB} MB limit'}), 413
+
+def ingest_upload(file):
+    """Spool an uploaded file from the current request, returning (upload, None) or (None, error response)"""
+    try:
+        with span('upload_read'):
+            # The upload takes over the room reserved for the request body
+            reserved = g.pop('ingest_reserved', None)
+            return spool_request_upload(file.stream, secure_filename(file.filename), request.content_length, reserved), None
+    except UploadTooLarge as e:
+        return None, (jsonify({'error': str(e)}), 413)
+    except IngestBusy as e:
+        return None, (jsonify({'error': str(e)}), 503)
+
+def llm_available():
+    """Check whether an OpenAI API key is configured"""
+    return bool(openai.api_key) and openai.api_key != "your_openai_api_key_here"
+
+def json_mode_args(model=MODEL_NAME):
+    """Extra request arguments asking for a JSON object reply, if the model supports it"""
+    if OPENAI_JSON_MODE == 'off':
+        return {}
+    if OPENAI_JSON_MODE == 'auto' and (model == 'gpt-4' or model.startswith(JSON_MODE_UNSUPPORTED)):
+        return {}
+    return {"response_format": {"type": "json_object"}}
+
+def invalid_analysis_fields(analysis):
+    """Return the final-assessment fields that are missing or malformed"""
+    failing = invalid_fields(analysis, FINAL_ANALYSIS_FIELDS)
+    risk_factors = analysis.get('risk_factors') if isinstance(analysis, dict) else None
+    if isinstance(risk_factors, list) and any(invalid_fields(risk, RISK_FACTOR_FIELDS) for risk in risk_factors):
+        failing.append('risk_factors')
+    return failing
+
+def field_retry_messages(messages, reply, fields):
+    """Build a follow-up request asking the model to resend only the given fields"""
+    return messages + [
+        {"role": "assistant", "content": reply},
+        {"role": "user", "content": (
+            "That response was incomplete or not valid JSON. Return a JSON object containing only "
+            f"these fields, with the same meaning as requested before: {', '.join(fields)}"
+        )}
+    ]
+
+def start_parse(reply, check):
+    """Extract the JSON object from a reply, returning (data, failing fields, repaired)"""
+    with span('json_parse'):
+        try:
+            data, repaired = extract_json(reply)
+        except ValueError:
+            data, repaired = {}, True
+        if not isinstance(data, dict):
+            data = {}
+        return data, check(data), repaired
+
+def finish_parse(data, failing, retry_reply, check):
+    """Merge re-requested fields into data and record how the reply was parsed"""
+    if retry_reply is not None:
+        with span('json_parse'):
+            try:
+                patch, _ = extract_json(retry_reply)
+            except ValueError:
+                patch = {}
+            if isinstance(patch, dict):
+                data.update({name: patch[name] for name in failing if name in patch})
+            failing = check(data)
+    parse_stats.record('failed' if failing else 'field_retries')
+    return data, failing
+
+async def parse_model_reply(reply, messages, check, max_tokens, usage=None, model=MODEL_NAME):
+    """Parse a JSON object from a model reply, re-requesting only the fields that fail check
+    
+    check(data) returns the names of missing or malformed fields.
+    Returns (data, fields still failing).
+    """
+    data, failing, repaired = start_parse(reply, check)
+    if not failing:
+        parse_stats.record('repaired' if repaired else 'clean')
+        return data, []
+    
+    retry_reply = None
+    try:
+        response = await llm_client.achat(
+            field_retry_messages(messages, reply, failing),
+            max_tokens=max_tokens,
+            model=model,
+            usage=usage,
+            **json_mode_args(model)
+        )
+        retry_reply = response.choices[0].message.content
     except Exception as e:
-        return f"Error extracting text from PDF: {str(e)}"
+        print(f"Field re-request failed: {e}")
+    return finish_parse(data, failing, retry_reply, check)
 
-def analyze_risk_factors(text):
-    """Use OpenAI to analyze and extract risk factors from text"""
+def parse_model_reply_blocking(reply, messages, check, max_tokens, usage=None, model=MODEL_NAME):
+    """Blocking version of parse_model_reply for the synchronous /upload path"""
+    data, failing, repaired = start_parse(reply, check)
+    if not failing:
+        parse_stats.record('repaired' if repaired else 'clean')
+        return data, []
+    
+    retry_reply = None
+    try:
+        response = llm_client.chat(
+            field_retry_messages(messages, reply, failing),
+            max_tokens=max_tokens,
+            model=model,
+            usage=usage,
+            **json_mode_args(model)
+        )
+        retry_reply = response.choices[0].message.content
+    except Exception as e:
+        print(f"Field re-request failed: {e}")
+    return finish_parse(data, failing, retry_reply, check)
+
+def get_offline_analysis(text, fallback_reason=None):
+    """Score the report locally, in the same shape as the model analysis"""
+    with span('offline_scoring'):
+        analysis = score_report(text, RISK_CATEGORIES)
+        analysis['thinking_traces'] = section_traces(analysis, SECTION_CATEGORIES)
+    analysis['mode'] = 'fast'
+    if fallback_reason:
+        analysis['fallback_reason'] = fallback_reason
+    return analysis
+
+def analyze_risk_factors(text, pipeline='full', usage=None, cascade=None):
+    """Use OpenAI to analyze and extract risk factors from text
+    
+    With a cascade (see new_cascade()), sections are triaged first and the
+    thinking call, on the escalation model, covers only the flagged ones.
+    """
     try:
         # Check if API key is set
-        if not openai.api_key or openai.api_key == "your_openai_api_key_here":
+        if not llm_available():
             return {
                 "error": "OpenAI API key not configured. Please set OPENAI_API_KEY in your .env file.",
                 "risk_factors": [],
@@ -58,9 +495,23 @@ def analyze_risk_factors(text):
                 "thinking_traces": []
             }
         
+        # Triage the sections first, so only the flagged ones are reviewed
+        thinking_model = MODEL_NAME
+        thinking_tokens = 1000
+        cleared_traces = []
+        focus = ""
+        if cascade is not None:
+            triaged = run_async(triage_sections(text, ANALYSIS_SECTIONS, cascade, usage))
+            cleared_traces = [trace for trace in triaged.values() if trace is not None]
+            escalated = [section for section, trace in triaged.items() if trace is None]
+            thinking_model = CASCADE_ESCALATION_MODEL
+            # The escalation budget per flagged section, as for a single section call
+            thinking_tokens = min(CASCADE_ESCALATION_TOKENS * len(escalated), SINGLE_CALL_MAX_TOKENS)
+            focus = f"Only these sections need review: {', '.join(escalated)}."
+        
         # First, get thinking traces
         thinking_prompt = f"""
-        Analyze the following property inspection report step by step. Think through each section carefully:
+        Analyze the following property inspection report step by step. Think through each section carefully. {focus}
 
         Report text:
         {text[:4000]}
@@ -83,71 +534,50 @@ def analyze_risk_factors(text):
         ]
         """
         
-        print("Getting thinking traces...")
-        thinking_response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a professional property inspector. Think through each section methodically and explain your reasoning clearly."},
-                {"role": "user", "content": thinking_prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.3
-        )
-        
-        thinking_text = thinking_response.choices[0].message.content.strip()
-        
-        # Clean up thinking traces
-        if thinking_text.startswith('```json'):
-            thinking_text = thinking_text[7:]
-        if thinking_text.startswith('```'):
-            thinking_text = thinking_text[3:]
-        if thinking_text.endswith('```'):
-            thinking_text = thinking_text[:-3]
-        
-        thinking_text = thinking_text.strip()
-        
-        try:
-            thinking_traces = json.loads(thinking_text)
-        except json.JSONDecodeError:
-            thinking_traces = [{"section": "Analysis", "reasoning": "Unable to parse thinking traces", "evidence": "JSON parsing error"}]
+        if cascade is not None and not escalated:
+            # Triage cleared every section, so there is nothing to think through
+            thinking_traces = cleared_traces
+        else:
+            started = time.perf_counter()
+            thinking_response = llm_client.chat(
+                [
+                    {"role": "system", "content": "You are a professional property inspector. Think through each section methodically and explain your reasoning clearly."},
+                    {"role": "user", "content": thinking_prompt}
+                ],
+                max_tokens=thinking_tokens,
+                model=thinking_model,
+                usage=usage
+            )
+            if cascade is not None:
+                cascade.record('escalation', time.perf_counter() - started)
+            
+            try:
+                with span('json_parse'):
+                    thinking_traces, repaired = extract_json(thinking_response.choices[0].message.content)
+                parse_stats.record('repaired' if repaired else 'clean')
+            except ValueError:
+                parse_stats.record('failed')
+                thinking_traces = [{"section": "Analysis", "reasoning": "Unable to parse thinking traces", "evidence": "JSON parsing error"}]
+            if isinstance(thinking_traces, list):
+                thinking_traces += cleared_traces
         
         # Now get the final analysis
-        analysis_prompt = f"""
-        Based on your analysis of the property inspection report, provide a comprehensive risk assessment.
-        
-        Report text:
-        {text[:4000]}
-        
-        Return the analysis as a JSON object with this structure:
-        {{
-            "risk_factors": [
-                {{
-                    "category": "string",
-                    "severity": "Low/Medium/High/Critical",
-                    "description": "string",
-                    "recommendation": "string",
-                    "cost_impact": "string",
-                    "location": "string"
-                }}
-            ],
-            "overall_risk_score": "Low/Medium/High/Critical",
-            "summary": "string"
-        }}
-        """
-        
-        print(f"Making API call with key: {openai.api_key[:10]}...")
+        if pipeline == 'mapreduce':
+            result = run_async(get_map_reduce_analysis(text, usage=usage))
+            result['thinking_traces'] = thinking_traces
+            return result
         
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a professional property inspector and risk analyst. Provide accurate, detailed analysis of property inspection reports."},
-                {"role": "user", "content": analysis_prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.3
+        analysis_prompt = build_final_analysis_prompt(
+            text,
+            thinking_traces if pipeline == 'traces' and isinstance(thinking_traces, list) else None
         )
         
-        print(f"API Response received: {response}")
+        messages = [
+            {"role": "system", "content": "You are a professional property inspector and risk analyst. Provide accurate, detailed analysis of property inspection reports."},
+            {"role": "user", "content": analysis_prompt}
+        ]
+        with span('final_analysis'):
+            response = llm_client.chat(messages, max_tokens=1500, model=MODEL_NAME, usage=usage, **json_mode_args())
         
         if not response.choices or not response.choices[0].message.content:
             return {
@@ -159,45 +589,32 @@ def analyze_risk_factors(text):
             }
         
         response_text = response.choices[0].message.content.strip()
-        print(f"Response text: {response_text[:200]}...")
-        
-        # Clean up the response text - remove markdown code blocks if present
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]  # Remove ```json
-        if response_text.startswith('```'):
-            response_text = response_text[3:]  # Remove ```
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]  # Remove trailing ```
         
-        response_text = response_text.strip()
-        print(f"Cleaned response text: {response_text[:200]}...")
-        
-        # Try to parse JSON
-        try:
-            result = json.loads(response_text)
+        # Parse the JSON, re-requesting only fields that are missing or malformed
+        result, failing = parse_model_reply_blocking(response_text, messages, invalid_analysis_fields, 1500, usage)
+        if not failing:
             result['thinking_traces'] = thinking_traces
             return result
-        except json.JSONDecodeError as json_error:
-            print(f"JSON parsing error: {json_error}")
-            print(f"Full response: {response_text}")
-            
-            # Fallback: create a basic analysis
-            return {
-                "error": f"Invalid JSON response from API: {json_error}",
-                "risk_factors": [
-                    {
-                        "category": "Analysis Error",
-                        "severity": "Medium",
-                        "description": "Unable to parse AI response. Please check your API key and try again.",
-                        "recommendation": "Verify OpenAI API key and ensure sufficient credits",
-                        "cost_impact": "Unknown",
-                        "location": "N/A"
-                    }
-                ],
-                "overall_risk_score": "Unknown",
-                "summary": "Analysis failed due to API response format issues",
-                "thinking_traces": thinking_traces
-            }
+        
+        print(f"JSON parsing error in fields: {failing}")
+        
+        # Fallback: create a basic analysis
+        return {
+            "error": f"Invalid JSON response from API: missing or invalid {', '.join(failing)}",
+            "risk_factors": [
+                {
+                    "category": "Analysis Error",
+                    "severity": "Medium",
+                    "description": "Unable to parse AI response. Please check your API key and try again.",
+                    "recommendation": "Verify OpenAI API key and ensure sufficient credits",
+                    "cost_impact": "Unknown",
+                    "location": "N/A"
+                }
+            ],
+            "overall_risk_score": "Unknown",
+            "summary": "Analysis failed due to API response format issues",
+            "thinking_traces": thinking_traces
+        }
     
     except openai.error.AuthenticationError:
         return {
@@ -233,6 +650,25 @@ def analyze_risk_factors(text):
             "thinking_traces": []
         }
 
+def is_cacheable(analysis):
+    """Check that an analysis finished without API or parsing failures"""
+    if analysis.get('error') or analysis.get('fallback_reason') or analysis.get('overall_risk_score', 'Unknown') == 'Unknown':
+        return False
+    for trace in analysis.get('thinking_traces', []):
+        if isinstance(trace, dict) and trace.get('evidence') in ("API call failed", "JSON parsing error"):
+            return False
+    if analysis.get('map_reduce', {}).get('failed'):
+        return False
+    return True
+
+def store_analysis(analysis, text, fingerprint=None):
+    """Save a finished analysis to the history store and record its id on it"""
+    try:
+        with span('store_analysis'):
+            analysis['id'] = analysis_store.save(analysis, document_hash(text), fingerprint)
+    except Exception as e:
+        print(f"Could not store analysis: {e}")
+
 def categorize_risks(risk_factors):
     """Categorize risks by severity and type"""
     categories = {
@@ -262,326 +698,1489 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
+    pipeline = request.form.get('pipeline', ANALYSIS_PIPELINE)
+    if pipeline not in ANALYSIS_PIPELINES:
+        return jsonify({'error': f'Unknown pipeline: {pipeline}'}), 400
+    
+    mode = request.form.get('mode', ANALYSIS_MODE)
+    if mode not in ANALYSIS_MODES:
+        return jsonify({'error': f'Unknown mode: {mode}'}), 400
+    
     if file:
-        filename = secure_filename(file.filename)
+        upload, error = ingest_upload(file)
+        if error:
+            return error
+        filename = upload.filename
         
-        # Extract text based on file type
-        if filename.lower().endswith('.pdf'):
-            text = extract_text_from_pdf(file)
-        else:
-            # Assume text file
-            text = file.read().decode('utf-8')
+        # Extract text based on file type; the upload's memory and spool file are freed after
+        page_offsets = None
+        with upload:
+            if filename.lower().endswith('.pdf'):
+                text, page_offsets = extract_pdf_pages(upload.source)
+            else:
+                # Assume text file
+                text = decode_text(upload.source)
         
-        # Analyze the text
-        analysis = analyze_risk_factors(text)
+        # Analyze the text, reusing a previous result for identical documents
+        usage = TokenUsage()
+        cascade = None
+        cache_key = make_cache_key(text, MODEL_NAME, PROMPT_VERSION, cache_variant('upload', pipeline))
+        if mode == 'fast':
+            analysis = get_offline_analysis(text)
+        elif not llm_available():
+            analysis = get_offline_analysis(text, fallback_reason="OpenAI API key not configured")
+        else:
+            analysis = analysis_cache.get(cache_key)
+            if analysis is None:
+                cascade = new_cascade()
+                analysis = analyze_risk_factors(text, pipeline=pipeline, usage=usage, cascade=cascade)
+                if is_cacheable(analysis):
+                    analysis_cache.set(cache_key, analysis)
+                elif analysis.get('error'):
+                    analysis = get_offline_analysis(text, fallback_reason=analysis['error'])
+            else:
+                analysis['cached'] = True
         
         # Add metadata
+        analysis['pipeline'] = pipeline
+        analysis['usage'] = usage.to_dict()
+        if cascade is not None:
+            analysis['cascade'] = cascade.to_dict()
         analysis['filename'] = filename
         analysis['upload_time'] = datetime.now().isoformat()
         analysis['text_length'] = len(text)
+        report_segments(text, page_offsets).annotate(analysis)
+        store_analysis(analysis, text)
         
         return jsonify(analysis)
 
 @app.route('/stream-analysis', methods=['POST'])
 def stream_analysis():
-    """Stream the analysis process in real-time"""
+    """Stream the analysis process in real-time
+    
+    The analysis runs as a background job; this response subscribes to its
+    events. The first event names the job, and every later one carries an
+    SSE id, so a client that loses the connection can resume from
+    GET /jobs/<job_id>/events with Last-Event-ID.
+    """
+    job_id, error = submit_upload_job()
+    if error:
+        return error
+    
+    def generate():
+        yield f"data: {json.dumps({'type': 'job', 'job_id': job_id})}\n\n"
+        yield from job_event_stream(job_id)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue an analysis of an uploaded report and return its job id straight away"""
+    job_id, error = submit_upload_job()
+    if error:
+        return error
+    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report a job's status, with the stored analysis once it has finished"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['result_id']:
+        job['result'] = analysis_store.get(job['result_id'])
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Replay a job's events after Last-Event-ID, then follow it until it ends"""
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an integer'}), 400
+    return Response(stream_with_context(job_event_stream(job_id, after)), mimetype='text/event-stream')
+
+def submit_upload_job():
+    """Validate an upload form and queue its analysis, returning (job_id, None) or (None, error response)"""
     if 'file' not in request.files:
-        return jsonify({'error': 'No file uploaded'}), 400
+        return None, (jsonify({'error': 'No file uploaded'}), 400)
     
     file = request.files['file']
     if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+        return None, (jsonify({'error': 'No file selected'}), 400)
     
-    def generate():
-        try:
-            filename = secure_filename(file.filename)
-            
-            # Send initial status
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Starting analysis...'})}\n\n"
-            
-            # Extract text based on file type
-            if filename.lower().endswith('.pdf'):
-                yield f"data: {json.dumps({'type': 'status', 'message': 'Extracting text from PDF...'})}\n\n"
-                text = extract_text_from_pdf(file)
-            else:
-                yield f"data: {json.dumps({'type': 'status', 'message': 'Reading text file...'})}\n\n"
-                text = file.read().decode('utf-8')
-            
-            yield f"data: {json.dumps({'type': 'status', 'message': f'Document processed. Length: {len(text)} characters'})}\n\n"
-            
-            # Start thinking process
-            yield f"data: {json.dumps({'type': 'thinking_start', 'message': 'Beginning AI analysis...'})}\n\n"
+    pipeline = request.form.get('pipeline', ANALYSIS_PIPELINE)
+    if pipeline not in ANALYSIS_PIPELINES:
+        return None, (jsonify({'error': f'Unknown pipeline: {pipeline}'}), 400)
+    
+    mode = request.form.get('mode', ANALYSIS_MODE)
+    if mode not in ANALYSIS_MODES:
+        return None, (jsonify({'error': f'Unknown mode: {mode}'}), 400)
+    
+    section_calls = request.form.get('section_calls', SECTION_CALLS)
+    if section_calls not in SECTION_CALL_MODES:
+        return None, (jsonify({'error': f'Unknown section_calls: {section_calls}'}), 400)
+    
+    timings = request.form.get('timings', 'on' if ANALYSIS_TIMINGS else 'off').lower() in ('1', 'true', 'on')
+    revision_of = request.form.get('revision_of') or None
+    upload, error = ingest_upload(file)
+    if error:
+        return None, error
+    job_id = queue_upload_job(upload, pipeline=pipeline, mode=mode, section_calls=section_calls, revision_of=revision_of, timings=timings)
+    return job_id, None
+
+def queue_upload_job(upload, **options):
+    """Queue the analysis of an ingested upload with the given upload_events options, releasing it, and return the job id"""
+    with upload:
+        # A spooled upload's file is handed to the job rather than copied into the queue
+        return job_queue.submit(upload.filename, payload=upload.data, upload_path=upload.keep(), **options)
+
+def job_event_stream(job_id, after=0):
+    """Yield a job's stored events after sequence number `after` as SSE messages until it ends"""
+    last_sent = time.monotonic()
+    ended = False
+    with streams_in_flight.track():
+        while True:
+            # Read the status first: once a job is done all its events are stored
+            job = job_queue.get(job_id)
+            for seq, event in job_queue.events(job_id, after):
+                after = seq
+                ended = ended or event['type'] in ('complete', 'error')
+                last_sent = time.monotonic()
+                yield f"id: {seq}\ndata: {json.dumps(event)}\n\n"
             
-            # Get thinking traces with streaming
-            thinking_traces = []
-            sections = [
-                "Structural Assessment",
-                "Electrical Systems", 
-                "Plumbing Systems",
-                "HVAC Systems",
-                "Safety Concerns",
-                "Environmental Issues",
-                "Accessibility",
-                "Property Condition"
-            ]
+            if job['status'] in ('finished', 'failed'):
+                if not ended:
+                    # The worker died without recording why
+                    yield f"data: {json.dumps({'type': 'error', 'message': job['error'] or 'Analysis did not finish'})}\n\n"
+                return
             
-            for i, section in enumerate(sections):
-                # Send thinking start for this section
-                yield f"data: {json.dumps({'type': 'thinking_section', 'section': section, 'message': f'Analyzing {section}...'})}\n\n"
-                
-                # Analyze this section
-                thinking_prompt = f"""
-                Analyze the {section} section of this property inspection report:
-                
-                Report text:
-                {text[:3000]}
-                
-                Focus specifically on {section}. Think through:
-                1. What issues did you identify in this section?
-                2. Why are they concerning?
-                3. What evidence supports your assessment?
-                4. How severe do you think each issue is and why?
-                
-                Return your analysis as JSON:
-                {{
-                    "section": "{section}",
-                    "issues_found": ["issue1", "issue2"],
-                    "reasoning": "detailed reasoning",
-                    "evidence": "specific evidence from text",
-                    "severity_assessment": "severity level and explanation"
-                }}
-                """
-                
-                try:
-                    response = openai.ChatCompletion.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {"role": "system", "content": "You are a professional property inspector. Analyze each section methodically."},
-                            {"role": "user", "content": thinking_prompt}
-                        ],
-                        max_tokens=500,
-                        temperature=0.3
-                    )
-                    
-                    response_text = response.choices[0].message.content.strip()
-                    
-                    # Clean up response
-                    if response_text.startswith('```json'):
-                        response_text = response_text[7:]
-                    if response_text.startswith('```'):
-                        response_text = response_text[3:]
-                    if response_text.endswith('```'):
-                        response_text = response_text[:-3]
-                    
-                    response_text = response_text.strip()
-                    
-                    try:
-                        trace = json.loads(response_text)
-                        thinking_traces.append(trace)
-                        
-                        # Send thinking result for this section
-                        yield f"data: {json.dumps({'type': 'thinking_result', 'section': section, 'trace': trace})}\n\n"
-                        
-                    except json.JSONDecodeError:
-                        trace = {
-                            "section": section,
-                            "issues_found": ["Analysis error"],
-                            "reasoning": "Unable to parse AI response",
-                            "evidence": "JSON parsing error",
-                            "severity_assessment": "Unknown"
-                        }
-                        thinking_traces.append(trace)
-                        yield f"data: {json.dumps({'type': 'thinking_result', 'section': section, 'trace': trace})}\n\n"
-                        
-                except Exception as e:
-                    trace = {
-                        "section": section,
-                        "issues_found": ["API error"],
-                        "reasoning": f"Error: {str(e)}",
-                        "evidence": "API call failed",
-                        "severity_assessment": "Unknown"
-                    }
-                    thinking_traces.append(trace)
-                    yield f"data: {json.dumps({'type': 'thinking_result', 'section': section, 'trace': trace})}\n\n"
+            if time.monotonic() - last_sent >= JOB_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+            job_queue.wait(1.0)
+
+async def run_job(job):
+    """Run a queued analysis on the background event loop, storing each event in the job log"""
+    seq = job['next_seq']
+    pending = []
+    flushed = time.monotonic()
+    result_id = None
+    error = "Analysis finished without a result"
+    
+    if job['attempt'] > 1:
+        pending.append((seq, {'type': 'status', 'message': 'Restarting analysis after an interruption...'}))
+        seq += 1
+    
+    # The lease is renewed on a timer, since a single model call can outlast
+    # it; once another worker owns the job, this run is cancelled
+    heartbeat = asyncio.create_task(keep_job_lease(job, asyncio.current_task()))
+    try:
+        source = job['upload_path'] or job['payload']
+        async with aclosing(upload_events(source, job['filename'], **job['options'])) as events:
+            async for event in events:
+                pending.append((seq, event))
+                seq += 1
+                if event['type'] == 'complete':
+                    result_id, error = event['data'].get('id'), None
+                elif event['type'] == 'error':
+                    error = event['message']
                 
-                # Small delay to make streaming visible
-                time.sleep(0.5)
-            
-            # Get final analysis
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Generating final risk assessment...'})}\n\n"
-            
-            analysis = get_final_analysis(text)
-            analysis['thinking_traces'] = thinking_traces
-            analysis['filename'] = filename
-            analysis['upload_time'] = datetime.now().isoformat()
-            analysis['text_length'] = len(text)
-            
-            yield f"data: {json.dumps({'type': 'complete', 'data': analysis})}\n\n"
+                # Model tokens are stored in batches rather than one write each
+                if event['type'] != 'thinking_delta' or time.monotonic() - flushed >= JOB_EVENT_FLUSH_SECONDS:
+                    await asyncio.to_thread(job_queue.append_events, job['id'], job['worker'], pending)
+                    pending = []
+                    flushed = time.monotonic()
+        
+        if pending:
+            await asyncio.to_thread(job_queue.append_events, job['id'], job['worker'], pending)
+        await asyncio.to_thread(job_queue.finish, job['id'], job['worker'], result_id=result_id, error=error)
+    finally:
+        heartbeat.cancel()
+
+async def keep_job_lease(job, task):
+    """Renew a running job's lease every third of JOB_LEASE_SECONDS, cancelling task if the job was taken over"""
+    while True:
+        await asyncio.sleep(job_queue.lease_seconds / 3)
+        try:
+            owned = await asyncio.to_thread(job_queue.heartbeat, job['id'], job['worker'])
+        except sqlite3.Error as e:
+            print(f"Could not renew the lease of job {job['id']}: {e}")
+            continue
+        if not owned:
+            print(f"Job {job['id']} was taken over by another worker; stopping this run")
+            task.cancel()
+            return
+
+def start_job(job):
+    """Start a claimed job as a task on the background event loop, returning its future"""
+    return asyncio.run_coroutine_threadsafe(run_job(job), background_loop())
+
+job_workers = JobWorkers(job_queue, start_job, concurrency=JOB_CONCURRENCY, retention_seconds=JOB_RETENTION_DAYS * 24 * 3600)
+
+@app.before_request
+def start_job_workers():
+    # Started on the first request rather than at import, so scripts that
+    # import the app (batch, benchmarks) do not start workers
+    job_workers.start()
+
+# Synchronous callers (request threads, job workers, batch and warm-up
+# scripts) run the async pipeline on one long-lived event loop, so the model
+# client's aiohttp session and its keep-alive connections outlive a single
+# analysis. The session is closed when the process exits.
+_background_loop = None
+_background_thread = None
+_background_loop_lock = threading.Lock()
+
+def background_loop():
+    """Return the event loop that runs coroutines for synchronous code, started on a daemon thread on first use"""
+    global _background_loop, _background_thread
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            # Blocking steps (PDF pages, job log writes, waiting on a shared
+            # analysis) run on the loop's executor, sized so running jobs do
+            # not queue behind each other
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=JOB_CONCURRENCY + 16, thread_name_prefix='analysis'))
+            _background_thread = threading.Thread(target=loop.run_forever, name='analysis-loop', daemon=True)
+            _background_thread.start()
+            _background_loop = loop
+            atexit.register(stop_background_loop)
+        return _background_loop
+
+def stop_background_loop():
+    """Close the model client session opened on the background loop and stop the loop"""
+    loop = _background_loop
+    if loop is None or not loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(llm_client.close_async_session(), loop).result(timeout=5)
+    except Exception as e:
+        print(f"Could not close the model client session: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+
+def run_on_loop(call, context=None):
+    """Run a coroutine on the background loop, in a copy of context, and wait for its result"""
+    loop = background_loop()
+    if threading.current_thread() is _background_thread:
+        raise RuntimeError("Cannot wait for the background event loop from its own thread; await the coroutine instead")
+    context = context or contextvars.copy_context()
+    # The task is created from a callback scheduled in this context, so it runs in a copy of it
+    return context.run(asyncio.run_coroutine_threadsafe, call, loop).result()
+
+def iterate_async(events):
+    """Drive an async generator from synchronous code on the background event loop
+    
+    Each step runs as its own task, so context variables the generator sets
+    (such as the timings collector) are carried from one step to the next,
+    as they would be if a single task iterated it.
+    """
+    context = contextvars.copy_context()
+    try:
+        while True:
+            try:
+                event, context = run_on_loop(next_with_context(events), context)
+            except StopAsyncIteration:
+                return
+            yield event
+    finally:
+        # Runs the generator's cleanup if the consumer stopped early
+        run_on_loop(events.aclose(), context)
+
+async def next_with_context(events):
+    """Return the generator's next item and the context it left behind"""
+    event = await events.__anext__()
+    return event, contextvars.copy_context()
+
+def run_async(call):
+    """Run a coroutine to completion from synchronous code on the background event loop"""
+    return run_on_loop(call)
+
+async def iterate_in_thread(iterator):
+    """Advance a blocking iterator on a worker thread so the event loop stays free"""
+    loop = asyncio.get_running_loop()
+    done = object()
+    while True:
+        item = await loop.run_in_executor(None, next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+async def upload_events(file_data, filename, pipeline=ANALYSIS_PIPELINE, mode=ANALYSIS_MODE, timings=ANALYSIS_TIMINGS,
+                        section_calls=SECTION_CALLS, revision_of=None):
+    """Extract text from an uploaded report and analyze it, yielding stream events
+    
+    file_data is the upload's bytes or the path of its spool file. With
+    timings, the complete event's analysis includes the time spent in each stage.
+    """
+    timings = new_timings() if timings else None
+    use_timings(timings)
+    analyses_in_flight.inc()
+    try:
+        # Send initial status
+        yield {'type': 'status', 'message': 'Starting analysis...'}
+        
+        # Extract text based on file type
+        extraction = None
+        if filename.lower().endswith('.pdf'):
+            yield {'type': 'status', 'message': 'Extracting text from PDF...'}
             
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            # Report progress as pages arrive from the extraction workers
+            pages = []
+            started = time.perf_counter()
+            async for page in iterate_in_thread(iter_pdf_pages(file_data, max_chars=PDF_MAX_CHARS, workers=PDF_EXTRACT_WORKERS)):
+                pages.append(page)
+                if page.number % 10 == 0:
+                    yield {'type': 'status', 'message': f'Extracted page {page.number} of {page.total}...'}
+            text = join_pages(pages)[0]
+            extraction = extraction_summary(pages, time.perf_counter() - started)
+            record_span('pdf_extraction', time.perf_counter() - started, timings)
+        else:
+            yield {'type': 'status', 'message': 'Reading text file...'}
+            text = decode_text(file_data)
+        
+        yield {'type': 'status', 'message': f'Document processed. Length: {len(text)} characters'}
+        
+        async with aclosing(shared_analysis_events(
+            text, filename, pipeline=pipeline, mode=mode, extraction=extraction, timings=timings, section_calls=section_calls,
+            revision_of=revision_of
+        )) as events:
+            async for event in events:
+                yield event
     
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    except Exception as e:
+        yield {'type': 'error', 'message': str(e)}
+    finally:
+        analyses_in_flight.dec()
 
-def get_thinking_traces_streaming(text, yield_func):
-    """Get thinking traces with real-time streaming"""
-    sections = [
-        "Structural Assessment",
-        "Electrical Systems", 
-        "Plumbing Systems",
-        "HVAC Systems",
-        "Safety Concerns",
-        "Environmental Issues",
-        "Accessibility",
-        "Property Condition"
-    ]
+async def shared_analysis_events(text, filename, pipeline=ANALYSIS_PIPELINE, mode=ANALYSIS_MODE, extraction=None, timings=None,
+                                 section_calls=SECTION_CALLS, revision_of=None):
+    """Yield analysis_events for text, or follow an identical analysis already running
     
-    thinking_traces = []
+    Concurrent uploads of the same document with the same options share the
+    first one's model calls: later ones replay its events so far, then
+    receive the rest as they arrive, and get their own copy of the result.
+    Revisions only share with revisions of the same previous analysis.
+    """
+    options = dict(pipeline=pipeline, mode=mode, extraction=extraction, timings=timings, section_calls=section_calls, revision_of=revision_of)
+    if mode != 'llm':
+        async with aclosing(analysis_events(text, filename, **options)) as events:
+            async for event in events:
+                yield event
+        return
     
-    for i, section in enumerate(sections):
-        # Send thinking start for this section
-        yield_func(f"data: {json.dumps({'type': 'thinking_section', 'section': section, 'message': f'Analyzing {section}...'})}\n\n")
+    variant = cache_variant('stream', pipeline, section_calls)
+    if revision_of:
+        variant += f':revision:{revision_of}'
+    key = make_cache_key(text, MODEL_NAME, PROMPT_VERSION, variant)
+    flight, leader = single_flight.join(key)
+    if leader:
+        try:
+            async with aclosing(analysis_events(text, filename, **options)) as events:
+                async for event in events:
+                    flight.publish(event)
+                    yield event
+        finally:
+            single_flight.finish(key, flight)
+        return
+    
+    yield {'type': 'status', 'message': 'Joining an identical analysis already in progress...'}
+    started = time.perf_counter()
+    async for event in iterate_in_thread(flight.follow()):
+        if event['type'] != 'complete':
+            yield event
+            continue
         
-        # Simulate thinking process for this section
-        thinking_prompt = f"""
-        Analyze the {section} section of this property inspection report:
+        shared = event['data']
+        single_flight.record_saved(shared.get('usage', {}))
+        analysis = {name: value for name, value in shared.items() if name not in ('id', 'extraction', 'timings')}
+        analysis['shared_from'] = shared.get('id')
+        analysis['filename'] = filename
+        analysis['upload_time'] = datetime.now().isoformat()
+        analysis['usage'] = TokenUsage().to_dict()
+        if extraction:
+            analysis['extraction'] = extraction
+        store_analysis(analysis, text)
+        attach_timings(analysis, timings, started)
         
-        Report text:
-        {text[:3000]}
+        yield {'type': 'complete', 'data': analysis}
+        return
+    
+    # The analysis being followed stopped without a result, so run it here
+    yield {'type': 'status', 'message': 'Shared analysis stopped, analyzing again...'}
+    async with aclosing(analysis_events(text, filename, **options)) as events:
+        async for event in events:
+            yield event
+
+async def analysis_events(text, filename, pipeline=ANALYSIS_PIPELINE, mode=ANALYSIS_MODE, extraction=None, stream_tokens=True, timings=None,
+                          section_calls=SECTION_CALLS, revision_of=None):
+    """Run the section-by-section analysis of extracted text, yielding stream events
+    
+    Events are the dicts sent to the browser as SSE data: thinking_start,
+    thinking_section, thinking_result, status and finally complete. With
+    stream_tokens, model output is also passed through as thinking_delta
+    events and each final risk factor as a risk_factor event once it parses.
+    extraction, if given, is attached to the result as PDF page timings.
+    timings, the collector passed to metrics.use_timings() for this request,
+    is attached to the result as a summary of its spans. With ANALYSIS_CASCADE
+    on, the result also reports the calls and latency of each cascade tier.
+    section_calls chooses between one model call per section and a single
+    call for all of them (see SECTION_CALLS). revision_of, "auto" or the id
+    of a previous analysis, reuses the unchanged sections of an earlier
+    version of the report; re-analyzed traces and risk factors are marked
+    "revised". Each section is analyzed from its own segment of the report
+    (see segmenter.py), and the result's traces and risk factors carry the
+    character offsets, and pages if extraction has them, of their evidence.
+    """
+    usage = TokenUsage()
+    cascade = new_cascade()
+    started = time.perf_counter()
+    segments = report_segments(text, extraction.get('page_offsets') if extraction else None)
+    
+    # Score locally when asked to, or when the model cannot be reached
+    if mode == 'fast' or not llm_available():
+        if mode == 'fast':
+            analysis = get_offline_analysis(text)
+        else:
+            yield {'type': 'status', 'message': 'OpenAI API key not configured, using offline scoring'}
+            analysis = get_offline_analysis(text, fallback_reason="OpenAI API key not configured")
+        segments.annotate(analysis)
         
-        Focus specifically on {section}. Think through:
-        1. What issues did you identify in this section?
-        2. Why are they concerning?
-        3. What evidence supports your assessment?
-        4. How severe do you think each issue is and why?
+        yield {'type': 'thinking_start', 'message': 'Scoring report offline...'}
+        for trace in analysis['thinking_traces']:
+            yield {'type': 'thinking_section', 'section': trace['section'], 'message': f"Analyzing {trace['section']}..."}
+            yield {'type': 'thinking_result', 'section': trace['section'], 'trace': trace}
         
-        Return your analysis as JSON:
-        {{
-            "section": "{section}",
-            "issues_found": ["issue1", "issue2"],
-            "reasoning": "detailed reasoning",
-            "evidence": "specific evidence from text",
-            "severity_assessment": "severity level and explanation"
-        }}
-        """
+        analysis['filename'] = filename
+        analysis['upload_time'] = datetime.now().isoformat()
+        analysis['text_length'] = len(text)
+        analysis['usage'] = usage.to_dict()
+        if extraction:
+            analysis['extraction'] = extraction
+        store_analysis(analysis, text)
+        attach_timings(analysis, timings, started)
+        
+        yield {'type': 'complete', 'data': analysis}
+        return
+    
+    # Replay a previous analysis of the same document straight away
+    cache_key = make_cache_key(text, MODEL_NAME, PROMPT_VERSION, cache_variant('stream', pipeline, section_calls))
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        yield {'type': 'status', 'message': 'Using cached analysis of this document'}
+        yield {'type': 'thinking_start', 'message': 'Replaying cached analysis...'}
         
+        analysis = cached['analysis']
+        segments.annotate(analysis, cached['sections'])
+        for section, trace in zip(cached['sections'], analysis['thinking_traces']):
+            yield {'type': 'thinking_section', 'section': section, 'message': f'Analyzing {section}...'}
+            yield {'type': 'thinking_result', 'section': section, 'trace': trace}
+        
+        analysis['filename'] = filename
+        analysis['upload_time'] = datetime.now().isoformat()
+        analysis['text_length'] = len(text)
+        analysis['cached'] = True
+        analysis['pipeline'] = pipeline
+        analysis['section_calls'] = section_calls
+        analysis['usage'] = usage.to_dict()
+        if extraction:
+            analysis['extraction'] = extraction
+        store_analysis(analysis, text, report_fingerprint(text, segments))
+        attach_timings(analysis, timings, started)
+        
+        yield {'type': 'complete', 'data': analysis}
+        return
+    
+    # Compare a revised report with its previous version, so only the changed sections are analyzed
+    fingerprint = report_fingerprint(text, segments)
+    sections = ANALYSIS_SECTIONS
+    previous = None
+    if revision_of:
+        previous = find_previous_analysis(fingerprint, filename, revision_of)
+        if previous is None:
+            yield {'type': 'status', 'message': 'No previous version of this report found, analyzing it in full'}
+        else:
+            sections = changed_sections(fingerprint, previous['fingerprint'], previous['analysis']['thinking_traces'])
+            yield {
+                'type': 'status',
+                'message': f"Revising analysis {previous['analysis']['id']}: {len(sections)} of {len(ANALYSIS_SECTIONS)} sections changed"
+            }
+    
+    # Start thinking process
+    yield {'type': 'thinking_start', 'message': 'Beginning AI analysis...'}
+    
+    limit = asyncio.Semaphore(ANALYSIS_CONCURRENCY)
+    
+    # Model tokens and parsed risk factors are put on this queue by the
+    # running calls and passed through as they arrive
+    streamed = asyncio.Queue()
+    on_event = streamed.put_nowait if stream_tokens else None
+    
+    # In the full pipeline the final assessment does not depend on the
+    # section traces, so it is started first and runs alongside them
+    final_task = None
+    if pipeline == 'full' and previous is None:
+        final_task = asyncio.ensure_future(run_limited(limit, get_final_analysis(text, usage=usage, on_event=on_event)))
+    elif pipeline == 'mapreduce' and previous is None:
+        final_task = asyncio.ensure_future(get_map_reduce_analysis(text, usage=usage, limit=limit, on_event=on_event))
+    
+    # Unchanged sections of a revised report keep their previous traces
+    traces_by_section = {}
+    if previous is not None:
+        previous_traces = dict(zip(previous['fingerprint']['sections'], previous['analysis']['thinking_traces']))
+        traces_by_section = {section: previous_traces[section] for section in ANALYSIS_SECTIONS if section not in sections}
+    reused = dict(traces_by_section)
+    run_sections = run_single_section_call if section_calls == 'single' else run_section_analyses
+    
+    async def collect_sections():
+        # Send each section result as soon as it finishes
+        async for section, trace in run_sections(text, sections, usage, limit, on_event, cascade, segments):
+            if previous is not None:
+                trace = {**trace, 'revised': True}
+            traces_by_section[section] = trace
+            streamed.put_nowait({'type': 'thinking_result', 'section': section, 'trace': trace})
+    
+    sections_task = asyncio.ensure_future(collect_sections())
+    try:
+        for section in ANALYSIS_SECTIONS:
+            yield {'type': 'thinking_section', 'section': section, 'message': f'Analyzing {section}...'}
+        for section, trace in reused.items():
+            yield {'type': 'thinking_result', 'section': section, 'trace': trace}
+
+        async with aclosing(drain_events(streamed, sections_task)) as events:
+            async for event in events:
+                yield event
+        await sections_task
+        
+        # Get final analysis
+        yield {'type': 'status', 'message': 'Generating final risk assessment...'}
+        
+        thinking_traces = [traces_by_section[section] for section in ANALYSIS_SECTIONS]
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a professional property inspector. Analyze each section methodically."},
-                    {"role": "user", "content": thinking_prompt}
-                ],
-                max_tokens=500,
-                temperature=0.3
-            )
-            
-            response_text = response.choices[0].message.content.strip()
-            
-            # Clean up response
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.startswith('```'):
-                response_text = response_text[3:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            response_text = response_text.strip()
-            
-            try:
-                trace = json.loads(response_text)
-                thinking_traces.append(trace)
-                
-                # Send thinking result for this section
-                yield_func(f"data: {json.dumps({'type': 'thinking_result', 'section': section, 'trace': trace})}\n\n")
-                
-            except json.JSONDecodeError:
-                trace = {
-                    "section": section,
-                    "issues_found": ["Analysis error"],
-                    "reasoning": "Unable to parse AI response",
-                    "evidence": "JSON parsing error",
-                    "severity_assessment": "Unknown"
-                }
-                thinking_traces.append(trace)
-                yield_func(f"data: {json.dumps({'type': 'thinking_result', 'section': section, 'trace': trace})}\n\n")
-                
+            if previous is not None:
+                final_task = asyncio.ensure_future(get_revised_analysis(text, previous['analysis'], sections, traces_by_section, usage, on_event, segments))
+            elif final_task is None:
+                final_task = asyncio.ensure_future(get_final_analysis(text, thinking_traces=thinking_traces, usage=usage, on_event=on_event))
+            async with aclosing(drain_events(streamed, final_task)) as events:
+                async for event in events:
+                    yield event
+            analysis = await final_task
         except Exception as e:
-            trace = {
+            # Fall back to local scoring rather than failing the whole analysis
+            yield {'type': 'status', 'message': 'Model unavailable, using offline scoring'}
+            analysis = get_offline_analysis(text, fallback_reason=str(e))
+            offline_traces = {trace['section']: trace for trace in analysis['thinking_traces']}
+            thinking_traces = [
+                offline_traces.get(section, trace) if trace.get('evidence') == "API call failed" else trace
+                for section, trace in zip(ANALYSIS_SECTIONS, thinking_traces)
+            ]
+    finally:
+        # Drop pending calls if the client went away mid-stream
+        pending = [task for task in (sections_task, final_task) if task is not None and not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    analysis['thinking_traces'] = thinking_traces
+    segments.annotate(analysis, ANALYSIS_SECTIONS)
+    # A revision depends on its previous version, so it is not the result for this text alone
+    if is_cacheable(analysis) and previous is None:
+        analysis_cache.set(cache_key, {'sections': ANALYSIS_SECTIONS, 'analysis': analysis})
+    
+    analysis['filename'] = filename
+    analysis['upload_time'] = datetime.now().isoformat()
+    analysis['text_length'] = len(text)
+    analysis['pipeline'] = pipeline
+    analysis['section_calls'] = section_calls
+    analysis['usage'] = usage.to_dict()
+    if cascade is not None:
+        analysis['cascade'] = cascade.to_dict()
+    if previous is not None:
+        analysis['revision'] = {
+            "previous_id": previous['analysis']['id'],
+            "matched_by": previous['matched_by'],
+            "similarity": round(previous['similarity'], 3),
+            "changed_sections": sections,
+            "reused_sections": [section for section in ANALYSIS_SECTIONS if section not in sections],
+            "reused_risk_factors": sum(1 for risk in analysis['risk_factors'] if isinstance(risk, dict) and not risk.get('revised'))
+        }
+    if extraction:
+        analysis['extraction'] = extraction
+    # Only sound analyses can be the previous version of a later revision
+    store_analysis(analysis, text, fingerprint if is_cacheable(analysis) else None)
+    attach_timings(analysis, timings, started)
+    
+    yield {'type': 'complete', 'data': analysis}
+
+def run_analysis(text, filename, pipeline=ANALYSIS_PIPELINE, mode=ANALYSIS_MODE, section_calls=SECTION_CALLS):
+    """Run the analysis pipeline to completion and return the final analysis"""
+    for event in iterate_async(analysis_events(text, filename, pipeline=pipeline, mode=mode, stream_tokens=False, section_calls=section_calls)):
+        if event['type'] == 'complete':
+            return event['data']
+    raise RuntimeError("Analysis finished without a result")
+
+def attach_timings(analysis, timings, started):
+    """Record the whole analysis as a span and attach the collected timings, if any, to it"""
+    record_span('analysis', time.perf_counter() - started, timings)
+    if timings is not None:
+        analysis['timings'] = timing_summary(timings)
+
+def report_segments(text, page_offsets=None):
+    """Split a report into the analysis sections by its headings (see segmenter.py)"""
+    return ReportSegments(text, SECTION_CATEGORIES, RISK_CATEGORIES, page_offsets)
+
+def report_fingerprint(text, segments=None):
+    """Fingerprint a report's passages and section excerpts, for finding it later as a previous version"""
+    segments = segments or report_segments(text)
+    max_chars = SECTION_TOKEN_BUDGET * 4
+    excerpts = {section: segments.excerpt(section, max_chars) for section in ANALYSIS_SECTIONS}
+    return make_fingerprint(text, segments.index.spans, excerpts)
+
+def find_previous_analysis(fingerprint, filename, revision_of):
+    """Find the previous version of a report, by analysis id or "auto" matching, or return None
+    
+    Returns a dict with the previous analysis, its fingerprint, how it was
+    matched and the share of passages the two versions have in common.
+    """
+    if revision_of == 'auto':
+        candidates = analysis_store.fingerprints(limit=REVISION_CANDIDATES)
+        match = find_previous(fingerprint, filename, candidates, REVISION_MIN_SIMILARITY)
+        if match is None:
+            return None
+        analysis_id, matched_by, score = match
+    else:
+        candidates = analysis_store.fingerprints(analysis_id=revision_of)
+        if not candidates:
+            return None
+        analysis_id, matched_by, score = revision_of, 'id', similarity(fingerprint, candidates[0][2])
+    
+    analysis = analysis_store.get(analysis_id)
+    if analysis is None:
+        return None
+    previous_fingerprint = next(other for candidate_id, _, other in candidates if candidate_id == analysis_id)
+    return {"analysis": analysis, "fingerprint": previous_fingerprint, "matched_by": matched_by, "similarity": score}
+
+async def get_revised_analysis(text, previous, sections, traces_by_section, usage=None, on_event=None, segments=None):
+    """Reassess only the changed sections of a revised report and merge the result into the previous analysis"""
+    if not sections:
+        return {name: previous[name] for name in ('risk_factors', 'overall_risk_score', 'summary')}
+    
+    revised = await get_final_analysis(text, [traces_by_section[section] for section in sections], usage, on_event)
+    if revised.get('overall_risk_score') == 'Unknown':
+        # A failed reassessment is reported as such rather than hidden by the previous result
+        return revised
+    segments = segments or report_segments(text)
+    return merge_revision(previous, revised, set(sections), segments.section_of)
+
+async def run_limited(limit, call):
+    """Await a model call once a slot in the semaphore is free"""
+    async with limit:
+        return await call
+
+async def drain_events(queue, task):
+    """Yield events from queue until task has finished and the queue is empty"""
+    while True:
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+        if getter.done():
+            yield getter.result()
+            continue
+        getter.cancel()
+        while not queue.empty():
+            yield queue.get_nowait()
+        return
+
+async def get_reply_text(messages, max_tokens, usage=None, on_delta=None, model=MODEL_NAME, **kwargs):
+    """Return the model's reply, passing each streamed piece to on_delta if given"""
+    if on_delta is None:
+        response = await llm_client.achat(messages, max_tokens=max_tokens, model=model, usage=usage, **kwargs)
+        return response.choices[0].message.content
+    
+    parts = []
+    async for delta in llm_client.achat_stream(messages, max_tokens=max_tokens, model=model, usage=usage, **kwargs):
+        parts.append(delta)
+        on_delta(delta)
+    return "".join(parts)
+
+async def analyze_section(excerpt, section, usage=None, on_event=None, model=MODEL_NAME, max_tokens=SECTION_MAX_TOKENS):
+    """Get the thinking trace for a single report section from its relevant passages
+    
+    If on_event is given, the model's output is streamed to it as thinking_delta events.
+    """
+    if not excerpt.strip():
+        # Nothing in the report mentions this area, so skip the model call
+        return {
+            "section": section,
+            "issues_found": [],
+            "reasoning": f"No passages in the report mention {section.lower()} topics",
+            "evidence": "",
+            "severity_assessment": "None identified"
+        }
+    
+    thinking_prompt = f"""
+    Analyze the {section} section of this property inspection report:
+    
+    Relevant report passages:
+    {excerpt}
+    
+    Focus specifically on {section}. Think through:
+    1. What issues did you identify in this section?
+    2. Why are they concerning?
+    3. What evidence supports your assessment?
+    4. How severe do you think each issue is and why?
+    
+    Return your analysis as JSON:
+    {{
+        "section": "{section}",
+        "issues_found": ["issue1", "issue2"],
+        "reasoning": "detailed reasoning",
+        "evidence": "specific evidence from text",
+        "severity_assessment": "severity level and explanation"
+    }}
+    """
+    system_prompt = "You are a professional property inspector. Analyze each section methodically."
+    
+    # A trace depends only on the exact prompt sent, so rewording one section's
+    # prompt or adding a section leaves the other cached traces valid. The
+    # prompt holds the excerpt itself, so a different SECTION_TOKEN_BUDGET
+    # that changes the excerpt changes the key
+    cache_key = hash_parts('section', section, model, str(max_tokens), system_prompt, thinking_prompt)
+    cached = section_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    on_delta = None
+    if on_event:
+        def on_delta(delta):
+            on_event({'type': 'thinking_delta', 'section': section, 'delta': delta})
+    
+    def check(trace):
+        # The section name is known, so it is filled in rather than re-requested
+        trace.setdefault("section", section)
+        return invalid_fields(trace, SECTION_TRACE_FIELDS)
+    
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": thinking_prompt}
+    ]
+    try:
+        with span('section_call'):
+            response_text = await get_reply_text(messages, max_tokens, usage, on_delta, model, **json_mode_args(model))
+        trace, failing = await parse_model_reply(response_text, messages, check, max_tokens, usage, model)
+        if failing:
+            return {
                 "section": section,
-                "issues_found": ["API error"],
-                "reasoning": f"Error: {str(e)}",
-                "evidence": "API call failed",
+                "issues_found": ["Analysis error"],
+                "reasoning": "Unable to parse AI response",
+                "evidence": "JSON parsing error",
                 "severity_assessment": "Unknown"
             }
-            thinking_traces.append(trace)
-            yield_func(f"data: {json.dumps({'type': 'thinking_result', 'section': section, 'trace': trace})}\n\n")
         
-        # Small delay to make streaming visible
-        time.sleep(0.5)
+        section_cache.set(cache_key, trace)
+        return trace
     
-    return thinking_traces
+    except Exception as e:
+        return {
+            "section": section,
+            "issues_found": ["API error"],
+            "reasoning": f"Error: {str(e)}",
+            "evidence": "API call failed",
+            "severity_assessment": "Unknown"
+        }
 
-def get_final_analysis(text):
-    """Get the final risk assessment"""
-    analysis_prompt = f"""
-    Based on your analysis of the property inspection report, provide a comprehensive risk assessment.
+def new_cascade():
+    """Return the stats of a new cascaded analysis, or None when ANALYSIS_CASCADE is off"""
+    if ANALYSIS_CASCADE not in CASCADE_TRIAGES[1:]:
+        return None
+    return CascadeStats(ANALYSIS_CASCADE, CASCADE_TRIAGE_MODEL, CASCADE_ESCALATION_MODEL)
+
+def cache_variant(kind, pipeline, section_calls='separate'):
+    """The analysis cache variant for an endpoint and options, including every setting that shapes its prompts
     
-    Report text:
-    {text[:4000]}
+    Section excerpts are cut to SECTION_TOKEN_BUDGET, the map-reduce
+    pipeline sends MAP_REDUCE_MAX_CHUNKS chunks of MAP_REDUCE_CHUNK_TOKENS,
+    and the cascade picks models and reply budgets, so an analysis cached
+    under other values of these is not reused.
+    """
+    variant = f'{kind}:{pipeline}:sections:{SECTION_TOKEN_BUDGET}'
+    if pipeline == 'mapreduce':
+        variant += f':chunks:{MAP_REDUCE_MAX_CHUNKS}x{MAP_REDUCE_CHUNK_TOKENS}'
+    if section_calls != 'separate':
+        variant += f':{section_calls}'
+    if ANALYSIS_CASCADE not in CASCADE_TRIAGES[1:]:
+        return variant
+    triage = CASCADE_TRIAGE_MODEL if ANALYSIS_CASCADE == 'model' else CASCADE_MIN_SEVERITY
+    return f'{variant}:cascade:{ANALYSIS_CASCADE}:{triage}:{CASCADE_ESCALATION_MODEL}:{CASCADE_ESCALATION_TOKENS}'
+
+async def triage_section(excerpt, section, cascade, usage=None):
+    """Decide whether a section needs the full model call: returns None to escalate it, or its cleared trace"""
+    started = time.perf_counter()
+    if cascade.triage == 'keywords':
+        escalate = bool(keyword_flags(excerpt, cascade_pattern))
+        cascade.record('triage', time.perf_counter() - started)
+        reason = f"No {CASCADE_MIN_SEVERITY.lower()} or higher severity indicators in the {section.lower()} passages"
+    else:
+        messages = [
+            {"role": "system", "content": TRIAGE_SYSTEM_PROMPT},
+            {"role": "user", "content": build_triage_prompt(excerpt, section)}
+        ]
+        try:
+            with span('triage_call'):
+                reply = await get_reply_text(messages, CASCADE_TRIAGE_TOKENS, usage, model=CASCADE_TRIAGE_MODEL)
+            escalate = parse_triage_reply(reply)
+        except Exception as e:
+            # Escalate rather than risk missing an issue
+            print(f"Triage of {section} failed: {e}")
+            escalate = True
+        cascade.record('triage', time.perf_counter() - started)
+        reason = f"Triage by {CASCADE_TRIAGE_MODEL} found no issues in the {section.lower()} passages"
     
-    Return the analysis as a JSON object with this structure:
+    cascade.decide(section, 'escalated' if escalate else 'cleared')
+    return None if escalate else cleared_trace(section, reason)
+
+async def triage_sections(text, sections, cascade, usage=None, segments=None):
+    """Triage sections concurrently, returning {section: cleared trace, or None if escalated}"""
+    segments = segments or report_segments(text)
+    max_chars = SECTION_TOKEN_BUDGET * 4
+    limit = asyncio.Semaphore(ANALYSIS_CONCURRENCY)
+    
+    async def triage(section):
+        excerpt = segments.excerpt(section, max_chars)
+        if not excerpt.strip():
+            cascade.decide(section, 'no_passages')
+            return await analyze_section(excerpt, section)
+        return await run_limited(limit, triage_section(excerpt, section, cascade, usage))
+    
+    traces = await asyncio.gather(*(triage(section) for section in sections))
+    return dict(zip(sections, traces))
+
+async def run_section_analyses(text, sections, usage=None, limit=None, on_event=None, cascade=None, segments=None):
+    """Analyze sections concurrently, yielding (section, trace) in completion order
+    
+    With a cascade, each section is triaged first and only flagged sections
+    get the full section call, on the escalation model and token budget.
+    """
+    # Segment the whole report once so every section sees only its own
+    # segment, or its keyword passages wherever they appear if it has no heading
+    segments = segments or report_segments(text)
+    max_chars = SECTION_TOKEN_BUDGET * 4
+    limit = limit or asyncio.Semaphore(ANALYSIS_CONCURRENCY)
+    
+    async def analyze(section):
+        excerpt = segments.excerpt(section, max_chars)
+        if cascade is None:
+            return section, await run_limited(limit, analyze_section(excerpt, section, usage, on_event))
+        if not excerpt.strip():
+            cascade.decide(section, 'no_passages')
+            return section, await analyze_section(excerpt, section)
+        
+        trace = await run_limited(limit, triage_section(excerpt, section, cascade, usage))
+        if trace is not None:
+            return section, trace
+        async with limit:
+            started = time.perf_counter()
+            trace = await analyze_section(excerpt, section, usage, on_event, CASCADE_ESCALATION_MODEL, CASCADE_ESCALATION_TOKENS)
+            cascade.record('escalation', time.perf_counter() - started)
+        return section, trace
+    
+    tasks = [asyncio.ensure_future(analyze(section)) for section in sections]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def build_sections_prompt(excerpt, sections):
+    """Build the prompt asking for the thinking traces of several report sections in one reply"""
+    return f"""
+    Analyze these sections of a property inspection report: {', '.join(sections)}.
+    
+    Relevant report passages:
+    {excerpt}
+    
+    For each section, think through:
+    1. What issues did you identify in this section?
+    2. Why are they concerning?
+    3. What evidence supports your assessment?
+    4. How severe do you think each issue is and why?
+    
+    Return your analysis as JSON with one entry per section, in the order listed:
     {{
-        "risk_factors": [
+        "sections": [
             {{
+                "section": "section name",
+                "issues_found": ["issue1", "issue2"],
+                "reasoning": "detailed reasoning",
+                "evidence": "specific evidence from text",
+                "severity_assessment": "severity level and explanation"
+            }}
+        ]
+    }}
+    """
+
+async def run_single_section_call(text, sections, usage=None, limit=None, on_event=None, cascade=None, segments=None):
+    """Analyze sections in one model call, yielding (section, trace) as each element of the reply's array parses
+    
+    Sections without passages, and with a cascade those that triage clears,
+    are yielded first without being sent. A reply missing some sections is
+    re-requested once; sections still missing are reported as errors. The
+    model output is not passed to on_event, as one reply covers many sections.
+    """
+    limit = limit or asyncio.Semaphore(ANALYSIS_CONCURRENCY)
+    segments = segments or report_segments(text)
+    max_chars = SECTION_TOKEN_BUDGET * 4
+    model, section_tokens = MODEL_NAME, SECTION_MAX_TOKENS
+    
+    if cascade is not None:
+        triaged = await triage_sections(text, sections, cascade, usage, segments)
+        model, section_tokens = CASCADE_ESCALATION_MODEL, CASCADE_ESCALATION_TOKENS
+    else:
+        triaged = {
+            section: None if segments.section_spans(section, max_chars) else await analyze_section("", section)
+            for section in sections
+        }
+    for section, trace in triaged.items():
+        if trace is not None:
+            yield section, trace
+    
+    requested = [section for section, trace in triaged.items() if trace is None]
+    if not requested:
+        return
+    
+    excerpt = segments.combined_excerpt(requested, max_chars)
+    messages = [
+        {"role": "system", "content": "You are a professional property inspector. Analyze each section methodically."},
+        {"role": "user", "content": build_sections_prompt(excerpt, requested)}
+    ]
+    max_tokens = min(section_tokens * len(requested), SINGLE_CALL_MAX_TOKENS)
+    by_name = {section.lower(): section for section in requested}
+    parser = ArrayItemParser('sections')
+    finished = asyncio.Queue()
+    sent = set()
+    
+    def take(trace):
+        # Pass on each complete, valid trace for a requested section once
+        section = by_name.get(str(trace.get('section', '')).strip().lower()) if isinstance(trace, dict) else None
+        if section is None or section in sent or invalid_fields(trace, SECTION_TRACE_FIELDS):
+            return
+        sent.add(section)
+        finished.put_nowait((section, trace))
+    
+    def on_delta(delta):
+        for trace in parser.feed(delta):
+            take(trace)
+    
+    def check(data):
+        traces = data.get('sections')
+        if not isinstance(traces, list):
+            return ['sections']
+        for trace in traces:
+            take(trace)
+        return [] if len(sent) == len(requested) else ['sections']
+    
+    async def call():
+        async with limit:
+            started = time.perf_counter()
+            with span('sections_call'):
+                reply = await get_reply_text(messages, max_tokens, usage, on_delta, model, **json_mode_args(model))
+            await parse_model_reply(reply, messages, check, max_tokens, usage, model)
+            if cascade is not None:
+                cascade.record('escalation', time.perf_counter() - started)
+    
+    task = asyncio.ensure_future(call())
+    try:
+        async with aclosing(drain_events(finished, task)) as results:
+            async for result in results:
+                yield result
+        error = task.exception()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    
+    for section in requested:
+        if section in sent:
+            continue
+        if error is not None:
+            yield section, {
+                "section": section,
+                "issues_found": ["API error"],
+                "reasoning": f"Error: {str(error)}",
+                "evidence": "API call failed",
+                "severity_assessment": "Unknown"
+            }
+        else:
+            yield section, {
+                "section": section,
+                "issues_found": ["Analysis error"],
+                "reasoning": "Unable to parse AI response",
+                "evidence": "JSON parsing error",
+                "severity_assessment": "Unknown"
+            }
+
+def extract_evidence_snippets(thinking_traces, text, window=200, max_chars=2000):
+    """Pull the report passages cited as evidence in the section traces"""
+    lowered = text.lower()
+    spans = []
+    for trace in thinking_traces:
+        evidence = str(trace.get('evidence') or '').strip().strip('"').lower()
+        if len(evidence) < 10:
+            continue
+        position = lowered.find(evidence[:80])
+        if position == -1:
+            continue
+        spans.append((max(0, position - window), min(len(text), position + len(evidence) + window)))
+    
+    # Merge overlapping spans so shared context is only sent once
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    
+    snippets = []
+    remaining = max_chars
+    for start, end in merged:
+        if remaining <= 0:
+            break
+        snippet = text[start:end][:remaining].strip()
+        snippets.append(snippet)
+        remaining -= len(snippet)
+    return snippets
+
+# Reply structure requested by every final-assessment prompt
+RISK_ASSESSMENT_FORMAT = """
+    Return the analysis as a JSON object with this structure:
+    {
+        "risk_factors": [
+            {
                 "category": "string",
                 "severity": "Low/Medium/High/Critical",
                 "description": "string",
                 "recommendation": "string",
                 "cost_impact": "string",
                 "location": "string"
-            }}
+            }
         ],
         "overall_risk_score": "Low/Medium/High/Critical",
         "summary": "string"
-    }}
+    }
     """
+
+def build_final_analysis_prompt(text, thinking_traces=None):
+    """Build the final assessment prompt from the report text or the section traces"""
+    if thinking_traces is None:
+        return f"""
+    Based on your analysis of the property inspection report, provide a comprehensive risk assessment.
     
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a professional property inspector and risk analyst. Provide accurate, detailed analysis of property inspection reports."},
-            {"role": "user", "content": analysis_prompt}
-        ],
-        max_tokens=1500,
-        temperature=0.3
-    )
+    Report text:
+    {text[:4000]}
+    {RISK_ASSESSMENT_FORMAT}"""
     
-    response_text = response.choices[0].message.content.strip()
+    findings = [
+        {
+            "section": trace.get('section'),
+            "issues_found": trace.get('issues_found', []),
+            "evidence": trace.get('evidence', ''),
+            "severity_assessment": trace.get('severity_assessment', '')
+        }
+        for trace in thinking_traces if isinstance(trace, dict)
+    ]
+    excerpts = "\n---\n".join(extract_evidence_snippets(findings, text)) or "None"
     
-    # Clean up response
-    if response_text.startswith('```json'):
-        response_text = response_text[7:]
-    if response_text.startswith('```'):
-        response_text = response_text[3:]
-    if response_text.endswith('```'):
-        response_text = response_text[:-3]
+    return f"""
+    Based on the following section-by-section findings from a property inspection report, provide a comprehensive risk assessment.
     
-    response_text = response_text.strip()
+    Section findings:
+    {json.dumps(findings, separators=(',', ':'))}
     
-    try:
-        return json.loads(response_text)
-    except json.JSONDecodeError:
+    Report excerpts cited as evidence:
+    {excerpts}
+    {RISK_ASSESSMENT_FORMAT}"""
+
+async def get_final_analysis(text, thinking_traces=None, usage=None, on_event=None):
+    """Get the final risk assessment
+    
+    If on_event is given, each risk factor is sent to it as a risk_factor
+    event as soon as its JSON object has streamed in.
+    """
+    analysis_prompt = build_final_analysis_prompt(text, thinking_traces)
+    
+    on_delta = None
+    if on_event:
+        parser = ArrayItemParser('risk_factors')
+        
+        def on_delta(delta):
+            for risk in parser.feed(delta):
+                on_event({'type': 'risk_factor', 'risk': risk})
+    
+    messages = [
+        {"role": "system", "content": "You are a professional property inspector and risk analyst. Provide accurate, detailed analysis of property inspection reports."},
+        {"role": "user", "content": analysis_prompt}
+    ]
+    with span('final_analysis'):
+        response_text = await get_reply_text(messages, max_tokens=1500, usage=usage, on_delta=on_delta, **json_mode_args())
+    
+    analysis, failing = await parse_model_reply(response_text, messages, invalid_analysis_fields, 1500, usage)
+    if failing:
         return {
             "risk_factors": [],
             "overall_risk_score": "Unknown",
             "summary": "Analysis failed"
         }
+    return analysis
+
+def build_chunk_analysis_prompt(chunk, part, parts):
+    """Build the risk assessment prompt for one chunk of a long report"""
+    return f"""
+    The following is part {part} of {parts} of a property inspection report. Identify the risk factors it describes.
+    Only report issues stated in this part; other parts are assessed separately. Begin each location with "Part {part}".
+    
+    Report text:
+    {chunk}
+    {RISK_ASSESSMENT_FORMAT}"""
+
+async def analyze_chunk(chunk, part, parts, usage=None):
+    """Get the risk assessment for one chunk of a long report, or None if the reply cannot be parsed"""
+    messages = [
+        {"role": "system", "content": "You are a professional property inspector and risk analyst. Provide accurate, detailed analysis of property inspection reports."},
+        {"role": "user", "content": build_chunk_analysis_prompt(chunk, part, parts)}
+    ]
+    with span('chunk_call'):
+        response_text = await get_reply_text(messages, max_tokens=800, usage=usage, **json_mode_args())
+    analysis, failing = await parse_model_reply(response_text, messages, invalid_analysis_fields, 800, usage)
+    return None if failing else analysis
+
+async def get_map_reduce_analysis(text, usage=None, limit=None, on_event=None):
+    """Assess the whole report chunk by chunk in parallel and merge the results
+    
+    The reducer in map_reduce.py is deterministic, so the merged risk factors
+    do not depend on which chunk finished first. If on_event is given, each
+    risk factor not already seen in another chunk is sent to it as a
+    risk_factor event when its chunk finishes. Raises if no chunk succeeds.
+    """
+    chunks = split_chunks(text, MAP_REDUCE_CHUNK_TOKENS * 4)
+    selected = select_chunks(text, chunks, RISK_CATEGORIES, MAP_REDUCE_MAX_CHUNKS)
+    limit = limit or asyncio.Semaphore(ANALYSIS_CONCURRENCY)
+    sent = []
+    
+    async def analyze(part, start, end):
+        analysis = await run_limited(limit, analyze_chunk(text[start:end], part, len(selected), usage))
+        if on_event and analysis:
+            for risk in analysis['risk_factors']:
+                if not any(is_duplicate(previous, risk) for previous in sent):
+                    sent.append(risk)
+                    on_event({'type': 'risk_factor', 'risk': risk})
+        return analysis
+    
+    with span('map_reduce'):
+        results = await asyncio.gather(
+            *(analyze(part, start, end) for part, (start, end) in enumerate(selected, 1)),
+            return_exceptions=True
+        )
+    analyses = [result for result in results if isinstance(result, dict)]
+    if selected and not analyses:
+        errors = [result for result in results if isinstance(result, Exception)]
+        raise errors[0] if errors else RuntimeError("No part of the report could be analyzed")
+    
+    analysis = reduce_analyses(analyses)
+    analysis['map_reduce'] = {
+        "chunks": len(chunks),
+        "analyzed": len(analyses),
+        "failed": len(selected) - len(analyses),
+        "characters_covered": sum(end - start for (start, end), result in zip(selected, results) if isinstance(result, dict)),
+        "text_length": len(text)
+    }
+    return analysis
+
+@app.route('/batch', methods=['POST'])
+def create_batch():
+    """Start a batch analysis of several uploaded reports or a zip of reports"""
+    files = request.files.getlist('files') or request.files.getlist('file')
+    if not files:
+        return jsonify({'error': 'No files uploaded'}), 400
+    
+    pipeline = request.form.get('pipeline', ANALYSIS_PIPELINE)
+    if pipeline not in ANALYSIS_PIPELINES:
+        return jsonify({'error': f'Unknown pipeline: {pipeline}'}), 400
+    
+    mode = request.form.get('mode', ANALYSIS_MODE)
+    if mode not in ANALYSIS_MODES:
+        return jsonify({'error': f'Unknown mode: {mode}'}), 400
+    
+    section_calls = request.form.get('section_calls', SECTION_CALLS)
+    if section_calls not in SECTION_CALL_MODES:
+        return jsonify({'error': f'Unknown section_calls: {section_calls}'}), 400
+    
+    reports, error = ingest_batch_reports(files)
+    if error:
+        return error
+    if not reports:
+        return jsonify({'error': 'No PDF or text reports found in upload'}), 400
+    
+    job_id = uuid.uuid4().hex
+    os.makedirs(BATCH_OUTPUT_DIR, exist_ok=True)
+    runner = BatchRunner(
+        lambda text, filename: run_analysis(text, filename, pipeline=pipeline, mode=mode, section_calls=section_calls),
+        os.path.join(BATCH_OUTPUT_DIR, f"{job_id}.jsonl"),
+        concurrency=BATCH_CONCURRENCY
+    )
+    batch_jobs[job_id] = runner
+    threading.Thread(target=run_batch, args=(runner, reports), daemon=True).start()
+    
+    return jsonify({'job_id': job_id, 'total': len(reports)}), 202
+
+def ingest_batch_reports(files):
+    """Spool batch uploads and the reports in zip files, returning ([(name, path or bytes)], None) or (None, error response)
+    
+    Each report goes through the same size limits and in-flight budget as
+    a single upload, one at a time. Its spool file is then handed to the
+    batch, which deletes it when it finishes (see run_batch()).
+    """
+    reports = []
+    try:
+        for file in files:
+            filename = secure_filename(file.filename)
+            if filename.lower().endswith('.zip'):
+                with spool_request_upload(file.stream, filename) as upload:
+                    with zipfile.ZipFile(upload.path or io.BytesIO(upload.data)) as archive:
+                        for entry in archive.infolist():
+                            if entry.filename.lower().endswith(REPORT_EXTENSIONS) and not entry.is_dir():
+                                with archive.open(entry) as stream:
+                                    report = spool_request_upload(stream, os.path.basename(entry.filename), entry.file_size)
+                                reports.append(keep_report(entry.filename, report))
+            elif filename.lower().endswith(REPORT_EXTENSIONS):
+                reports.append(keep_report(filename, spool_request_upload(file.stream, filename)))
+    except UploadTooLarge as e:
+        remove_batch_reports(reports)
+        return None, (jsonify({'error': str(e)}), 413)
+    except IngestBusy as e:
+        remove_batch_reports(reports)
+        return None, (jsonify({'error': str(e)}), 503)
+    except BaseException:
+        remove_batch_reports(reports)
+        raise
+    return reports, None
+
+def keep_report(name, upload):
+    """Take a spooled upload's bytes or file for a batch, releasing its in-flight reservation"""
+    with upload:
+        path = upload.keep()
+        return name, path if path is not None else upload.data
+
+def remove_batch_reports(reports):
+    """Delete the spool files of batch reports"""
+    for _, source in reports:
+        if isinstance(source, str) and os.path.exists(source):
+            os.unlink(source)
+
+def run_batch(runner, reports):
+    """Run a batch job, then delete the spool files of its reports"""
+    try:
+        runner.run(reports)
+    finally:
+        remove_batch_reports(reports)
+
+@app.route('/batch/<job_id>')
+def batch_status(job_id):
+    """Report progress of a batch job"""
+    runner = batch_jobs.get(job_id)
+    if runner is None:
+        return jsonify({'error': 'Unknown batch job'}), 404
+    return jsonify({'job_id': job_id, **runner.progress()})
+
+@app.route('/batch/<job_id>/results')
+def batch_results(job_id):
+    """Download the JSONL results written so far for a batch job"""
+    runner = batch_jobs.get(job_id)
+    if runner is None or not os.path.exists(runner.output_path):
+        return jsonify({'error': 'No results for this batch job'}), 404
+    return send_file(runner.output_path, mimetype='application/x-ndjson', as_attachment=True, download_name=f"batch_{job_id}.jsonl")
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Report analysis and section cache hit/miss counters and size"""
+    return jsonify({
+        "analyses": analysis_cache.stats(),
+        "section_traces": section_cache.stats()
+    })
+
+@app.route('/dedupe/stats')
+def dedupe_stats():
+    """Report how many concurrent duplicate analyses were shared and the model work saved"""
+    return jsonify(single_flight.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Expose latency histograms, token counts, queue depth and cache counters for Prometheus"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def collect_metrics():
+    """Copy counts kept by the job queue, caches, parser and single-flight registry into metrics"""
+    counts = job_queue.counts()
+    for status in ('queued', 'running', 'finished', 'failed'):
+        job_queue_jobs.set(counts.get(status, 0), status=status)
+    
+    parsed = parse_stats.to_dict()
+    for outcome in ('clean', 'repaired', 'field_retries', 'failed'):
+        replies_parsed.set(parsed[outcome], outcome=outcome)
+    
+    for name, cache in (('analyses', analysis_cache), ('section_traces', section_cache)):
+        stats = cache.stats()
+        cache_lookups.set(stats['hits'], cache=name, result='hit')
+        cache_lookups.set(stats['misses'], cache=name, result='miss')
+        cache_size.set(stats['size_bytes'], cache=name)
+    
+    ingest_bytes.set(ingest_budget.in_use)
+    
+    shared = single_flight.stats()
+    shared_analyses.set(shared['leaders'], role='leader')
+    shared_analyses.set(shared['followers'], role='follower')
+    model_calls_saved.set(shared['model_calls_saved'])
+
+registry.add_collector(collect_metrics)
+
+@app.route('/parse/stats')
+def parse_stats_report():
+    """Report how model replies were parsed, including the parse-failure rate"""
+    return jsonify(parse_stats.to_dict())
+
+@app.route('/analyses')
+def list_analyses():
+    """Page through stored analyses, newest first, filtered by query parameters"""
+    try:
+        limit = min(int(request.args.get('limit', ANALYSES_PAGE_SIZE)), ANALYSES_MAX_PAGE_SIZE)
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    if limit < 1 or offset < 0:
+        return jsonify({'error': 'limit must be positive and offset not negative'}), 400
+    
+    try:
+        start, end = parse_time_range()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    filters = {name: request.args[name] for name in ANALYSIS_FILTERS + RISK_FILTERS if name in request.args}
+    return jsonify(analysis_store.list(filters, limit=limit, offset=offset, start=start, end=end))
+
+@app.route('/analyses/export/<table>')
+def export_analyses(table):
+    """Download one flat table of stored analyses as streamed CSV, Parquet or Arrow IPC"""
+    if table not in EXPORT_TABLES:
+        return jsonify({'error': f'Unknown table: {table}'}), 404
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown format: {export_format}'}), 400
+    
+    try:
+        start, end = parse_time_range()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    filters = {name: request.args[name] for name in ANALYSIS_FILTERS + RISK_FILTERS if name in request.args}
+    frames = analysis_store.iter_frames(table, filters, start=start, end=end)
+    download_name = f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    
+    if export_format == 'csv':
+        def generate():
+            for number, frame in enumerate(frames):
+                yield frame.to_csv(index=False, header=number == 0)
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={download_name}.csv'}
+        )
+    
+    output = io.BytesIO()
+    try:
+        write_columnar(frames, export_format, output)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 400
+    output.seek(0)
+    
+    return send_file(
+        output,
+        mimetype='application/vnd.apache.parquet' if export_format == 'parquet' else 'application/vnd.apache.arrow.file',
+        as_attachment=True,
+        download_name=f"{download_name}.{export_format}"
+    )
+
+@app.route('/analyses/aggregate')
+def aggregate_analyses():
+    """Count stored risk factors by severity per category, day or month"""
+    group_by = request.args.get('group_by', 'category')
+    if group_by not in AGGREGATE_GROUPS:
+        return jsonify({'error': f'Unknown group_by: {group_by}'}), 400
+    
+    try:
+        start, end = parse_time_range()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    counts = analysis_store.severity_counts(group_by, start=start, end=end)
+    severities = [level for level in SEVERITY_LEVELS if level in counts.columns]
+    severities += sorted(column for column in counts.columns if column not in severities)
+    counts = counts.reindex(columns=severities)
+    counts['total'] = counts.sum(axis=1)
+    
+    # Largest categories first; dates in order
+    counts = counts.sort_values('total', ascending=False, kind='stable') if group_by == 'category' else counts.sort_index()
+    groups = counts.rename_axis(group_by).reset_index()
+    
+    return jsonify({
+        'group_by': group_by,
+        'start': request.args.get('start'),
+        'end': request.args.get('end'),
+        'severities': severities,
+        'groups': json.loads(groups.to_json(orient='records')),
+        'total': int(counts['total'].sum())
+    })
+
+def parse_time_range():
+    """Read the start and end query parameters (ISO dates or datetimes, UTC if no zone) as Unix times"""
+    bounds = []
+    for name in ('start', 'end'):
+        value = request.args.get(name)
+        if not value:
+            bounds.append(None)
+            continue
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f'{name} must be an ISO date or datetime')
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        bounds.append(moment.timestamp())
+    return tuple(bounds)
+
+@app.route('/analyses/<analysis_id>')
+def get_analysis(analysis_id):
+    analysis = analysis_store.get(analysis_id)
+    if analysis is None:
+        return jsonify({'error': 'Unknown analysis'}), 404
+    return jsonify(analysis)
+
+@app.route('/analyses/<analysis_id>/export')
+def export_stored_analysis(analysis_id):
+    """Download a stored analysis as CSV without sending it back from the browser"""
+    analysis = analysis_store.get(analysis_id)
+    if analysis is None:
+        return jsonify({'error': 'Unknown analysis'}), 404
+    return send_csv_report(analysis)
 
 @app.route('/export', methods=['POST'])
 def export_report():
-    data = request.json
-    
+    return send_csv_report(request.json)
+
+def send_csv_report(data):
+    """Build the CSV report for an analysis and send it as a download"""
     # Create CSV report
     output = io.StringIO()
     writer = csv.writer(output)
@@ -0,0 +1,161 @@
+"""
+ASGI entry point for serving many concurrent analysis streams from one process.
+
+/stream-analysis and /jobs/<job_id>/events run directly on the event loop,
+so an open stream costs a coroutine rather than a server thread while it
+waits for the analysis. As on the Flask server, each upload is analyzed as
+a background job on the job workers, so a client that disconnects can
+resume from its last event id. Every other route is served by the Flask app
+through a WSGI adapter. The SSE events are the same as from the Flask server.
+
+Usage:
+    pip install starlette uvicorn python-multipart
+    uvicorn asgi:app --port 5001
+"""
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.utils import secure_filename
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+import app as app_module
+import llm_client
+from ingestion import IngestBusy, UploadTooLarge
+
+# How often an open stream checks its job for new events
+JOB_POLL_SECONDS = 0.25
+
+
+async def stream_analysis(request):
+    """Stream the analysis process in real-time"""
+    # The Content-Length is checked and reserved from the in-flight budget
+    # before the form is parsed, since parsing already spools the file; a
+    # worker thread waits for room so the event loop does not
+    try:
+        content_length = int(request.headers.get('content-length') or 0) or None
+    except ValueError:
+        return JSONResponse({'error': 'Invalid Content-Length'}, status_code=400)
+    try:
+        reserved = await asyncio.to_thread(app_module.reserve_request_body, content_length)
+    except UploadTooLarge as e:
+        return JSONResponse({'error': str(e)}, status_code=413)
+    except IngestBusy as e:
+        return JSONResponse({'error': str(e)}, status_code=503)
+
+    try:
+        form = await request.form()
+        file = form.get('file')
+        if file is None or isinstance(file, str):
+            return JSONResponse({'error': 'No file uploaded'}, status_code=400)
+        if file.filename == '':
+            return JSONResponse({'error': 'No file selected'}, status_code=400)
+
+        pipeline = form.get('pipeline', app_module.ANALYSIS_PIPELINE)
+        if pipeline not in app_module.ANALYSIS_PIPELINES:
+            return JSONResponse({'error': f'Unknown pipeline: {pipeline}'}, status_code=400)
+
+        mode = form.get('mode', app_module.ANALYSIS_MODE)
+        if mode not in app_module.ANALYSIS_MODES:
+            return JSONResponse({'error': f'Unknown mode: {mode}'}, status_code=400)
+
+        section_calls = form.get('section_calls', app_module.SECTION_CALLS)
+        if section_calls not in app_module.SECTION_CALL_MODES:
+            return JSONResponse({'error': f'Unknown section_calls: {section_calls}'}, status_code=400)
+
+        default_timings = 'on' if app_module.ANALYSIS_TIMINGS else 'off'
+        timings = form.get('timings', default_timings).lower() in ('1', 'true', 'on')
+        revision_of = form.get('revision_of') or None
+
+        # The upload takes over the reservation, releasing it even if spooling fails
+        reserved, upload_reserved = None, reserved
+        try:
+            upload = await asyncio.to_thread(
+                app_module.spool_request_upload, file.file, secure_filename(file.filename), content_length, upload_reserved
+            )
+        except UploadTooLarge as e:
+            return JSONResponse({'error': str(e)}, status_code=413)
+        except IngestBusy as e:
+            return JSONResponse({'error': str(e)}, status_code=503)
+    finally:
+        if reserved:
+            app_module.ingest_budget.release(reserved)
+
+    job_id = await asyncio.to_thread(
+        app_module.queue_upload_job, upload, pipeline=pipeline, mode=mode, section_calls=section_calls,
+        revision_of=revision_of, timings=timings
+    )
+
+    async def generate():
+        yield f"data: {json.dumps({'type': 'job', 'job_id': job_id})}\n\n"
+        async for message in job_event_stream(job_id):
+            yield message
+
+    return StreamingResponse(generate(), media_type='text/event-stream')
+
+
+async def job_events(request):
+    """Replay a job's events after Last-Event-ID, then follow it until it ends"""
+    job_id = request.path_params['job_id']
+    if await asyncio.to_thread(app_module.job_queue.get, job_id) is None:
+        return JSONResponse({'error': 'Unknown job'}, status_code=404)
+    try:
+        after = int(request.headers.get('last-event-id') or request.query_params.get('last_event_id') or 0)
+    except ValueError:
+        return JSONResponse({'error': 'Last-Event-ID must be an integer'}, status_code=400)
+    return StreamingResponse(job_event_stream(job_id, after), media_type='text/event-stream')
+
+
+async def job_event_stream(job_id, after=0):
+    """Yield a job's stored events after `after` as SSE messages until it ends, like app.job_event_stream
+
+    The job log is polled from the event loop rather than waited on, so an
+    open stream does not hold a thread.
+    """
+    job_queue = app_module.job_queue
+    last_sent = time.monotonic()
+    ended = False
+    with app_module.streams_in_flight.track():
+        while True:
+            # Read the status first: once a job is done all its events are stored
+            job = await asyncio.to_thread(job_queue.get, job_id)
+            for seq, event in await asyncio.to_thread(job_queue.events, job_id, after):
+                after = seq
+                ended = ended or event['type'] in ('complete', 'error')
+                last_sent = time.monotonic()
+                yield f"id: {seq}\ndata: {json.dumps(event)}\n\n"
+
+            if job['status'] in ('finished', 'failed'):
+                if not ended:
+                    # The worker died without recording why
+                    yield f"data: {json.dumps({'type': 'error', 'message': job['error'] or 'Analysis did not finish'})}\n\n"
+                return
+
+            if time.monotonic() - last_sent >= app_module.JOB_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Routes served here never reach Flask's before_request hook, which starts the workers there
+    app_module.job_workers.start()
+    yield
+    # Close the pooled model connections opened on this event loop
+    await llm_client.close_async_session()
+
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/stream-analysis', stream_analysis, methods=['POST']),
+    Route('/jobs/{job_id}/events', job_events),
+    Mount('/', app=WSGIMiddleware(app_module.app))
+])
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Batch analysis of many inspection reports.
+
+Text extraction runs on a process pool and the model pipeline runs on a
+bounded thread pool, with results appended to a JSONL file as each report
+finishes. Reports already present in the output file are skipped, so an
+interrupted run can be resumed by running the same command again.
+
+Usage:
+    python -m batch reports/ --output results.jsonl [--concurrency 4] [--extract-workers 4]
+"""
+import argparse
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from ingestion import decode_text
+from pdf_extraction import iter_pdf_pages
+
+REPORT_EXTENSIONS = ('.pdf', '.txt')
+
+
+def extract_report_text(name, source):
+    """Extract text from a report given as a file path or raw bytes (runs in a worker process)"""
+    if not name.lower().endswith('.pdf'):
+        # Same encoding detection as uploads (UTF-16, Windows-1252, ...)
+        return decode_text(source)
+
+    handle = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else open(source, 'rb')
+    with handle:
+        # Already running in a worker process, so pages are read serially here
+        return "\n".join(page.text for page in iter_pdf_pages(handle, workers=1)) + "\n"
+
+
+def list_reports(folder):
+    """Return (name, path) pairs for every report file under folder"""
+    reports = []
+    for root, _, files in os.walk(folder):
+        for filename in sorted(files):
+            if filename.lower().endswith(REPORT_EXTENSIONS):
+                path = os.path.join(root, filename)
+                reports.append((os.path.relpath(path, folder), path))
+    return sorted(reports)
+
+
+def load_checkpoint(output_path):
+    """Return the names of reports already written successfully to output_path"""
+    done = set()
+    if not output_path or not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            if not record.get('batch_error'):
+                done.add(record.get('source'))
+    return done
+
+
+class BatchRunner:
+    """Run the analysis pipeline over many reports, streaming results to JSONL"""
+
+    def __init__(self, analyze, output_path, concurrency=4, extract_workers=None):
+        self.analyze = analyze
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.extract_workers = extract_workers
+        self.status = 'pending'
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def progress(self):
+        with self._lock:
+            elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+            return {
+                "status": self.status,
+                "total": self.total,
+                "completed": self.completed,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "elapsed_seconds": round(elapsed, 3)
+            }
+
+    def _write(self, record):
+        with self._lock:
+            with open(self.output_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+            if record.get('batch_error'):
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def _record_analysis(self, name, future):
+        try:
+            record = future.result()
+        except Exception as e:
+            record = {"batch_error": str(e)}
+        record['source'] = name
+        self._write(record)
+
+    def run(self, reports):
+        """Analyze (name, path-or-bytes) reports, skipping ones already in the output file"""
+        reports = list(reports)
+        done = load_checkpoint(self.output_path)
+        pending = [(name, source) for name, source in reports if name not in done]
+
+        with self._lock:
+            self.status = 'running'
+            self.total = len(reports)
+            self.skipped = len(reports) - len(pending)
+            self.started_at = time.time()
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.extract_workers) as extract_pool, \
+                    ThreadPoolExecutor(max_workers=self.concurrency) as analyze_pool:
+                extractions = {
+                    extract_pool.submit(extract_report_text, name, source): name
+                    for name, source in pending
+                }
+
+                # Start each analysis as soon as its text is ready
+                for future in as_completed(extractions):
+                    name = extractions[future]
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        self._write({"source": name, "batch_error": f"Text extraction failed: {e}"})
+                        continue
+                    analysis = analyze_pool.submit(self.analyze, text, os.path.basename(name))
+                    analysis.add_done_callback(lambda f, name=name: self._record_analysis(name, f))
+        except Exception:
+            with self._lock:
+                self.status = 'failed'
+                self.finished_at = time.time()
+            raise
+
+        with self._lock:
+            self.status = 'finished'
+            self.finished_at = time.time()
+        return self.progress()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a folder of inspection reports")
+    parser.add_argument('folder', help='Folder containing PDF or text inspection reports')
+    parser.add_argument('--output', default='batch_results.jsonl', help='JSONL file for results (also the resume checkpoint)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Reports analyzed at the same time')
+    parser.add_argument('--extract-workers', type=int, default=None, help='Processes used for text extraction')
+    parser.add_argument('--pipeline', default=None, help='Final assessment pipeline (full, traces or mapreduce)')
+    parser.add_argument('--mode', default=None, help='Analysis mode (llm or fast)')
+    parser.add_argument('--section-calls', default=None, help='One model call per section (separate) or for all sections (single)')
+    args = parser.parse_args()
+
+    import app as app_module
+
+    pipeline = args.pipeline or app_module.ANALYSIS_PIPELINE
+    mode = args.mode or app_module.ANALYSIS_MODE
+    section_calls = args.section_calls or app_module.SECTION_CALLS
+
+    def analyze(text, filename):
+        return app_module.run_analysis(text, filename, pipeline=pipeline, mode=mode, section_calls=section_calls)
+
+    runner = BatchRunner(analyze, args.output, concurrency=args.concurrency, extract_workers=args.extract_workers)
+    reports = list_reports(args.folder)
+
+    # Report progress while the batch runs
+    worker = threading.Thread(target=runner.run, args=(reports,))
+    worker.start()
+    while worker.is_alive():
+        worker.join(timeout=2)
+        progress = runner.progress()
+        print(
+            f"{progress['completed'] + progress['failed'] + progress['skipped']}/{progress['total']} done "
+            f"({progress['failed']} failed, {progress['skipped']} skipped) in {progress['elapsed_seconds']:.0f}s"
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Compare coverage and latency of the full and mapreduce pipelines by report length.
+
+Synthetic reports have numbered findings planted evenly through filler
+text. The stand-in model reports every finding it can see in its prompt as
+a risk factor, so coverage is the share of planted findings that reach the
+final result: the full pipeline only sees the first 4000 characters, while
+mapreduce sees every chunk up to MAP_REDUCE_MAX_CHUNKS.
+
+Usage:
+    python benchmarks/bench_map_reduce.py [--lengths 4000,16000,64000,256000] [--model-latency 0.2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Keep benchmark results out of the real analysis cache, and time the
+# pipelines rather than the rate limiter
+BENCH_DIR = tempfile.mkdtemp()
+os.environ['ANALYSIS_CACHE_PATH'] = os.path.join(BENCH_DIR, 'bench_cache.db')
+os.environ['ANALYSIS_DB_PATH'] = os.path.join(BENCH_DIR, 'bench_analyses.db')
+os.environ['JOB_DB_PATH'] = os.path.join(BENCH_DIR, 'bench_jobs.db')
+os.environ.setdefault('LLM_TOKENS_PER_MINUTE', '0')
+
+import openai
+
+import app as app_module
+from fake_openai import _Response
+
+FINDING_PATTERN = re.compile(r'Finding (\d+):')
+FILLER = "The inspector reviewed this area and recorded its general condition for the file.\n"
+
+
+def make_report(length, findings_every=2000):
+    """Build a report of about length characters with a finding every findings_every characters"""
+    lines = []
+    size = 0
+    number = 0
+    while size < length:
+        if size >= number * findings_every:
+            number += 1
+            line = f"Finding {number}: foundation crack observed, repair recommended.\n"
+        else:
+            line = FILLER
+        lines.append(line)
+        size += len(line)
+    return "".join(lines), number
+
+
+def make_echo_acreate(latency):
+    """Return a ChatCompletion.acreate stand-in that reports the findings present in its prompt"""
+    async def fake_acreate(**kwargs):
+        await asyncio.sleep(latency)
+        prompt = kwargs['messages'][-1]['content']
+        if 'risk_factors' in prompt:
+            risks = [
+                {
+                    "category": f"Finding {number}", "severity": "Medium", "description": f"Planted finding {number}",
+                    "recommendation": "Repair", "cost_impact": "Not specified", "location": "Benchmark"
+                }
+                for number in dict.fromkeys(FINDING_PATTERN.findall(prompt))
+            ]
+            content = {"risk_factors": risks, "overall_risk_score": "Medium", "summary": "Benchmark"}
+        else:
+            content = {"section": "Benchmark", "issues_found": [], "reasoning": "", "evidence": "", "severity_assessment": "Low"}
+        return _Response(json.dumps(content), prompt)
+    return fake_acreate
+
+
+def run_once(pipeline, report):
+    """Analyze report with pipeline and return (result, seconds)"""
+    app_module.analysis_cache.clear()
+    app_module.section_cache.clear()
+    start = time.perf_counter()
+    result = app_module.run_analysis(report, 'benchmark.txt', pipeline=pipeline)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lengths', default='4000,16000,64000,256000', help='Comma-separated report lengths in characters')
+    parser.add_argument('--model-latency', type=float, default=0.2, help='Seconds per fake model call')
+    args = parser.parse_args()
+
+    openai.api_key = 'benchmark'
+    openai.ChatCompletion.acreate = make_echo_acreate(args.model_latency)
+
+    print(f"model latency per call: {args.model_latency:.3f}s, chunk tokens: {app_module.MAP_REDUCE_CHUNK_TOKENS}, "
+          f"max chunks: {app_module.MAP_REDUCE_MAX_CHUNKS}")
+    print(f"{'chars':>8} {'findings':>8} {'pipeline':>10} {'coverage':>9} {'seconds':>8} {'calls':>6} {'prompt tok':>11}")
+    for length in (int(value) for value in args.lengths.split(',')):
+        report, planted = make_report(length)
+        for pipeline in ('full', 'mapreduce'):
+            result, seconds = run_once(pipeline, report)
+            found = {risk['category'] for risk in result.get('risk_factors', [])}
+            coverage = sum(f"Finding {number}" in found for number in range(1, planted + 1)) / planted
+            usage = result.get('usage', {})
+            print(f"{len(report):>8} {planted:>8} {pipeline:>10} {coverage:>8.0%} {seconds:>8.2f} "
+                  f"{usage.get('model_calls', 0):>6} {usage.get('prompt_tokens', 0):>11}")
+
+
+if __name__ == '__main__':
+    main()
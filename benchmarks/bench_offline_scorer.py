@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Compare throughput of the offline risk scorer with the model pipeline.
+
+The model path runs analyze_risk_factors against a stand-in client with a
+fixed latency per call, so its throughput is bounded by that latency; the
+offline path runs score_report on the same reports.
+
+Usage:
+    python benchmarks/bench_offline_scorer.py [--reports 50] [--report-chars 20000] [--model-latency 1.0]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Keep benchmark results out of the real analysis cache
+BENCH_DIR = tempfile.mkdtemp()
+os.environ['ANALYSIS_CACHE_PATH'] = os.path.join(BENCH_DIR, 'bench_cache.db')
+os.environ['ANALYSIS_DB_PATH'] = os.path.join(BENCH_DIR, 'bench_analyses.db')
+os.environ['JOB_DB_PATH'] = os.path.join(BENCH_DIR, 'bench_jobs.db')
+
+import openai
+
+import app as app_module
+from fake_openai import make_fake_create
+
+SAMPLE_REPORT = """
+STRUCTURAL ASSESSMENT
+Foundation: Multiple hairline cracks approximately 1/8 inch wide in the basement walls.
+While not immediately critical, they indicate potential settlement issues that should be monitored.
+
+ELECTRICAL SYSTEMS
+Main Panel: The panel is outdated and at capacity. This poses a significant fire hazard and should be upgraded immediately.
+
+PLUMBING SYSTEMS
+Minor corrosion on supply pipes under the kitchen sink. No active leak observed.
+
+ROOFING
+Several shingles are missing on the north slope; gutters are clogged. Estimated repair $1,200 - $1,800.
+"""
+
+
+def make_report(length):
+    """Repeat the sample report until it is roughly length characters long"""
+    return SAMPLE_REPORT * max(1, length // len(SAMPLE_REPORT))
+
+
+def time_path(label, analyze, reports):
+    """Run analyze over every report and print throughput"""
+    start = time.perf_counter()
+    for report in reports:
+        analyze(report)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<8} {len(reports)} reports in {elapsed:.3f}s "
+          f"({len(reports) / elapsed:.1f} reports/s, {1000 * elapsed / len(reports):.1f} ms/report)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reports', type=int, default=50, help='Number of reports to score')
+    parser.add_argument('--report-chars', type=int, default=20000, help='Approximate length of each report')
+    parser.add_argument('--model-latency', type=float, default=1.0, help='Seconds per fake model call')
+    parser.add_argument('--model-reports', type=int, default=3, help='Reports to run through the model path')
+    args = parser.parse_args()
+
+    openai.api_key = 'benchmark'
+    openai.ChatCompletion.create = make_fake_create(args.model_latency)
+    report = make_report(args.report_chars)
+
+    time_path('offline', app_module.get_offline_analysis, [report] * args.reports)
+    time_path('model', app_module.analyze_risk_factors, [report] * args.model_reports)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Time portfolio aggregation and bulk export over a large analysis history.
+
+A temporary store is filled with synthetic analyses spread over a year,
+then GET /analyses/aggregate and GET /analyses/export/risk_factors are
+timed through the Flask test client.
+
+Usage:
+    python benchmarks/bench_portfolio.py [--analyses 5000] [--risks-per-analysis 10]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Keep the synthetic history out of the real stores
+BENCH_DIR = tempfile.mkdtemp()
+os.environ['ANALYSIS_CACHE_PATH'] = os.path.join(BENCH_DIR, 'bench_cache.db')
+os.environ['ANALYSIS_DB_PATH'] = os.path.join(BENCH_DIR, 'bench_analyses.db')
+os.environ['JOB_DB_PATH'] = os.path.join(BENCH_DIR, 'bench_jobs.db')
+
+import app as app_module
+
+SEVERITIES = ["Low", "Medium", "High", "Critical"]
+YEAR = 365 * 24 * 3600
+
+
+def make_analysis(number, risks):
+    """Build a synthetic analysis with risks risk factors and one trace per section"""
+    categories = list(app_module.RISK_CATEGORIES)
+    return {
+        "filename": f"report_{number}.pdf",
+        "overall_risk_score": random.choice(SEVERITIES),
+        "summary": "Synthetic benchmark analysis",
+        "pipeline": "full",
+        "text_length": random.randint(2000, 200000),
+        "risk_factors": [
+            {
+                "category": random.choice(categories),
+                "severity": random.choice(SEVERITIES),
+                "description": "Synthetic finding",
+                "recommendation": "Review",
+                "cost_impact": "$1,000",
+                "location": "Benchmark"
+            }
+            for _ in range(risks)
+        ],
+        "thinking_traces": [
+            {"section": section, "issues_found": ["Synthetic"], "reasoning": "", "evidence": "", "severity_assessment": "Low"}
+            for section in app_module.ANALYSIS_SECTIONS
+        ]
+    }
+
+
+def fill_store(analyses, risks):
+    """Save synthetic analyses, then spread their timestamps over the last year"""
+    store = app_module.analysis_store
+    for number in range(analyses):
+        store.save(make_analysis(number, risks), f"{number:064x}")
+    now = time.time()
+    with store._connect() as conn:
+        conn.execute("UPDATE analyses SET created_at = ? - (abs(random()) % ?)", (now, YEAR))
+        for table in ('risk_factors', 'traces'):
+            conn.execute(f"UPDATE {table} SET created_at = (SELECT created_at FROM analyses WHERE id = analysis_id)")
+
+
+def timed_get(client, url):
+    """GET url and return (seconds, response size in bytes)"""
+    start = time.perf_counter()
+    response = client.get(url, buffered=True)
+    size = len(response.data)
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} returned {response.status_code}: {response.data[:200]}")
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--analyses', type=int, default=5000, help='Synthetic analyses to store')
+    parser.add_argument('--risks-per-analysis', type=int, default=10, help='Risk factors per analysis')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    fill_store(args.analyses, args.risks_per_analysis)
+    print(f"stored {args.analyses} analyses, {args.analyses * args.risks_per_analysis} risk factors "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    client = app_module.app.test_client()
+    last_quarter = time.strftime('%Y-%m-%d', time.gmtime(time.time() - YEAR / 4))
+    urls = [
+        '/analyses/aggregate?group_by=category',
+        f'/analyses/aggregate?group_by=category&start={last_quarter}',
+        '/analyses/aggregate?group_by=month',
+        '/analyses/export/risk_factors?format=csv',
+        '/analyses/export/risk_factors?format=parquet',
+        '/analyses/export/risk_factors?format=arrow'
+    ]
+    for url in urls:
+        elapsed, size = timed_get(client, url)
+        print(f"{elapsed * 1000:8.1f} ms {size / 1024:10.1f} KiB  {url}")
+
+
+if __name__ == '__main__':
+    main()
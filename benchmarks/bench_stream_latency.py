@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Measure server-side latency of the streaming analysis endpoint.
+
+The OpenAI client is replaced with a stand-in that sleeps for a fixed
+time per call, so the numbers reflect the app's own scheduling overhead
+(pacing, serialization of calls) rather than network variance.
+
+Usage:
+    python benchmarks/bench_stream_latency.py [--model-latency 0.2] [--runs 5]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Keep benchmark results out of the real analysis cache
+BENCH_DIR = tempfile.mkdtemp()
+os.environ['ANALYSIS_CACHE_PATH'] = os.path.join(BENCH_DIR, 'bench_cache.db')
+os.environ['ANALYSIS_DB_PATH'] = os.path.join(BENCH_DIR, 'bench_analyses.db')
+os.environ['JOB_DB_PATH'] = os.path.join(BENCH_DIR, 'bench_jobs.db')
+
+import openai
+
+import app as app_module
+from fake_openai import make_fake_acreate, make_fake_create
+
+SAMPLE_REPORT = b"""
+PROPERTY INSPECTION REPORT
+STRUCTURAL ASSESSMENT
+Foundation: Multiple hairline cracks approximately 1/8 inch wide in the basement walls.
+ELECTRICAL SYSTEMS
+Main Panel: The panel is at capacity and poses a significant fire hazard.
+"""
+
+
+def make_report(length):
+    """Repeat the sample report until it is roughly length characters long"""
+    repeats = max(1, length // len(SAMPLE_REPORT))
+    return SAMPLE_REPORT * repeats
+
+
+def run_once(client, pipeline, report):
+    """Post the sample report and return first-event latencies, total latency and token usage"""
+    start = time.perf_counter()
+    firsts = {}
+    usage = {}
+    response = client.post(
+        '/stream-analysis',
+        data={'file': (io.BytesIO(report), 'sample.txt'), 'pipeline': pipeline},
+        buffered=False
+    )
+    for chunk in response.response:
+        for event_type in (b'"thinking_delta"', b'"thinking_result"', b'"risk_factor"'):
+            if event_type not in firsts and event_type in chunk:
+                firsts[event_type] = time.perf_counter() - start
+        if b'"complete"' in chunk:
+            data = chunk.decode('utf-8').split('data: ', 1)[1]
+            usage = json.loads(data)['data'].get('usage', {})
+    total = time.perf_counter() - start
+    return firsts, total, usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model-latency', type=float, default=0.2, help='Seconds per fake model call')
+    parser.add_argument('--runs', type=int, default=5, help='Number of analyses to time')
+    parser.add_argument('--report-chars', type=int, default=20000, help='Approximate length of the sample report')
+    parser.add_argument('--pipeline', choices=app_module.ANALYSIS_PIPELINES, default='full', help='Final assessment pipeline')
+    args = parser.parse_args()
+
+    openai.api_key = 'benchmark'
+    openai.ChatCompletion.create = make_fake_create(args.model_latency)
+    openai.ChatCompletion.acreate = make_fake_acreate(args.model_latency)
+    client = app_module.app.test_client()
+    report = make_report(args.report_chars)
+
+    first_deltas, first_results, first_risks, totals = [], [], [], []
+    for _ in range(args.runs):
+        # Time the full pipeline rather than cache replays
+        app_module.analysis_cache.clear()
+        app_module.section_cache.clear()
+        firsts, total, usage = run_once(client, args.pipeline, report)
+        first_deltas.append(firsts.get(b'"thinking_delta"', total))
+        first_results.append(firsts.get(b'"thinking_result"', total))
+        first_risks.append(firsts.get(b'"risk_factor"', total))
+        totals.append(total)
+
+    print(f"pipeline: {args.pipeline}, model latency per call: {args.model_latency:.3f}s, runs: {args.runs}")
+    print(f"time to first thinking_delta:  median {statistics.median(first_deltas):.3f}s")
+    print(f"time to first thinking_result: median {statistics.median(first_results):.3f}s")
+    print(f"time to first risk_factor:     median {statistics.median(first_risks):.3f}s")
+    print(f"time to complete event:        median {statistics.median(totals):.3f}s")
+    print(f"tokens per analysis:           {usage.get('prompt_tokens', 0)} prompt, {usage.get('completion_tokens', 0)} completion")
+
+
+if __name__ == '__main__':
+    main()
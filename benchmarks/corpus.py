@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Synthetic property inspection reports for the benchmarks, as text and PDF.
+
+Reports are assembled from section templates with findings about
+foundations, wiring, plumbing, roofing and so on, so every analysis
+section has passages to work on. PDFs are written directly (one font,
+plain text lines) so no PDF library is needed to build them.
+
+Usage:
+    python benchmarks/corpus.py [--output benchmarks/corpus] [--seed 1]
+"""
+import argparse
+import os
+import random
+import textwrap
+
+# Approximate report lengths in characters
+REPORT_SIZES = {"small": 3000, "medium": 20000, "large": 150000}
+REPORT_FORMATS = ("txt", "pdf")
+
+SECTIONS = {
+    "STRUCTURAL ASSESSMENT": [
+        "Foundation: {severity} cracks up to {size} inch wide were observed in the {place} foundation wall.",
+        "Settlement of the {place} slab has caused {severity} sloping floors; load bearing beams show deflection.",
+        "A structural column in the {place} has {severity} corrosion at its base."
+    ],
+    "ROOFING": [
+        "Roof: {severity} shingle loss on the {place} slope, with granule wear on the remaining shingles.",
+        "Gutter drainage at the {place} is blocked, and a ceiling stain suggests water intrusion.",
+    ],
+    "ELECTRICAL SYSTEMS": [
+        "The main panel is at capacity; a {size} amp breaker feeds a circuit rated for less, a fire hazard.",
+        "Ungrounded outlets and {severity} amateur wiring were found in the {place}.",
+        "Aluminum branch wiring in the {place} shows {severity} overheating at the outlet terminals."
+    ],
+    "PLUMBING SYSTEMS": [
+        "An active leak at the {place} drain pipe has caused {severity} water damage to the subfloor.",
+        "Galvanized supply pipe in the {place} has {severity} corrosion and low pressure.",
+        "The sewer cleanout in the {place} backs up; mold growth is visible nearby."
+    ],
+    "HVAC SYSTEMS": [
+        "The furnace heat exchanger shows {severity} rust; the heating system is {size} years old.",
+        "Duct joints in the {place} are disconnected, reducing cooling and ventilation.",
+    ],
+    "SAFETY CONCERNS": [
+        "No smoke detector or carbon monoxide alarm was found in the {place}, a code violation.",
+        "The {place} stair handrail is loose, a {severity} safety hazard.",
+    ],
+    "ENVIRONMENTAL ISSUES": [
+        "Pipe insulation in the {place} may contain asbestos; testing is recommended.",
+        "Radon levels of {size} pCi/L were measured in the {place}, above the action level.",
+        "Paint in the {place} predates 1978 and may contain lead; {severity} peeling was noted."
+    ],
+    "ACCESSIBILITY": [
+        "The {place} entrance has no ramp, and door width is below accessibility guidelines.",
+        "The {place} bathroom lacks grab bars, limiting accessibility.",
+    ],
+    "PROPERTY CONDITION": [
+        "Deferred maintenance is evident in the {place}: {severity} wear and deterioration of finishes.",
+        "Windows in the {place} show their age; seals have failed and condition is {severity}.",
+    ]
+}
+PLACES = ["basement", "north", "south", "kitchen", "attic", "garage", "east wing", "west elevation", "crawlspace", "hallway"]
+SEVERITIES = ["minor", "moderate", "significant", "severe"]
+
+
+def make_report(length, seed=0, reference=None):
+    """Build a report of about length characters; reference, if given, is printed in its header"""
+    rng = random.Random(seed)
+    lines = ["PROPERTY INSPECTION REPORT", f"Property: {100 + seed % 900} Benchmark Street"]
+    if reference:
+        lines.append(f"Reference: {reference}")
+    size = sum(len(line) + 1 for line in lines)
+
+    # Cycle through the sections so long reports revisit each area
+    while size < length:
+        for heading, findings in SECTIONS.items():
+            paragraph = [heading]
+            for template in rng.sample(findings, rng.randint(1, len(findings))):
+                paragraph.append(template.format(
+                    severity=rng.choice(SEVERITIES),
+                    place=rng.choice(PLACES),
+                    size=rng.choice([2, 4, 8, 15, 30, 60])
+                ))
+            text = "\n".join(paragraph) + "\n"
+            lines.append(text)
+            size += len(text) + 1
+            if size >= length:
+                break
+    return "\n".join(lines)
+
+
+def _pdf_escape(line):
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(text, lines_per_page=55, line_chars=95):
+    """Render text as a minimal PDF with one Helvetica text block per page"""
+    lines = []
+    for paragraph in text.splitlines():
+        lines.extend(textwrap.wrap(paragraph, line_chars) or [""])
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    # Objects 1-3 are the catalog, page tree and font; each page adds a page and a content stream
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in pages:
+        body = "BT /F1 10 Tf 13 TL 50 770 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in page) + " ET"
+        stream = body.encode('latin-1', 'replace')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append((
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode('ascii'))
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode('ascii')
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(output)
+
+
+def make_document(size, report_format, seed=0, reference=None):
+    """Return (filename, bytes) for a report of a named size in txt or pdf format"""
+    text = make_report(REPORT_SIZES[size], seed=seed, reference=reference)
+    if report_format == 'pdf':
+        return f"{size}_report_{seed}.pdf", make_pdf(text)
+    return f"{size}_report_{seed}.txt", text.encode('utf-8')
+
+
+def write_corpus(directory, seed=1, copies=3):
+    """Write copies reports of every size and format to directory and return their paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for size in REPORT_SIZES:
+        for report_format in REPORT_FORMATS:
+            for copy in range(copies):
+                filename, data = make_document(size, report_format, seed=seed + copy)
+                path = os.path.join(directory, filename)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus'),
+                        help='Folder to write the reports to')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the first report of each size')
+    parser.add_argument('--copies', type=int, default=3, help='Reports of each size and format')
+    args = parser.parse_args()
+
+    for path in write_corpus(args.output, seed=args.seed, copies=args.copies):
+        print(f"{os.path.getsize(path) / 1024:8.1f} KiB  {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Stand-ins for openai.ChatCompletion.create and acreate used by the benchmarks.
+
+Responses are fixed JSON shaped like the real section traces and final
+assessment (or every section's trace for a single-call section prompt), or
+a one-word answer to cascade triage prompts. Token usage is estimated at about four characters per token.
+mock_model_server.py serves the same replies over HTTP.
+"""
+import asyncio
+import json
+import re
+import time
+
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class _Choice:
+    def __init__(self, content):
+        self.message = _Message(content)
+
+
+class _Response:
+    def __init__(self, content, prompt):
+        self.choices = [_Choice(content)]
+        # Roughly four characters per token
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        self.usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+
+def fake_response(messages):
+    """Build a response for messages: a cascade triage answer, a final assessment if the prompt asks for risk_factors, else a section trace"""
+    prompt = "".join(message['content'] for message in messages)
+    if 'Answer RISK' in prompt:
+        # Flag sections the way keyword triage would, from their severity words
+        return _Response("RISK" if any(word in prompt for word in ("severe", "significant")) else "CLEAR", prompt)
+    listed = re.search(r'sections of a property inspection report: ([^\n]+)\.', prompt)
+    if listed:
+        # One trace per section named in a single-call section prompt
+        traces = [
+            {"section": section, "issues_found": [], "reasoning": "", "evidence": "", "severity_assessment": "Low"}
+            for section in listed.group(1).split(', ')
+        ]
+        return _Response(json.dumps({"sections": traces}), prompt)
+    if 'risk_factors' in prompt:
+        risk = {
+            "category": "Structural Issues", "severity": "Medium", "description": "Benchmark finding",
+            "recommendation": "None", "cost_impact": "Not specified", "location": "Benchmark"
+        }
+        content = {"risk_factors": [risk, risk], "overall_risk_score": "Medium", "summary": "Benchmark"}
+    else:
+        content = {"section": "Benchmark", "issues_found": [], "reasoning": "", "evidence": "", "severity_assessment": "Low"}
+    return _Response(json.dumps(content), prompt)
+
+
+def make_fake_create(latency):
+    """Return a ChatCompletion.create stand-in with a fixed latency"""
+    def fake_create(**kwargs):
+        time.sleep(latency)
+        return fake_response(kwargs['messages'])
+    return fake_create
+
+
+async def _fake_stream(response, latency, chunk_chars=16):
+    """Yield the response content as streamed chunks spread evenly over latency"""
+    content = response.choices[0].message.content
+    pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+    for piece in pieces:
+        await asyncio.sleep(latency / len(pieces))
+        yield {"choices": [{"delta": {"content": piece}}]}
+    yield {"choices": [], "usage": response.usage}
+
+
+def make_fake_acreate(latency):
+    """Return a ChatCompletion.acreate stand-in with a fixed latency"""
+    async def fake_acreate(**kwargs):
+        response = fake_response(kwargs['messages'])
+        if kwargs.get('stream'):
+            return _fake_stream(response, latency)
+        await asyncio.sleep(latency)
+        return response
+    return fake_acreate
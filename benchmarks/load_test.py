@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Load test /upload, /stream-analysis and /export at several concurrency levels.
+
+By default the app and mock_model_server.py are started in this process on
+free ports, so no API key or network access is needed; pass --url to test
+a server that is already running (point it at the mock server with
+OPENAI_API_BASE). Each request uploads a report from corpus.py with a
+unique reference line, so the analysis cache and duplicate-upload sharing
+do not hide the model calls; --repeat sends identical documents instead.
+
+For every endpoint and concurrency level the driver reports requests/s
+and p50/p95/p99 latency, plus time to first event for /stream-analysis
+(the first event after the job announcement). --output saves the results
+as JSON, and --baseline compares a run against saved results and exits
+with status 1 if p95 latency or throughput is worse by more than
+--tolerance.
+
+Usage:
+    python benchmarks/load_test.py [--endpoints upload stream export] [--concurrency 1 4 16]
+        [--requests 32] [--sizes small medium] [--formats txt pdf] [--latency 0.3]
+        [--section-calls separate] [--output results.json] [--baseline results.json]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from corpus import REPORT_FORMATS, REPORT_SIZES, make_document
+from mock_model_server import MockModelServer, add_model_arguments, model_options
+
+ENDPOINTS = ("upload", "stream", "export")
+LATENCY_FIELDS = ("p50", "p95", "p99")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values, or None if there are none"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def start_local_server(args):
+    """Start the mock model API and the app on free ports and return the app's URL"""
+    base_url = MockModelServer(**model_options(args)).start()
+
+    # Keep results out of the real stores, and leave rate limiting to the mock server
+    bench_dir = tempfile.mkdtemp()
+    os.environ['ANALYSIS_CACHE_PATH'] = os.path.join(bench_dir, 'bench_cache.db')
+    os.environ['ANALYSIS_DB_PATH'] = os.path.join(bench_dir, 'bench_analyses.db')
+    os.environ['JOB_DB_PATH'] = os.path.join(bench_dir, 'bench_jobs.db')
+    os.environ.setdefault('LLM_REQUESTS_PER_MINUTE', '0')
+    os.environ.setdefault('LLM_TOKENS_PER_MINUTE', '0')
+    os.environ['OPENAI_API_BASE'] = base_url
+
+    import openai
+    from werkzeug.serving import make_server
+
+    import app as app_module
+    openai.api_base = base_url
+    openai.api_key = 'benchmark'
+
+    # Per-request access logs would drown out the results
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+_sessions = threading.local()
+
+
+def session():
+    """Return this thread's keep-alive HTTP session"""
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+
+def post_upload(url, document, form):
+    """POST a report to /upload; returns (seconds, None, ok)"""
+    filename, data = document
+    start = time.perf_counter()
+    response = session().post(f"{url}/upload", files={'file': (filename, data)}, data=form)
+    elapsed = time.perf_counter() - start
+    ok = response.status_code == 200 and 'error' not in response.json()
+    return elapsed, None, ok
+
+
+def post_stream(url, document, form):
+    """POST a report to /stream-analysis and read events until complete; returns (seconds, first event seconds, ok)"""
+    filename, data = document
+    start = time.perf_counter()
+    first_event = None
+    last_type = None
+    with session().post(f"{url}/stream-analysis", files={'file': (filename, data)}, data=form, stream=True) as response:
+        if response.status_code != 200:
+            return time.perf_counter() - start, None, False
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if not line or not line.startswith('data: '):
+                continue
+            last_type = json.loads(line[len('data: '):])['type']
+            if first_event is None and last_type != 'job':
+                first_event = time.perf_counter() - start
+            if last_type in ('complete', 'error'):
+                break
+    return time.perf_counter() - start, first_event, last_type == 'complete'
+
+
+def post_export(url, analysis, form):
+    """POST a finished analysis to /export; returns (seconds, None, ok)"""
+    start = time.perf_counter()
+    response = session().post(f"{url}/export", json=analysis)
+    ok = response.status_code == 200 and len(response.content) > 0
+    return time.perf_counter() - start, None, ok
+
+
+def make_payloads(endpoint, count, documents, repeat, export_analysis):
+    """Build the request payloads for one run before timing starts"""
+    if endpoint == 'export':
+        return [export_analysis] * count
+    payloads = []
+    for number in range(count):
+        size, report_format = documents[number % len(documents)]
+        reference = None if repeat else uuid.uuid4().hex
+        payloads.append(make_document(size, report_format, seed=number % 3, reference=reference))
+    return payloads
+
+
+def run_level(url, endpoint, concurrency, payloads, form):
+    """Send payloads to endpoint from concurrency threads and summarize the timings"""
+    send = {'upload': post_upload, 'stream': post_stream, 'export': post_export}[endpoint]
+    results = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for result in pool.map(lambda payload: send(url, payload, form), payloads):
+            results.append(result)
+    elapsed = time.perf_counter() - start
+
+    latencies = [seconds for seconds, _, ok in results if ok]
+    first_events = [first for _, first, ok in results if ok and first is not None]
+    row = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": sum(1 for _, _, ok in results if not ok),
+        "rps": round(len(results) / elapsed, 2),
+    }
+    for name, pct in zip(LATENCY_FIELDS, (50, 95, 99)):
+        value = percentile(latencies, pct)
+        row[name] = round(value, 4) if value is not None else None
+    for name, pct in zip(LATENCY_FIELDS, (50, 95, 99)):
+        value = percentile(first_events, pct)
+        row[f"ttfe_{name}"] = round(value, 4) if value is not None else None
+    return row
+
+
+def format_seconds(value):
+    return f"{value * 1000:9.1f}" if value is not None else f"{'-':>9}"
+
+
+def print_row(row):
+    print(f"{row['endpoint']:<8}{row['concurrency']:>6}{row['requests']:>7}{row['errors']:>7}{row['rps']:>9.2f}"
+          + "".join(format_seconds(row[name]) for name in LATENCY_FIELDS)
+          + "".join(format_seconds(row[f'ttfe_{name}']) for name in LATENCY_FIELDS))
+
+
+def compare(rows, baseline, tolerance):
+    """Return descriptions of results worse than baseline by more than tolerance"""
+    previous = {(row['endpoint'], row['concurrency']): row for row in baseline}
+    regressions = []
+    for row in rows:
+        before = previous.get((row['endpoint'], row['concurrency']))
+        if before is None:
+            continue
+        name = f"{row['endpoint']} at concurrency {row['concurrency']}"
+        if before['p95'] and row['p95'] and row['p95'] > before['p95'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95'] * 1000:.1f} ms -> {row['p95'] * 1000:.1f} ms")
+        if before['rps'] and row['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {before['rps']:.2f} -> {row['rps']:.2f} requests/s")
+        if row['errors'] > before['errors']:
+            regressions.append(f"{name}: {before['errors']} -> {row['errors']} errors")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='Test a running server instead of starting one in this process')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS), help='Endpoints to test')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16], help='Concurrent clients per run')
+    parser.add_argument('--requests', type=int, default=32, help='Requests per endpoint and concurrency level')
+    parser.add_argument('--sizes', nargs='+', choices=list(REPORT_SIZES), default=['small', 'medium'], help='Report sizes to upload')
+    parser.add_argument('--formats', nargs='+', choices=REPORT_FORMATS, default=list(REPORT_FORMATS), help='Report formats to upload')
+    parser.add_argument('--mode', choices=('llm', 'fast'), default='llm', help='Analysis mode sent with each upload')
+    parser.add_argument('--section-calls', choices=('separate', 'single'), default='separate',
+                        help='One model call per section, or one for all sections, on /stream-analysis')
+    parser.add_argument('--repeat', action='store_true', help='Upload identical documents, so the cache and sharing apply')
+    parser.add_argument('--output', help='Save the results as JSON')
+    parser.add_argument('--baseline', help='Compare with results saved by --output')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed fractional slowdown against the baseline')
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/') if args.url else start_local_server(args)
+    documents = [(size, report_format) for size in args.sizes for report_format in args.formats]
+    form = {'mode': args.mode, 'section_calls': args.section_calls}
+
+    # One fast-mode analysis supplies the /export payload and warms up the server
+    filename, data = make_document('medium', 'txt')
+    export_analysis = session().post(f"{url}/upload", files={'file': (filename, data)}, data={'mode': 'fast'}).json()
+
+    print(f"{'endpoint':<8}{'conc':>6}{'reqs':>7}{'errors':>7}{'req/s':>9}"
+          + "".join(f"{name + ' ms':>9}" for name in LATENCY_FIELDS)
+          + "".join(f"{'ttfe ' + name:>9}" for name in LATENCY_FIELDS))
+    rows = []
+    for endpoint in args.endpoints:
+        for concurrency in args.concurrency:
+            payloads = make_payloads(endpoint, args.requests, documents, args.repeat, export_analysis)
+            row = run_level(url, endpoint, concurrency, payloads, form)
+            print_row(row)
+            rows.append(row)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(rows, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Serves POST /v1/chat/completions, streamed or not, with the replies from
+fake_openai.py. Each call waits --latency seconds before its first token
+and then produces completion tokens at --tokens-per-second, and a
+fraction of calls (--error-rate) fail with --error-status, so the app's
+pacing, streaming and retries are exercised over real HTTP. GET /stats
+reports the calls served and errors injected so far.
+
+Point a server at it with OPENAI_API_BASE:
+    python benchmarks/mock_model_server.py --port 8600 --latency 0.3 --tokens-per-second 80
+    OPENAI_API_BASE=http://127.0.0.1:8600/v1 OPENAI_API_KEY=benchmark python app.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+from aiohttp import web
+
+from fake_openai import fake_response
+
+ERROR_MESSAGES = {
+    429: ("rate_limit_exceeded", "Rate limit reached (injected by the mock model server)"),
+    500: ("server_error", "The server had an error (injected by the mock model server)"),
+    503: ("server_error", "The server is overloaded (injected by the mock model server)")
+}
+
+
+def make_app(latency=0.3, tokens_per_second=0, error_rate=0.0, error_status=429, jitter=0.0, seed=None):
+    """Build the aiohttp application serving the mock chat completions endpoint"""
+    rng = random.Random(seed)
+    stats = {"requests": 0, "errors": 0, "completion_tokens": 0}
+
+    async def chat_completions(request):
+        body = await request.json()
+        stats['requests'] += 1
+        if rng.random() < error_rate:
+            stats['errors'] += 1
+            code, message = ERROR_MESSAGES.get(error_status, ERROR_MESSAGES[500])
+            return web.json_response(
+                {"error": {"message": message, "type": code, "code": code}},
+                status=error_status,
+                headers={"Retry-After": "1"} if error_status == 429 else None
+            )
+
+        response = fake_response(body['messages'])
+        content = response.choices[0].message.content
+        completion_tokens = response.usage['completion_tokens']
+        stats['completion_tokens'] += completion_tokens
+        await asyncio.sleep(latency + rng.uniform(0, jitter))
+
+        generation_seconds = completion_tokens / tokens_per_second if tokens_per_second > 0 else 0.0
+        created = int(time.time())
+        completion_id = f"chatcmpl-mock{stats['requests']}"
+
+        if not body.get('stream'):
+            await asyncio.sleep(generation_seconds)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get('model'),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": response.usage
+            })
+
+        stream = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await stream.prepare(request)
+        # About four characters per token, sent a few tokens per chunk
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        for piece in pieces:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get('model'),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+            }
+            await stream.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            await asyncio.sleep(generation_seconds / len(pieces))
+        usage = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "choices": [], "usage": response.usage}
+        await stream.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+        await stream.write_eof()
+        return stream
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', chat_completions)
+    app.router.add_get('/stats', get_stats)
+    return app
+
+
+class MockModelServer:
+    """The mock API served from its own event loop thread, for use inside another program"""
+
+    def __init__(self, host='127.0.0.1', port=0, **options):
+        self.host = host
+        self.port = port
+        self.options = options
+        self.base_url = None
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+
+    def start(self):
+        """Start serving and return the API base URL to use as openai.api_base"""
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=serve, daemon=True).start()
+        started.wait()
+        return self.base_url
+
+    async def _start(self):
+        self._runner = web.AppRunner(make_app(**self.options), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{self.host}:{port}/v1"
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def add_model_arguments(parser):
+    """Add the mock model options shared with the load driver"""
+    parser.add_argument('--latency', type=float, default=0.3, help='Seconds before the first token of each call')
+    parser.add_argument('--tokens-per-second', type=float, default=80, help='Completion tokens generated per second, 0 for instant')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls that fail')
+    parser.add_argument('--error-status', type=int, choices=sorted(ERROR_MESSAGES), default=429, help='HTTP status of failed calls')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency of up to this many seconds')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for jitter and error injection')
+
+
+def model_options(args):
+    """Pick the make_app() options out of parsed arguments"""
+    return dict(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        jitter=args.jitter,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8600, help='Port to listen on')
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    print(f"Mock model API at http://{args.host}:{args.port}/v1")
+    web.run_app(make_app(**model_options(args)), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Tiered model cascade for the section analyses.
+
+A cheap triage tier decides for each report section whether it needs a
+full model call: either locally, from the severity phrases in the
+section's passages, or with a short call to a small model. Only sections
+it flags are escalated to the full section prompt; the rest get a "no
+issues" trace without a model call. CascadeStats records the calls and
+latency of each tier so the trade-off can be tuned per deployment.
+"""
+import re
+import threading
+
+from metrics import Counter, Histogram
+from offline_scorer import NEGATION_PATTERN, SEVERITY_LEVELS, SEVERITY_PHRASES, compile_phrase_pattern
+
+CASCADE_TRIAGES = ("off", "keywords", "model")
+
+TRIAGE_SYSTEM_PROMPT = "You are a property inspector triaging report sections. Answer with one word."
+
+tier_seconds = Histogram('cascade_tier_seconds', 'Duration of section calls by cascade tier', labels=('tier',))
+section_decisions = Counter('cascade_sections_total', 'Report sections by cascade decision', labels=('decision',))
+
+
+def severity_pattern(min_severity):
+    """Compile a regex matching the severity phrases at min_severity or above"""
+    levels = SEVERITY_LEVELS[SEVERITY_LEVELS.index(min_severity):]
+    return compile_phrase_pattern([phrase for level in levels for phrase in SEVERITY_PHRASES[level]])
+
+
+def keyword_flags(excerpt, pattern):
+    """Return the distinct severity phrases in excerpt that call for a full analysis"""
+    lowered = re.sub(NEGATION_PATTERN, '', excerpt.lower())
+    return sorted(set(pattern.findall(lowered)))
+
+
+def build_triage_prompt(excerpt, section):
+    """Build the short prompt asking a small model whether a section needs a full analysis"""
+    return f"""
+    Do these property inspection report passages describe any defect, hazard or needed repair in {section}?
+
+    Passages:
+    {excerpt}
+
+    Answer RISK if they do, or CLEAR if they only describe items in acceptable condition."""
+
+
+def parse_triage_reply(reply):
+    """True unless the reply clearly says the section is clear, so unclear answers are escalated"""
+    words = re.findall(r'[a-z]+', (reply or '').lower())
+    return not ('clear' in words and 'risk' not in words)
+
+
+def cleared_trace(section, reason):
+    """The thinking trace for a section that triage found no issues in"""
+    return {
+        "section": section,
+        "issues_found": [],
+        "reasoning": reason,
+        "evidence": "",
+        "severity_assessment": "None identified"
+    }
+
+
+class CascadeStats:
+    """Thread-safe per-tier call counts, latency and section decisions for one analysis"""
+
+    def __init__(self, triage, triage_model, escalation_model):
+        self.triage = triage
+        self.models = {"triage": triage_model if triage == 'model' else 'keywords', "escalation": escalation_model}
+        self.tiers = {tier: {"calls": 0, "seconds": 0.0} for tier in self.models}
+        self.sections = {"escalated": [], "cleared": [], "no_passages": []}
+        self._lock = threading.Lock()
+
+    def record(self, tier, seconds):
+        """Record one call of a tier"""
+        tier_seconds.observe(seconds, tier=tier)
+        with self._lock:
+            self.tiers[tier]["calls"] += 1
+            self.tiers[tier]["seconds"] += seconds
+
+    def decide(self, section, decision):
+        """Record whether a section was escalated, cleared by triage or had no passages"""
+        section_decisions.inc(decision=decision)
+        with self._lock:
+            self.sections[decision].append(section)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "triage": self.triage,
+                "tiers": {
+                    tier: {
+                        "model": self.models[tier],
+                        "calls": counts["calls"],
+                        "seconds": round(counts["seconds"], 3),
+                        "mean_seconds": round(counts["seconds"] / counts["calls"], 3) if counts["calls"] else None
+                    }
+                    for tier, counts in self.tiers.items()
+                },
+                "sections": {decision: list(sections) for decision, sections in self.sections.items()}
+            }
@@ -4,6 +4,8 @@ import json
 import openai
 from dotenv import load_dotenv
 
+import llm_client
+
 # Load environment variables
 load_dotenv()
 
@@ -63,14 +65,12 @@ def test_analysis_prompt():
     
     try:
         print("Making API call...")
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
+        response = llm_client.chat(
+            [
                 {"role": "system", "content": "You are a professional property inspector and risk analyst. Provide accurate, detailed analysis of property inspection reports."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=1500,
-            temperature=0.3
+            max_tokens=1500
         )
         
         print("✅ API call successful!")
@@ -0,0 +1,217 @@
+"""
+Bounded-memory ingestion of uploaded reports.
+
+An upload is copied from the request in fixed-size chunks: small files stay
+in memory, larger ones are spooled to a file on disk, and nothing above the
+per-upload limit is accepted. A process-wide ByteBudget caps the bytes of
+uploads being ingested at once; when it is used up new uploads wait for
+room, and give up with IngestBusy if none frees in time, rather than
+letting a burst of large reports exhaust memory.
+
+Text reports are decoded chunk by chunk after sniffing their encoding
+(byte order marks, UTF-16 without a mark, then UTF-8, falling back to
+Windows-1252, which reports exported from older Windows tools use), so a
+stray non-UTF-8 byte no longer fails the upload.
+"""
+import codecs
+import os
+import tempfile
+import threading
+import time
+
+CHUNK_BYTES = 1024 * 1024
+SNIFF_BYTES = 64 * 1024
+
+# Checked in order: the UTF-32 LE mark starts with the UTF-16 LE one
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16')
+)
+
+
+class UploadTooLarge(ValueError):
+    """The upload is bigger than the per-upload limit"""
+
+
+class IngestBusy(RuntimeError):
+    """Too many bytes of other uploads are in flight to accept this one in time"""
+
+
+class ByteBudget:
+    """Thread-safe cap on the bytes of uploads held at once; 0 means no cap"""
+
+    def __init__(self, limit_bytes):
+        self.limit = limit_bytes
+        self.in_use = 0
+        self._changed = threading.Condition()
+
+    def acquire(self, amount, timeout):
+        """Reserve amount bytes, waiting up to timeout seconds for room; raises IngestBusy"""
+        if self.limit <= 0:
+            return
+        # A single upload larger than the whole budget waits for an idle process
+        amount = min(amount, self.limit)
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self.in_use + amount > self.limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise IngestBusy("Server is busy ingesting other uploads, please retry shortly")
+                self._changed.wait(remaining)
+            self.in_use += amount
+
+    def release(self, amount):
+        if self.limit <= 0:
+            return
+        with self._changed:
+            self.in_use = max(0, self.in_use - min(amount, self.limit))
+            self._changed.notify_all()
+
+
+class Upload:
+    """An uploaded file held in memory (data) or spooled to disk (path)
+
+    Releasing it returns its reservation to the budget and deletes its
+    spool file, unless keep() handed the file over to someone else.
+    """
+
+    def __init__(self, filename, data=None, path=None, size=0, budget=None, reserved=0):
+        self.filename = filename
+        self.data = data
+        self.path = path
+        self.size = size
+        self._budget = budget
+        self._reserved = reserved
+
+    @property
+    def source(self):
+        """The upload as bytes or a file path, as taken by iter_pdf_pages() and decode_text()"""
+        return self.path if self.path is not None else self.data
+
+    def keep(self):
+        """Return the spool file's path and stop release() from deleting it"""
+        path, self.path = self.path, None
+        return path
+
+    def release(self):
+        if self._budget is not None and self._reserved:
+            self._budget.release(self._reserved)
+            self._reserved = 0
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+        self.path = None
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def reserve_upload(budget, expected_bytes=None, max_bytes=0, wait_seconds=30, default_bytes=CHUNK_BYTES):
+    """Reserve room for an upload from budget and return the bytes reserved
+
+    expected_bytes (e.g. a request's Content-Length) is reserved; without it
+    max_bytes, or failing that default_bytes. Raises UploadTooLarge if
+    expected_bytes is already past max_bytes (0 for no limit) and IngestBusy
+    if the budget stays full for wait_seconds.
+    """
+    if max_bytes and expected_bytes and expected_bytes > max_bytes:
+        raise UploadTooLarge(f"Upload is larger than the {max_bytes // (1024 * 1024)} MB limit")
+    reserved = expected_bytes or max_bytes or default_bytes
+    if max_bytes:
+        reserved = min(reserved, max_bytes)
+    if budget is not None:
+        budget.acquire(reserved, wait_seconds)
+    return reserved
+
+
+def spool_upload(stream, filename, expected_bytes=None, max_bytes=0, spool_bytes=CHUNK_BYTES,
+                 directory=None, budget=None, wait_seconds=30, reserved=None):
+    """Copy a binary stream into an Upload, on disk once it passes spool_bytes
+
+    Room for the upload is reserved from budget up front (see
+    reserve_upload()), unless the caller already reserved it, in which case
+    reserved passes to the Upload. Raises UploadTooLarge past max_bytes
+    (0 for no limit) and IngestBusy if the budget stays full for wait_seconds.
+    """
+    if reserved is None:
+        reserved = reserve_upload(budget, expected_bytes, max_bytes, wait_seconds, spool_bytes)
+
+    buffer = bytearray()
+    spool = None
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise UploadTooLarge(f"Upload is larger than the {max_bytes // (1024 * 1024)} MB limit")
+            if spool is None and len(buffer) + len(chunk) > spool_bytes:
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                extension = os.path.splitext(filename)[1]
+                spool = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-', suffix=extension, delete=False)
+                spool.write(buffer)
+                buffer = None
+            if spool is None:
+                buffer += chunk
+            else:
+                spool.write(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.unlink(spool.name)
+        if budget is not None:
+            budget.release(reserved)
+        raise
+
+    if spool is None:
+        return Upload(filename, data=bytes(buffer), size=size, budget=budget, reserved=reserved)
+    spool.close()
+    return Upload(filename, path=spool.name, size=size, budget=budget, reserved=reserved)
+
+
+def detect_encoding(sample):
+    """Guess the text encoding of the first bytes of a file"""
+    for mark, encoding in BYTE_ORDER_MARKS:
+        if sample.startswith(mark):
+            return encoding
+    # Mostly-ASCII UTF-16 has a zero byte in every other position
+    if len(sample) >= 2 and sample.count(0) > len(sample) // 4:
+        return 'utf-16-le' if sample[1::2].count(0) > sample[0::2].count(0) else 'utf-16-be'
+    try:
+        # Not final, so a character cut off at the end of the sample is allowed
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1252'
+
+
+def decode_text(source):
+    """Decode text from bytes or a file path, detecting its encoding
+
+    Files are read and decoded a chunk at a time, so the raw bytes are never
+    held alongside the text. Bytes that are invalid in the detected encoding
+    become U+FFFD rather than failing the whole upload.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source).decode(detect_encoding(source[:SNIFF_BYTES]), errors='replace')
+
+    with open(source, 'rb') as f:
+        decoder = codecs.getincrementaldecoder(detect_encoding(f.read(SNIFF_BYTES)))(errors='replace')
+        f.seek(0)
+        parts = []
+        while True:
+            chunk = f.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            parts.append(decoder.decode(chunk))
+        parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
@@ -0,0 +1,340 @@
+"""
+Durable SQLite job queue for analyses, with a local worker pool.
+
+Jobs and every event they produce are written to SQLite, so an analysis
+keeps running when the client that submitted it disconnects, and any
+client can later replay its events from a given sequence number or fetch
+the result. Jobs run concurrently up to a limit, as tasks rather than one
+thread each. Several server processes can share one queue file: a job is
+claimed inside an immediate transaction, and a job whose worker stops
+sending heartbeats is handed to another worker. Small uploads are stored
+in the database; large ones stay in the file they were spooled to, which
+is deleted when the job ends.
+"""
+import functools
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class JobLost(RuntimeError):
+    """The job's lease expired and another worker claimed it, so this worker may no longer write to it"""
+
+
+class JobQueue:
+    """Jobs and their event logs stored in SQLite"""
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Wakes workers and event subscribers in this process; other
+        # processes notice changes by polling
+        self.changed = threading.Condition()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    payload BLOB,
+                    upload_path TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    result_id TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_events (
+                    job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+                    seq INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    PRIMARY KEY (job_id, seq)
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'upload_path' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN upload_path TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # With WAL, NORMAL syncs at checkpoints rather than on every event
+        # write; a power cut can lose the last few events, which a retried
+        # job writes again
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _notify(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def submit(self, filename, payload=None, upload_path=None, **options):
+        """Queue a job for an uploaded file, given as bytes or a file the job then owns, and return its id"""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, options, payload, upload_path, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, filename, json.dumps(options), payload, upload_path, time.time())
+            )
+        self._notify()
+        return job_id
+
+    def claim(self, worker):
+        """Mark the oldest runnable job as running on worker and return it, or None
+
+        Runnable jobs are queued ones and running ones whose lease has
+        expired because their worker died; those give up after max_attempts.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = "status = 'running' AND heartbeat_at < ? AND attempts >= ?"
+            abandoned = [path for (path,) in conn.execute(
+                f"SELECT upload_path FROM jobs WHERE {expired} AND upload_path IS NOT NULL",
+                (now - self.lease_seconds, self.max_attempts)
+            )]
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped responding', finished_at = ?, "
+                f"payload = NULL, upload_path = NULL WHERE {expired}",
+                (now, now - self.lease_seconds, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT id, filename, options, payload, upload_path, attempts FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now - self.lease_seconds,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, started_at = ?, heartbeat_at = ? "
+                    "WHERE id = ?",
+                    (worker, now, now, row[0])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        for path in abandoned:
+            _remove_upload(path)
+        if row is None:
+            return None
+        job_id, filename, options, payload, upload_path, attempts = row
+        return {
+            "id": job_id,
+            "filename": filename,
+            "options": json.loads(options),
+            "payload": payload,
+            "upload_path": upload_path,
+            "worker": worker,
+            "attempt": attempts + 1,
+            "next_seq": self.last_seq(job_id) + 1
+        }
+
+    def _renew(self, conn, job_id, worker):
+        cursor = conn.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), job_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id, worker):
+        """Renew the lease of a job running on worker; False if the job is no longer worker's"""
+        with self._connect() as conn:
+            return self._renew(conn, job_id, worker)
+
+    def append_events(self, job_id, worker, events):
+        """Store (seq, event) pairs for a job running on worker and renew its lease
+
+        Raises JobLost, storing nothing, if another worker has taken the job over.
+        """
+        with self._connect() as conn:
+            if not self._renew(conn, job_id, worker):
+                raise JobLost(f"Job {job_id} is no longer running on {worker}")
+            conn.executemany(
+                "INSERT OR REPLACE INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                [(job_id, seq, json.dumps(event)) for seq, event in events]
+            )
+        self._notify()
+
+    def finish(self, job_id, worker, result_id=None, error=None):
+        """Mark a job running on worker finished (with the stored analysis id) or failed, and drop its upload
+
+        Raises JobLost, changing nothing, if another worker has taken the job over.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT upload_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result_id = ?, error = ?, finished_at = ?, payload = NULL, upload_path = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                ('failed' if error else 'finished', result_id, error, time.time(), job_id, worker)
+            )
+            if cursor.rowcount != 1:
+                raise JobLost(f"Job {job_id} is no longer running on {worker}")
+        if row and row[0]:
+            _remove_upload(row[0])
+        self._notify()
+
+    def get(self, job_id):
+        """Return a job's status fields, or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, filename, options, attempts, result_id, error, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row[1] == 'queued':
+                position = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (row[7],)
+                ).fetchone()[0]
+
+        columns = ('id', 'status', 'filename', 'options', 'attempts', 'result_id', 'error', 'created_at', 'started_at', 'finished_at')
+        job = dict(zip(columns, row))
+        job['options'] = json.loads(job['options'])
+        job['queue_position'] = position
+        return job
+
+    def counts(self):
+        """Return the number of jobs in each status"""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def last_seq(self, job_id):
+        """Return the sequence number of a job's last stored event (0 if none)"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = ?", (job_id,)).fetchone()[0]
+
+    def events(self, job_id, after=0):
+        """Return a job's (seq, event) pairs with seq greater than after, in order"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
+
+    def prune(self, older_than_seconds):
+        """Delete jobs that ended more than older_than_seconds ago, with their events"""
+        cutoff = time.time() - older_than_seconds
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE finished_at < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+
+    def wait(self, timeout):
+        """Block until any job or event changes in this process, or timeout seconds pass"""
+        with self.changed:
+            self.changed.wait(timeout)
+
+
+def _remove_upload(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class JobWorkers:
+    """A thread that claims jobs from a JobQueue and starts them with start_job(job), at most concurrency at once
+
+    start_job returns a concurrent.futures.Future for the running job, such
+    as one from asyncio.run_coroutine_threadsafe(), so a job waiting on the
+    model holds a slot but no thread. A job that raises is marked failed.
+    The job dict's worker names this claim: writes for the job must pass it,
+    and are refused once the lease has passed to another worker.
+    """
+
+    def __init__(self, queue, start_job, concurrency=64, poll_seconds=1.0, retention_seconds=None):
+        self.queue = queue
+        self.start_job = start_job
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        self._pruned_at = 0.0
+        self.name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._claims = itertools.count(1)
+        self._slots = threading.Semaphore(concurrency)
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the dispatcher thread once; later calls do nothing"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._work, name=f"jobs-{self.name}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            self._slots.acquire()
+            try:
+                # Each claim gets its own worker name, so a job knows whether it still holds its lease
+                job = self.queue.claim(f"{self.name}-{next(self._claims)}")
+            except sqlite3.Error as e:
+                print(f"Could not claim job: {e}")
+                job = None
+            if job is None:
+                self._slots.release()
+                self._prune()
+                self.queue.wait(self.poll_seconds)
+                continue
+            try:
+                future = self.start_job(job)
+            except Exception as e:
+                self._slots.release()
+                self._fail(job, e)
+                continue
+            future.add_done_callback(functools.partial(self._done, job))
+
+    def _done(self, job, future):
+        self._slots.release()
+        if future.cancelled():
+            self._fail(job, "Job was cancelled")
+        elif isinstance(future.exception(), JobLost):
+            print(f"Job {job['id']} stopped: its lease expired and another worker took it over")
+        elif future.exception() is not None:
+            self._fail(job, future.exception())
+
+    def _fail(self, job, error):
+        try:
+            self.queue.finish(job['id'], job['worker'], error=str(error))
+        except JobLost:
+            # Cancelled because another worker took it over; that run reports the outcome
+            return
+        except sqlite3.Error as e:
+            print(f"Could not mark job {job['id']} failed: {e}")
+        print(f"Job {job['id']} failed: {error}")
+
+    def _prune(self):
+        # At most hourly, while the dispatcher is idle
+        with self._lock:
+            if not self.retention_seconds or time.time() - self._pruned_at < 3600:
+                return
+            self._pruned_at = time.time()
+        try:
+            self.queue.prune(self.retention_seconds)
+        except sqlite3.Error as e:
+            print(f"Could not prune old jobs: {e}")
@@ -0,0 +1,115 @@
+import json
+import re
+import threading
+
+# Commas directly before a closing bracket, which models often leave behind
+TRAILING_COMMA_PATTERN = re.compile(r',\s*([}\]])')
+
+# How many cut points to try, from the end, when repairing a truncated reply
+MAX_TRUNCATION_ATTEMPTS = 32
+
+
+def _loads(candidate):
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return json.loads(TRAILING_COMMA_PATTERN.sub(r'\1', candidate))
+
+
+def extract_json(text):
+    """Parse the first balanced JSON object or array in text, repairing truncation
+
+    Markdown fences and prose around the JSON are ignored. If the text ends
+    before the JSON closes (e.g. a max_tokens cut-off), open strings and
+    brackets are closed, dropping the incomplete last member if needed.
+    Returns (value, repaired); raises ValueError if nothing can be parsed.
+    """
+    match = re.search(r'[{\[]', text)
+    if not match:
+        raise ValueError("No JSON object or array found")
+    start = match.start()
+
+    closers = []
+    # Where a truncated reply can be cut: just inside an opening bracket,
+    # after a closed value or before a comma, with the brackets open there
+    cut_points = []
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            closers.append('}' if char == '{' else ']')
+            cut_points.append((index + 1, tuple(closers)))
+        elif char in '}]':
+            if closers:
+                closers.pop()
+            if not closers:
+                try:
+                    return _loads(text[start:index + 1]), False
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Invalid JSON: {e}")
+            cut_points.append((index + 1, tuple(closers)))
+        elif char == ',':
+            cut_points.append((index, tuple(closers)))
+
+    # Truncated: close what is open, then fall back to earlier cut points
+    fragment = text[start:]
+    if in_string:
+        fragment = (fragment[:-1] if escaped else fragment) + '"'
+    candidates = [fragment + ''.join(reversed(closers))]
+    for position, open_closers in reversed(cut_points[-MAX_TRUNCATION_ATTEMPTS:]):
+        candidates.append(text[start:position] + ''.join(reversed(open_closers)))
+
+    for candidate in candidates:
+        try:
+            return _loads(candidate), True
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("Truncated JSON could not be repaired")
+
+
+def invalid_fields(data, fields):
+    """Return the names of fields that are missing from data or have the wrong type"""
+    if not isinstance(data, dict):
+        return list(fields)
+    return [name for name, kind in fields.items() if not isinstance(data.get(name), kind)]
+
+
+class ParseStats:
+    """Thread-safe counters for how model replies were parsed"""
+
+    def __init__(self):
+        self.replies = 0
+        self.clean = 0
+        self.repaired = 0
+        self.field_retries = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        """Count one reply as 'clean', 'repaired', 'field_retries' or 'failed'"""
+        with self._lock:
+            self.replies += 1
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "replies": self.replies,
+                "clean": self.clean,
+                "repaired": self.repaired,
+                "field_retries": self.field_retries,
+                "failed": self.failed,
+                "failure_rate": round(self.failed / self.replies, 4) if self.replies else 0.0
+            }
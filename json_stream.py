@@ -0,0 +1,73 @@
+import json
+
+
+class ArrayItemParser:
+    """Incrementally parse streamed JSON text, returning the items of one top-level array
+
+    Feed the model's output as it arrives; each call returns the objects in
+    the array under `key` whose closing brace has been seen since the last
+    call. Text around the JSON (such as markdown fences) is ignored. Only
+    the text of an unfinished item or key is kept between calls, so a long
+    reply is not copied again with every chunk.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.text = ""
+        self.base = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_string = None
+        self.current_key = None
+        self.in_array = False
+        self.item_start = None
+
+    def feed(self, chunk):
+        """Consume more text and return any array items completed by it"""
+        items = []
+        offset = self.base + len(self.text)
+        self.text += chunk
+
+        for i, char in enumerate(chunk):
+            index = offset + i
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_string = self.text[self.string_start + 1 - self.base:index - self.base]
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = index
+            elif char == ':' and self.depth == 1:
+                self.current_key = self.last_string
+            elif char in '{[':
+                self.depth += 1
+                if char == '[' and self.depth == 2 and self.current_key == self.key:
+                    self.in_array = True
+                elif char == '{' and self.depth == 3 and self.in_array:
+                    self.item_start = index
+            elif char in '}]':
+                if char == '}' and self.depth == 3 and self.in_array and self.item_start is not None:
+                    try:
+                        items.append(json.loads(self.text[self.item_start - self.base:index + 1 - self.base]))
+                    except json.JSONDecodeError:
+                        pass
+                    self.item_start = None
+                elif char == ']' and self.depth == 2:
+                    self.in_array = False
+                self.depth -= 1
+
+        # Drop the text before anything still being read: an item, or a key string
+        pending = [start for start in (self.item_start, self.string_start if self.in_string and self.depth == 1 else None) if start is not None]
+        keep_from = min(pending) if pending else offset + len(chunk)
+        self.text = self.text[keep_from - self.base:]
+        self.base = keep_from
+        return items
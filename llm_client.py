@@ -0,0 +1,306 @@
+"""
+Shared client for OpenAI chat completions.
+
+Every model call in the app goes through chat(), achat() or achat_stream(),
+which add:
+- pooled keep-alive HTTP connections (one requests session for threads,
+  one aiohttp session per event loop)
+- a process-wide token bucket for requests/min and tokens/min, so bursts
+  queue up instead of failing with RateLimitError
+- retries with jittered exponential backoff on 429, 5xx and timeouts
+- a per-call timeout
+- latency, outcome and token metrics for every call (see metrics.py)
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import namedtuple
+
+import aiohttp
+import openai
+import requests
+from dotenv import load_dotenv
+
+from metrics import TOKEN_BUCKETS, Counter, Gauge, Histogram
+
+load_dotenv()
+
+DEFAULT_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', '3500'))
+TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', '90000'))
+MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+REQUEST_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '32'))
+
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20.0
+
+# Stands in for a response when recording the usage of a streamed call
+StreamedCompletion = namedtuple('StreamedCompletion', ['usage'])
+
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.TryAgain
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.tokens = float(rate_per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take amount from the bucket and return the seconds to wait before using it
+
+        The bucket may go negative, so callers queue in the order they reserved
+        and nobody has to hold a lock while waiting.
+        """
+        if self.capacity <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount):
+        """Return unused tokens, e.g. when a call used fewer than estimated"""
+        if self.capacity <= 0 or amount <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+call_seconds = Histogram('llm_call_seconds', 'Duration of successful model calls, including the streamed reply', labels=('kind',))
+call_outcomes = Counter('llm_calls_total', 'Model call attempts by outcome (ok, retried, failed)', labels=('kind', 'outcome'))
+call_tokens = Histogram('llm_call_tokens', 'Total tokens used per model call', labels=('kind',), buckets=TOKEN_BUCKETS)
+tokens_used = Counter('llm_tokens_total', 'Tokens used by model calls', labels=('type',))
+rate_limit_wait = Histogram('llm_rate_limit_wait_seconds', 'Time model calls waited for the client-side rate limiter')
+calls_in_flight = Gauge('llm_calls_in_flight', 'Model calls currently waiting on the API', labels=('kind',))
+
+request_bucket = TokenBucket(REQUESTS_PER_MINUTE)
+token_bucket = TokenBucket(TOKENS_PER_MINUTE)
+
+_requests_session = None
+_requests_session_lock = threading.Lock()
+_async_sessions = weakref.WeakKeyDictionary()
+
+
+def get_requests_session():
+    """Return the requests session shared by all threads, created on first use"""
+    global _requests_session
+    with _requests_session_lock:
+        if _requests_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _requests_session = session
+        return _requests_session
+
+
+def get_async_session():
+    """Return the aiohttp session for the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=POOL_SIZE))
+        _async_sessions[loop] = session
+    return session
+
+
+async def close_async_session():
+    """Close the running event loop's aiohttp session, if one was opened"""
+    session = _async_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def estimate_tokens(messages, max_tokens):
+    """Estimate the tokens a call will use (about four characters per token)"""
+    return sum(len(message['content']) for message in messages) // 4 + max_tokens
+
+
+def is_retryable(error):
+    """Whether a failed call is worth retrying (429, 5xx, timeouts, dropped connections)"""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return isinstance(error, openai.error.APIError) and (error.http_status or 500) >= 500
+
+
+def retry_delay(attempt, error):
+    """Seconds to wait before the next attempt: Retry-After if given, else full-jitter backoff"""
+    retry_after = getattr(error, 'headers', {}).get('retry-after')
+    try:
+        if retry_after:
+            return min(RETRY_MAX_DELAY, float(retry_after)) + random.uniform(0, RETRY_BASE_DELAY)
+    except ValueError:
+        pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _reserve(estimated):
+    wait = max(request_bucket.reserve(1), token_bucket.reserve(estimated))
+    rate_limit_wait.observe(wait)
+    return wait
+
+
+def _settle(estimated, response):
+    used = (getattr(response, 'usage', None) or {}).get('total_tokens')
+    if used is not None:
+        token_bucket.refund(estimated - used)
+
+
+def _record_call(kind, started, response):
+    reported = getattr(response, 'usage', None) or {}
+    call_seconds.observe(time.perf_counter() - started, kind=kind)
+    call_outcomes.inc(kind=kind, outcome='ok')
+    call_tokens.observe(reported.get('total_tokens', 0), kind=kind)
+    tokens_used.inc(reported.get('prompt_tokens', 0), type='prompt')
+    tokens_used.inc(reported.get('completion_tokens', 0), type='completion')
+
+
+def _record_error(kind, final):
+    call_outcomes.inc(kind=kind, outcome='failed' if final else 'retried')
+
+
+def _request_args(messages, max_tokens, temperature, model, kwargs):
+    return dict(
+        model=model or DEFAULT_MODEL,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        request_timeout=REQUEST_TIMEOUT,
+        **kwargs
+    )
+
+
+def chat(messages, max_tokens, temperature=0.3, model=None, usage=None, **kwargs):
+    """Make a rate-limited chat completion call with retries, blocking until it returns"""
+    if openai.requestssession is None:
+        openai.requestssession = get_requests_session()
+    estimated = estimate_tokens(messages, max_tokens)
+    request = _request_args(messages, max_tokens, temperature, model, kwargs)
+
+    for attempt in range(MAX_RETRIES + 1):
+        time.sleep(_reserve(estimated))
+        started = time.perf_counter()
+        try:
+            with calls_in_flight.track(kind='chat'):
+                response = openai.ChatCompletion.create(**request)
+        except Exception as e:
+            final = attempt == MAX_RETRIES or not is_retryable(e)
+            _record_error('chat', final)
+            if final:
+                raise
+            time.sleep(retry_delay(attempt, e))
+            continue
+        _settle(estimated, response)
+        _record_call('chat', started, response)
+        if usage:
+            usage.add(response)
+        return response
+
+
+async def achat(messages, max_tokens, temperature=0.3, model=None, usage=None, **kwargs):
+    """Make a rate-limited chat completion call with retries without blocking the event loop"""
+    estimated = estimate_tokens(messages, max_tokens)
+    request = _request_args(messages, max_tokens, temperature, model, kwargs)
+    session = openai.aiosession.set(get_async_session())
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            await asyncio.sleep(_reserve(estimated))
+            started = time.perf_counter()
+            try:
+                with calls_in_flight.track(kind='achat'):
+                    response = await openai.ChatCompletion.acreate(**request)
+            except Exception as e:
+                final = attempt == MAX_RETRIES or not is_retryable(e)
+                _record_error('achat', final)
+                if final:
+                    raise
+                await asyncio.sleep(retry_delay(attempt, e))
+                continue
+            _settle(estimated, response)
+            _record_call('achat', started, response)
+            if usage:
+                usage.add(response)
+            return response
+    finally:
+        openai.aiosession.reset(session)
+
+
+async def achat_stream(messages, max_tokens, temperature=0.3, model=None, usage=None, **kwargs):
+    """Stream a rate-limited chat completion, yielding content deltas as they arrive
+
+    Failures before the stream starts are retried like achat(); once deltas
+    have been yielded an error is raised to the caller. Token usage is taken
+    from the final chunk when the API reports it and estimated otherwise.
+    """
+    estimated = estimate_tokens(messages, max_tokens)
+    request = _request_args(messages, max_tokens, temperature, model, kwargs)
+    request.update(stream=True, stream_options={"include_usage": True})
+
+    for attempt in range(MAX_RETRIES + 1):
+        await asyncio.sleep(_reserve(estimated))
+        # The session is picked up when the request starts, so it is only set
+        # around the call rather than across the generator's yields
+        session = openai.aiosession.set(get_async_session())
+        started = time.perf_counter()
+        try:
+            chunks = await openai.ChatCompletion.acreate(**request)
+        except Exception as e:
+            final = attempt == MAX_RETRIES or not is_retryable(e)
+            _record_error('stream', final)
+            if final:
+                raise
+            await asyncio.sleep(retry_delay(attempt, e))
+            continue
+        finally:
+            openai.aiosession.reset(session)
+        break
+
+    reported = None
+    completion_chars = 0
+    with calls_in_flight.track(kind='stream'):
+        try:
+            async for chunk in chunks:
+                if chunk.get('usage'):
+                    reported = chunk['usage']
+                if chunk.get('choices'):
+                    delta = chunk['choices'][0].get('delta', {}).get('content')
+                    if delta:
+                        completion_chars += len(delta)
+                        yield delta
+        except Exception:
+            _record_error('stream', True)
+            raise
+
+    if reported is None:
+        prompt_tokens = estimated - max_tokens
+        reported = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_chars // 4,
+            "total_tokens": prompt_tokens + completion_chars // 4
+        }
+    completion = StreamedCompletion(reported)
+    _settle(estimated, completion)
+    _record_call('stream', started, completion)
+    if usage:
+        usage.add(completion)
@@ -0,0 +1,95 @@
+import re
+
+from offline_scorer import SEVERITY_LEVELS
+from passage_index import compile_keyword_pattern, split_passages
+
+# Two risk factors in the same category are merged when this share of their
+# description words overlap
+DUPLICATE_OVERLAP = 0.5
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def split_chunks(text, chunk_chars):
+    """Pack passages into (start, end) chunks of at most chunk_chars, in document order"""
+    chunks = []
+    for start, end in split_passages(text, chunk_chars):
+        if chunks and end - chunks[-1][0] <= chunk_chars:
+            chunks[-1] = (chunks[-1][0], end)
+        else:
+            chunks.append((start, end))
+    return chunks
+
+
+def select_chunks(text, chunks, categories, max_chunks):
+    """Keep the max_chunks chunks with the most risk keyword hits, in document order
+
+    This bounds the number of model calls (and so the token cost) for very
+    long documents while still covering the passages most likely to matter.
+    """
+    if len(chunks) <= max_chunks:
+        return list(chunks)
+    pattern = compile_keyword_pattern([keyword for keywords in categories.values() for keyword in keywords])
+    hits = [len(pattern.findall(text, start, end)) for start, end in chunks]
+    ranked = sorted(range(len(chunks)), key=lambda i: (-hits[i], i))[:max_chunks]
+    return [chunks[i] for i in sorted(ranked)]
+
+
+def _severity_rank(risk):
+    severity = str(risk.get('severity', '')).strip().title()
+    return SEVERITY_LEVELS.index(severity) if severity in SEVERITY_LEVELS else -1
+
+
+def _words(risk):
+    return set(WORD_PATTERN.findall(str(risk.get('description', '')).lower()))
+
+
+def is_duplicate(risk, other):
+    """Whether two risk factors describe the same issue (same category, overlapping description)"""
+    if str(risk.get('category', '')).strip().lower() != str(other.get('category', '')).strip().lower():
+        return False
+    words, other_words = _words(risk), _words(other)
+    if not words or not other_words:
+        return words == other_words
+    return len(words & other_words) / min(len(words), len(other_words)) >= DUPLICATE_OVERLAP
+
+
+def reduce_analyses(analyses):
+    """Merge per-chunk assessments into one, deduplicating risk factors deterministically
+
+    analyses is a list of final-assessment dicts in document order. Duplicates
+    keep the most severe description and collect every location; the result
+    is ordered by severity, then category, then first appearance.
+    """
+    merged = []
+    for part, analysis in enumerate(analyses):
+        for risk in analysis.get('risk_factors', []):
+            for existing in merged:
+                if is_duplicate(existing['risk'], risk):
+                    if _severity_rank(risk) > _severity_rank(existing['risk']):
+                        existing['risk'] = {**existing['risk'], **risk}
+                    if risk.get('location'):
+                        existing['locations'].append(risk['location'])
+                    break
+            else:
+                merged.append({'risk': dict(risk), 'part': part, 'locations': [risk['location']] if risk.get('location') else []})
+
+    risk_factors = []
+    for entry in sorted(merged, key=lambda e: (-_severity_rank(e['risk']), str(e['risk'].get('category', '')), e['part'])):
+        risk = entry['risk']
+        if entry['locations']:
+            risk['location'] = "; ".join(dict.fromkeys(entry['locations']))
+        risk_factors.append(risk)
+
+    ranks = [_severity_rank(risk) for risk in risk_factors] + [_severity_rank({'severity': a.get('overall_risk_score')}) for a in analyses]
+    overall = SEVERITY_LEVELS[max(ranks)] if ranks and max(ranks) >= 0 else "Low"
+
+    # Summaries of the most severe parts first, then in document order
+    ordered = sorted(range(len(analyses)), key=lambda i: (-_severity_rank({'severity': analyses[i].get('overall_risk_score')}), i))
+    summaries = list(dict.fromkeys(analyses[i].get('summary', '').strip() for i in ordered if analyses[i].get('summary')))
+
+    return {
+        "risk_factors": risk_factors,
+        "overall_risk_score": overall,
+        "summary": " ".join(summaries[:3]) or "No significant risk factors found."
+    }
@@ -0,0 +1,202 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are kept in memory and rendered by
+render() for the /metrics endpoint. span() times a block of code into the
+analysis_span_seconds histogram and, while a per-request collector is
+active (use_timings()), into that request's timing summary too.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds in seconds, from sub-millisecond parsing to slow model calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+_timings = ContextVar('timings', default=None)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(dict(zip(self.labels, key)))} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Set the total directly, for counts kept elsewhere and copied in by a collector"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the block as in progress while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, labels)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                labels = dict(zip(self.labels, key))
+                for bound, count in zip(self.buckets, state['buckets']):
+                    lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {state['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(state['sum'])}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {state['count']}")
+        return lines
+
+
+class Registry:
+    """All metrics of the process, plus callbacks that refresh gauges before rendering"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, collect):
+        """Call collect() before each render, e.g. to set gauges from other state"""
+        self.collectors.append(collect)
+
+    def render(self):
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+span_seconds = Histogram('analysis_span_seconds', 'Time spent in each stage of the analysis pipeline', labels=('span',))
+
+
+@contextmanager
+def span(name):
+    """Time the block into analysis_span_seconds and the current request's timings"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def record_span(name, seconds, timings=None):
+    """Record an already measured duration as a span, into timings or the current request's"""
+    span_seconds.observe(seconds, span=name)
+    timings = timings or _timings.get()
+    if timings is not None:
+        with timings['lock']:
+            entry = timings['spans'].setdefault(name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            entry['count'] += 1
+            entry['total_seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+
+def new_timings():
+    """Return an empty per-request span collector"""
+    return {"spans": {}, "lock": threading.Lock()}
+
+
+def use_timings(timings):
+    """Record spans in the current context, and tasks started from it, into timings"""
+    _timings.set(timings)
+
+
+def timing_summary(timings):
+    """Return the spans collected for a request, rounded for display"""
+    with timings['lock']:
+        return {
+            name: {
+                "count": entry['count'],
+                "total_seconds": round(entry['total_seconds'], 4),
+                "max_seconds": round(entry['max_seconds'], 4)
+            }
+            for name, entry in sorted(timings['spans'].items())
+        }
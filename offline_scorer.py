@@ -0,0 +1,148 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from passage_index import compile_keyword_pattern
+
+# Phrases that signal how serious a finding is, most severe first
+SEVERITY_PHRASES = {
+    "Critical": [
+        "immediately", "immediate attention", "fire hazard", "shock hazard", "life safety",
+        "collapse", "structural failure", "gas leak", "carbon monoxide", "unsafe", "do not occupy"
+    ],
+    "High": [
+        "significant", "severe", "major", "overloaded", "active leak", "water intrusion",
+        "asbestos", "not functioning", "inoperable", "failed", "failure", "code violation",
+        "missing smoke detector", "urgent", "as soon as possible"
+    ],
+    "Medium": [
+        "crack", "1/8 inch", "1/4 inch", "settlement", "outdated", "deteriorat", "corroded",
+        "damaged", "damage", "leak", "stain", "mold", "moisture", "repair", "replace", "upgrade",
+        "should be addressed", "recommend"
+    ],
+    "Low": [
+        "monitor", "minor", "cosmetic", "wear", "aging", "maintenance", "hairline", "near end of"
+    ]
+}
+
+SEVERITY_LEVELS = ["Low", "Medium", "High", "Critical"]
+
+RECOMMENDATIONS = {
+    "Structural Issues": "Have a structural engineer evaluate the affected areas",
+    "Electrical Hazards": "Have a licensed electrician evaluate and correct the electrical system",
+    "Plumbing Problems": "Have a licensed plumber locate and repair the source of the problem",
+    "Roofing Issues": "Have a roofing contractor inspect and repair the roof system",
+    "HVAC Concerns": "Have an HVAC technician service and evaluate the system",
+    "Safety Violations": "Correct the safety deficiencies before occupancy",
+    "Environmental Hazards": "Arrange environmental testing and remediation by a qualified specialist",
+    "Accessibility Issues": "Review accessibility features against applicable requirements",
+    "Property Condition": "Budget for deferred maintenance and monitor condition"
+}
+
+COST_PATTERN = re.compile(r'\$\s?\d[\d,]*(?:\.\d+)?(?:\s*(?:-|to)\s*\$\s?\d[\d,]*(?:\.\d+)?)?')
+HEADING_PATTERN = re.compile(r'^[ \t]*([A-Z][A-Z &/,-]{3,})[ \t]*:?[ \t]*$', re.MULTILINE)
+SENTENCE_PATTERN = re.compile(r'[^.!?\n]+[.!?]?')
+
+# Negated severity words ("not immediately critical") should not raise severity
+NEGATION_PATTERN = r'\b(?:not|no|without)\s+(?:immediate|critical|significant|severe|major|urgent|unsafe)\w*'
+
+
+def compile_phrase_pattern(phrases):
+    """Compile a regex matching any phrase at the start of a word (so stems like "deteriorat" match)"""
+    return re.compile(r'\b(?:' + '|'.join(re.escape(phrase) for phrase in phrases) + ')')
+
+
+def split_sentences(text):
+    """Split text into sentences, returning a frame with each sentence and its offset"""
+    rows = [(match.group(0).strip(), match.start()) for match in SENTENCE_PATTERN.finditer(text)]
+    rows = [(sentence, start) for sentence, start in rows if len(sentence) > 3]
+    return pd.DataFrame(rows, columns=["sentence", "start"])
+
+
+def find_headings(text):
+    """Return (offset, heading) pairs for all-caps heading lines"""
+    return [(match.start(), match.group(1).strip().title()) for match in HEADING_PATTERN.finditer(text)]
+
+
+def score_report(text, categories):
+    """Score a report locally by keyword and severity-phrase matching
+
+    Returns the same structure as the model's final assessment:
+    risk_factors, overall_risk_score and summary.
+    """
+    sentences = split_sentences(text)
+    if sentences.empty:
+        return {
+            "risk_factors": [],
+            "overall_risk_score": "Low",
+            "summary": "No text available to analyze."
+        }
+
+    lowered = sentences["sentence"].str.lower().str.replace(NEGATION_PATTERN, '', regex=True)
+
+    # Severity of each sentence: the most severe phrase it contains, 0 if none
+    severity_rank = np.zeros(len(sentences), dtype=int)
+    for rank, level in enumerate(SEVERITY_LEVELS, start=1):
+        matches = lowered.str.contains(compile_phrase_pattern(SEVERITY_PHRASES[level])).to_numpy()
+        severity_rank[matches] = rank
+    sentences["severity_rank"] = severity_rank
+
+    headings = find_headings(text)
+    heading_offsets = [offset for offset, _ in headings]
+
+    risk_factors = []
+    for category, keywords in categories.items():
+        hits = lowered.str.count(compile_keyword_pattern(keywords)).to_numpy()
+        matched = (hits > 0) & (severity_rank > 0)
+        if not matched.any():
+            continue
+        candidates = sentences[matched].assign(hits=hits[matched])
+
+        best = candidates.sort_values(["severity_rank", "hits", "start"], ascending=[False, False, True]).iloc[0]
+        location = "Report text"
+        heading_index = np.searchsorted(heading_offsets, best["start"], side="right") - 1
+        if heading_index >= 0:
+            location = headings[heading_index][1]
+        cost = COST_PATTERN.search(" ".join(candidates["sentence"]))
+
+        risk_factors.append({
+            "category": category,
+            "severity": SEVERITY_LEVELS[best["severity_rank"] - 1],
+            "description": best["sentence"],
+            "recommendation": RECOMMENDATIONS.get(category, "Have a qualified professional evaluate this issue"),
+            "cost_impact": cost.group(0) if cost else "Not specified",
+            "location": location
+        })
+
+    risk_factors.sort(key=lambda risk: SEVERITY_LEVELS.index(risk["severity"]), reverse=True)
+    overall = risk_factors[0]["severity"] if risk_factors else "Low"
+
+    if risk_factors:
+        summary = (
+            f"Offline keyword analysis found {len(risk_factors)} risk factors. "
+            f"The most severe are in {', '.join(risk['category'] for risk in risk_factors if risk['severity'] == overall)}."
+        )
+    else:
+        summary = "Offline keyword analysis found no significant risk factors."
+
+    return {
+        "risk_factors": risk_factors,
+        "overall_risk_score": overall,
+        "summary": summary
+    }
+
+
+def section_traces(analysis, section_categories):
+    """Build per-section thinking traces from an offline analysis"""
+    traces = []
+    for section, section_category_list in section_categories.items():
+        risks = [risk for risk in analysis["risk_factors"] if risk["category"] in section_category_list]
+        traces.append({
+            "section": section,
+            "issues_found": [risk["description"] for risk in risks],
+            "reasoning": "Matched risk keywords and severity phrases in the report text" if risks else "No risk keywords with severity indicators found",
+            "evidence": " ".join(risk["description"] for risk in risks),
+            "severity_assessment": max((risk["severity"] for risk in risks), key=SEVERITY_LEVELS.index) if risks else "None identified"
+        })
+    return traces
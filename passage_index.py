@@ -0,0 +1,98 @@
+import re
+from bisect import bisect_right
+from collections import defaultdict
+
+
+def split_passages(text, max_chars=800):
+    """Split text into (start, end) passage spans along paragraph and line breaks"""
+    spans = []
+    start = None
+    end = 0
+    for match in re.finditer(r'[^\n]+', text):
+        line_start, line_end = match.span()
+        if start is None:
+            start = line_start
+        elif line_end - start > max_chars or text.count('\n', end, line_start) > 1:
+            # Close the passage at a blank line or once it would grow too long
+            spans.append((start, end))
+            start = line_start
+        end = line_end
+
+        # Hard-split single lines longer than the passage size
+        while end - start > max_chars:
+            spans.append((start, start + max_chars))
+            start += max_chars
+
+    if start is not None and end > start:
+        spans.append((start, end))
+    return spans
+
+
+def compile_keyword_pattern(keywords):
+    """Compile one case-insensitive regex matching any keyword (or its plural) as a whole word"""
+    # Longest first so multi-word phrases win over their prefixes
+    alternatives = sorted(set(keyword.lower() for keyword in keywords), key=len, reverse=True)
+    return re.compile(r'\b(' + '|'.join(re.escape(keyword) for keyword in alternatives) + r')(?:e?s)?\b', re.IGNORECASE)
+
+
+class PassageIndex:
+    """Inverted index from risk categories to the report passages that mention them"""
+
+    def __init__(self, text, categories, max_passage_chars=800):
+        self.text = text
+        self.spans = split_passages(text, max_passage_chars)
+        self._starts = [start for start, _ in self.spans]
+
+        keyword_categories = defaultdict(set)
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                keyword_categories[keyword.lower()].add(category)
+
+        # category -> passage index -> keyword hit count
+        self.postings = defaultdict(lambda: defaultdict(int))
+        if not keyword_categories or not self.spans:
+            return
+
+        pattern = compile_keyword_pattern(keyword_categories)
+        for match in pattern.finditer(text):
+            passage = bisect_right(self._starts, match.start()) - 1
+            if passage < 0 or match.start() >= self.spans[passage][1]:
+                continue
+            for category in keyword_categories[match.group(1).lower()]:
+                self.postings[category][passage] += 1
+
+    def hit_count(self, categories):
+        """Total keyword hits across the given categories"""
+        return sum(sum(self.postings[category].values()) for category in categories)
+
+    def _top_passage_ids(self, categories, max_chars):
+        scores = defaultdict(int)
+        for category in categories:
+            for passage, hits in self.postings[category].items():
+                scores[passage] += hits
+
+        chosen = []
+        remaining = max_chars
+        for passage in sorted(scores, key=lambda p: (-scores[p], p)):
+            start, end = self.spans[passage]
+            if end - start > remaining:
+                continue
+            chosen.append(passage)
+            remaining -= end - start
+        return chosen
+
+    def top_passages(self, categories, max_chars):
+        """Return the best-scoring passages for the categories, in document order, within max_chars"""
+        chosen = self._top_passage_ids(categories, max_chars)
+        return [self.text[self.spans[p][0]:self.spans[p][1]] for p in sorted(chosen)]
+
+    def excerpt(self, categories, max_chars, separator="\n...\n"):
+        """Join the top passages for the categories into a single prompt excerpt"""
+        return separator.join(self.top_passages(categories, max_chars))
+
+    def combined_excerpt(self, category_groups, max_chars, separator="\n...\n"):
+        """Join the top passages of several category groups, each within max_chars, including shared passages once"""
+        chosen = set()
+        for categories in category_groups:
+            chosen.update(self._top_passage_ids(categories, max_chars))
+        return separator.join(self.text[self.spans[p][0]:self.spans[p][1]] for p in sorted(chosen))
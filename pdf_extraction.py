@@ -0,0 +1,150 @@
+import io
+import mmap
+import os
+import tempfile
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import PyPDF2
+
+PdfPage = namedtuple('PdfPage', ['number', 'total', 'text', 'seconds'])
+
+# Documents shorter than this are extracted in-process; below it the cost of
+# re-opening the PDF in worker processes outweighs the parallelism
+PARALLEL_MIN_PAGES = 16
+
+_pool = None
+_pool_workers = None
+
+
+def _get_pool(workers):
+    """Return a shared process pool, created on first use"""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def open_mapped(path):
+    """Open a file read-only through a memory map, so its pages come from the page cache rather than a copy"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return io.BytesIO(b"")
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _extract_page_range(path, start, end):
+    """Extract pages [start, end) of the PDF at path (runs in a worker process)"""
+    with open_mapped(path) as f:
+        reader = PyPDF2.PdfReader(f)
+        total = len(reader.pages)
+        pages = []
+        for number in range(start, end):
+            began = time.perf_counter()
+            text = reader.pages[number].extract_text() or ""
+            pages.append(PdfPage(number + 1, total, text, time.perf_counter() - began))
+        return pages
+
+
+def iter_pdf_pages(pdf_file, max_chars=None, workers=None):
+    """Yield PdfPage tuples in page order, stopping once max_chars of text is collected
+
+    pdf_file may be a path (read through a memory map), bytes or a binary
+    file object. With more than one worker, long documents are split into
+    page ranges extracted on a process pool; only a few ranges are kept in
+    flight so an early stop wastes little work.
+    """
+    workers = workers or 1
+    collected = 0
+
+    if isinstance(pdf_file, (str, os.PathLike)):
+        path, cleanup = os.fspath(pdf_file), False
+        source = open_mapped(path)
+    else:
+        data = pdf_file if isinstance(pdf_file, (bytes, bytearray)) else pdf_file.read()
+        path, cleanup = None, False
+        source = io.BytesIO(data)
+
+    with source:
+        reader = PyPDF2.PdfReader(source)
+        total = len(reader.pages)
+
+        if workers <= 1 or total < PARALLEL_MIN_PAGES:
+            for number, page in enumerate(reader.pages, start=1):
+                began = time.perf_counter()
+                text = page.extract_text() or ""
+                yield PdfPage(number, total, text, time.perf_counter() - began)
+                collected += len(text)
+                if max_chars and collected >= max_chars:
+                    return
+            return
+
+        # Worker processes open the document by path rather than receiving
+        # a copy of its bytes with every page range
+        if path is None:
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as spool:
+                spool.write(data)
+                path, cleanup = spool.name, True
+
+    try:
+        pool = _get_pool(workers)
+        chunk = max(4, total // (workers * 4))
+        ranges = iter([(start, min(start + chunk, total)) for start in range(0, total, chunk)])
+        in_flight = deque()
+        for _ in range(workers * 2):
+            page_range = next(ranges, None)
+            if page_range:
+                in_flight.append(pool.submit(_extract_page_range, path, *page_range))
+
+        try:
+            while in_flight:
+                pages = in_flight.popleft().result()
+                page_range = next(ranges, None)
+                if page_range:
+                    in_flight.append(pool.submit(_extract_page_range, path, *page_range))
+                for page in pages:
+                    yield page
+                    collected += len(page.text)
+                    if max_chars and collected >= max_chars:
+                        return
+        finally:
+            for future in in_flight:
+                future.cancel()
+            # Let running ranges finish before their file is removed
+            for future in in_flight:
+                if not future.cancelled():
+                    try:
+                        future.result()
+                    except Exception:
+                        pass
+    finally:
+        if cleanup:
+            os.unlink(path)
+
+
+def join_pages(pages):
+    """Join the text of extracted PdfPage tuples, one line break after each page
+
+    Returns the text and the character offset at which each page starts.
+    """
+    offsets = []
+    position = 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page.text) + 1
+    return "".join(page.text + "\n" for page in pages), offsets
+
+
+def extraction_summary(pages, wall_seconds):
+    """Summarize page timings and page start offsets for a list of extracted PdfPage tuples"""
+    return {
+        "pages_extracted": len(pages),
+        "total_pages": pages[0].total if pages else 0,
+        "wall_seconds": round(wall_seconds, 3),
+        "page_seconds": [round(page.seconds, 4) for page in pages],
+        "page_offsets": join_pages(pages)[1]
+    }
@@ -0,0 +1,107 @@
+"""
+Revision-aware re-analysis of updated inspection reports.
+
+Each stored model analysis keeps a fingerprint of its report: a short hash
+of every passage and of the excerpt each section prompt was built from,
+plus the property named in the report header. When a revised report comes
+in, a previous version is found by id, by property, or by filename or
+passage overlap, and the two fingerprints are compared. Sections whose
+excerpt is unchanged keep their traces and risk factors; only the changed
+ones are analyzed again and merged into the previous result.
+"""
+import hashlib
+import re
+
+from map_reduce import reduce_analyses
+
+# Header lines naming the inspected property, such as "Property: 12 Elm Street"
+PROPERTY_PATTERN = re.compile(r'^[ \t]*(?:property(?: id| address)?|address)[ \t]*[:#][ \t]*(\S.*?)[ \t]*$', re.IGNORECASE | re.MULTILINE)
+PROPERTY_HEADER_CHARS = 2000
+
+# Evidence of a section trace whose model call failed; such sections are always re-run
+FAILED_EVIDENCE = ("API call failed", "JSON parsing error")
+
+
+def short_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+
+
+def property_id(text):
+    """The property named in the report header, normalized for matching, or None"""
+    match = PROPERTY_PATTERN.search(text[:PROPERTY_HEADER_CHARS])
+    return " ".join(match.group(1).lower().split()) if match else None
+
+
+def make_fingerprint(text, spans, section_excerpts):
+    """Fingerprint a report from its passage spans and the excerpt sent for each section"""
+    return {
+        "property": property_id(text),
+        "passages": [short_hash(text[start:end]) for start, end in spans],
+        "sections": {section: short_hash(excerpt) for section, excerpt in section_excerpts.items()}
+    }
+
+
+def similarity(fingerprint, other):
+    """Share of distinct passages the two reports have in common (Jaccard index)"""
+    passages, other_passages = set(fingerprint['passages']), set(other['passages'])
+    if not passages or not other_passages:
+        return 0.0
+    return len(passages & other_passages) / len(passages | other_passages)
+
+
+def find_previous(fingerprint, filename, candidates, min_similarity):
+    """Pick the previous version of a report from (id, filename, fingerprint) candidates, newest first
+
+    A candidate for the same property wins outright; otherwise the most
+    similar one is used if it reaches min_similarity, preferring one with
+    the same filename. Returns (id, matched_by, similarity) or None.
+    """
+    scored = [(analysis_id, name, similarity(fingerprint, other), other) for analysis_id, name, other in candidates]
+    if fingerprint['property']:
+        for analysis_id, _, score, other in scored:
+            if other.get('property') == fingerprint['property']:
+                return analysis_id, 'property', score
+
+    similar = [entry for entry in scored if entry[2] >= min_similarity]
+    if not similar:
+        return None
+    for analysis_id, name, score, _ in similar:
+        if name == filename:
+            return analysis_id, 'filename', score
+    analysis_id, _, score, _ = max(similar, key=lambda entry: entry[2])
+    return analysis_id, 'similarity', score
+
+
+def changed_sections(fingerprint, previous, previous_traces):
+    """Return the sections whose excerpt changed since the previous version, or whose previous trace failed
+
+    previous_traces are the previous analysis's thinking traces, in the
+    order of the sections in its fingerprint.
+    """
+    traces = dict(zip(previous['sections'], previous_traces))
+    changed = []
+    for section in fingerprint['sections']:
+        trace = traces.get(section)
+        if (
+            not isinstance(trace, dict)
+            or previous['sections'].get(section) != fingerprint['sections'].get(section)
+            or trace.get('evidence') in FAILED_EVIDENCE
+        ):
+            changed.append(section)
+    return changed
+
+
+def merge_revision(previous, revised, changed, section_of):
+    """Merge a reassessment of the changed sections into the previous analysis
+
+    section_of maps a risk factor's category, which the model may word
+    freely, to its section. Previous risk factors in the changed sections
+    are dropped, since the reassessment covers them; the others are kept
+    unless they duplicate a revised one. Revised risk factors are marked
+    with "revised": true.
+    """
+    kept = [risk for risk in previous.get('risk_factors', []) if section_of(risk.get('category')) not in changed]
+    return reduce_analyses([
+        {**revised, "risk_factors": [{**risk, "revised": True} for risk in revised.get('risk_factors', [])]},
+        {"risk_factors": kept}
+    ])
@@ -0,0 +1,247 @@
+"""
+Single-pass segmentation of inspection reports into the analysis sections.
+
+Headings ("STRUCTURAL ASSESSMENT", "3. ROOFING", "HVAC SYSTEMS:") are found
+with one anchored regex scan and mapped onto the analysis sections by the
+words of the section names and of their risk categories' keywords. A
+section's segment runs from its heading to the next heading of any kind,
+and that segment is what the section is analyzed from. Sections with no
+heading, including every section of a report without headings, fall back
+to the passages with the most keyword hits (passage_index.py).
+
+ReportSegments also turns quoted evidence into character offsets and page
+numbers, so results can point at their source in the report text.
+"""
+import re
+from bisect import bisect_left, bisect_right
+
+from passage_index import PassageIndex
+
+# An all-caps line, optionally numbered and ending in a colon. Words are
+# separated by blanks and nothing else can match a blank, so each line is
+# matched without backtracking across the line. "$" does not match before
+# the "\r" of CRLF line endings, so that is allowed explicitly.
+HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?:\d+(?:\.\d+)*\.?[ \t]+)?([A-Z][A-Z0-9&/,()'-]*(?:[ \t]+[A-Z0-9&/,()'-]+)*)[ \t]*(?::[ \t]*)?\r?$",
+    re.MULTILINE
+)
+HEADING_MAX_CHARS = 60
+
+# Words too common in headings to say which section one belongs to
+HEADING_STOPWORDS = {"and", "the", "of", "systems", "system", "issues", "concerns", "assessment", "property", "report", "inspection"}
+
+WORD_PATTERN = re.compile(r'[a-z]+')
+
+# Evidence is matched by its longest fragments first; shorter ones are too ambiguous
+FRAGMENT_PATTERN = re.compile(r'[^.;:!?\n"]{20,}')
+FRAGMENT_MAX_CHARS = 120
+
+
+def heading_aliases(section_categories, categories):
+    """Map each section to the words that identify its headings: its name and its categories' one-word keywords"""
+    aliases = {}
+    for section, section_category_list in section_categories.items():
+        name_words = set(WORD_PATTERN.findall(section.lower())) - HEADING_STOPWORDS
+        keywords = {
+            keyword.lower() for category in section_category_list for keyword in categories.get(category, [])
+            if ' ' not in keyword
+        }
+        aliases[section] = (name_words, keywords - HEADING_STOPWORDS)
+    return aliases
+
+
+def _word_matches(word, alias):
+    # Short aliases ("ac", "ada") must match whole words; longer ones also match as stems ("roof" in "roofing")
+    return word == alias or (len(alias) >= 4 and word.startswith(alias))
+
+
+def map_heading(heading, aliases):
+    """Return the section a heading belongs to, or None if it names none of them
+
+    Matches on a section's own name outrank keyword matches, and ties go
+    to the section listed first.
+    """
+    words = [word for word in WORD_PATTERN.findall(heading.lower()) if word not in HEADING_STOPWORDS]
+    best, best_score = None, (0, 0)
+    for section, (name_words, keywords) in aliases.items():
+        score = (
+            sum(1 for word in words if any(_word_matches(word, alias) for alias in name_words)),
+            sum(1 for word in words if any(_word_matches(word, alias) for alias in keywords))
+        )
+        if score > best_score:
+            best, best_score = section, score
+    return best
+
+
+def find_segments(text, aliases):
+    """Split text at its headings, returning (start, end, heading, section or None) in document order"""
+    headings = [
+        match for match in HEADING_PATTERN.finditer(text)
+        if len(match.group(1)) <= HEADING_MAX_CHARS and len(WORD_PATTERN.findall(match.group(1).lower())) > 0
+        and sum(len(word) for word in WORD_PATTERN.findall(match.group(1).lower())) >= 4
+    ]
+    segments = []
+    for number, match in enumerate(headings):
+        end = headings[number + 1].start() if number + 1 < len(headings) else len(text)
+        heading = match.group(1).strip()
+        segments.append((match.end(), end, heading, map_heading(heading, aliases)))
+    return segments
+
+
+def _merge_spans(spans):
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class ReportSegments:
+    """A report split into analysis sections by heading, with keyword passages as the fallback"""
+
+    def __init__(self, text, section_categories, categories, page_offsets=None):
+        self.text = text
+        self.section_categories = section_categories
+        self.page_offsets = page_offsets
+        self.index = PassageIndex(text, categories)
+        self._passage_starts = [start for start, _ in self.index.spans]
+        self._lowered = None
+
+        self.aliases = heading_aliases(section_categories, categories)
+        self.segments = find_segments(text, self.aliases)
+        self.by_section = {}
+        for start, end, heading, section in self.segments:
+            if section is not None:
+                self.by_section.setdefault(section, []).append((start, end, heading))
+
+        self.category_sections = {}
+        for section, section_category_list in section_categories.items():
+            for category in section_category_list:
+                self.category_sections.setdefault(category, section)
+
+    def section_of(self, category):
+        """The section a risk category belongs to, matching free-form model categories like headings, or None"""
+        if category in self.category_sections:
+            return self.category_sections[category]
+        return map_heading(str(category or ''), self.aliases)
+
+    def page(self, offset):
+        """The 1-based page holding a character offset, or None for text without pages"""
+        if not self.page_offsets:
+            return None
+        return max(1, bisect_right(self.page_offsets, offset))
+
+    def _span(self, start, end, match):
+        span = {"start": start, "end": end, "match": match}
+        if self.page_offsets:
+            span["page"] = self.page(start)
+        return span
+
+    def _segment_spans(self, section, max_chars):
+        """The parts of a section's segments to send, as (start, end) spans within max_chars"""
+        ranges = self.by_section[section]
+        if sum(end - start for start, end, _ in ranges) <= max_chars:
+            return [(start, end) for start, end, _ in ranges]
+
+        # Too long to send whole: the segment's passages with the most keyword hits
+        section_category_list = self.section_categories.get(section, [])
+        candidates = []
+        for range_start, range_end, _ in ranges:
+            first = max(0, bisect_right(self._passage_starts, range_start) - 1)
+            last = bisect_left(self._passage_starts, range_end)
+            for passage in range(first, last):
+                start, end = self.index.spans[passage]
+                start, end = max(start, range_start), min(end, range_end)
+                if end > start:
+                    hits = sum(self.index.postings[category].get(passage, 0) for category in section_category_list)
+                    candidates.append((-hits, start, end))
+
+        chosen = []
+        remaining = max_chars
+        for _, start, end in sorted(candidates):
+            if end - start <= remaining:
+                chosen.append((start, end))
+                remaining -= end - start
+        return sorted(chosen)
+
+    def section_spans(self, section, max_chars):
+        """The (start, end) spans a section is analyzed from: its segment, or failing that its keyword passages"""
+        if section in self.by_section:
+            return self._segment_spans(section, max_chars)
+        chosen = self.index._top_passage_ids(self.section_categories.get(section, []), max_chars)
+        return [self.index.spans[passage] for passage in sorted(chosen)]
+
+    def excerpt(self, section, max_chars, separator="\n...\n"):
+        """The report text a section is analyzed from, within max_chars"""
+        pieces = (self.text[start:end].strip() for start, end in self.section_spans(section, max_chars))
+        return separator.join(piece for piece in pieces if piece)
+
+    def combined_excerpt(self, sections, max_chars, separator="\n...\n"):
+        """The text several sections are analyzed from, each within max_chars, including shared text once"""
+        spans = _merge_spans([span for section in sections for span in self.section_spans(section, max_chars)])
+        pieces = (self.text[start:end].strip() for start, end in spans)
+        return separator.join(piece for piece in pieces if piece)
+
+    def locate(self, quote, section=None):
+        """Find quoted report text, in the section's segments first; returns a span dict or None
+
+        The whole quote is tried first, then its longest fragments between
+        punctuation, since models often quote only part of a sentence.
+        """
+        quote = " ".join(str(quote or '').split()).strip('"\' ').lower()
+        if len(quote) < 10:
+            return None
+        if self._lowered is None:
+            self._lowered = self.text.lower()
+
+        fragments = [quote[:FRAGMENT_MAX_CHARS]]
+        fragments += sorted(
+            (fragment.strip()[:FRAGMENT_MAX_CHARS] for fragment in FRAGMENT_PATTERN.findall(quote)),
+            key=len, reverse=True
+        )
+        ranges = [(start, end) for start, end, _ in self.by_section.get(section, [])] + [(0, len(self.text))]
+        for fragment in fragments:
+            if len(fragment) < 10:
+                continue
+            for range_start, range_end in ranges:
+                position = self._lowered.find(fragment, range_start, range_end)
+                if position != -1:
+                    return self._span(position, position + len(fragment), "quote")
+        return None
+
+    def heading_span(self, section):
+        """The span of a section's first segment, or None if it has no heading"""
+        ranges = self.by_section.get(section)
+        if not ranges:
+            return None
+        start, end, heading = ranges[0]
+        span = self._span(start, end, "section")
+        span["heading"] = heading
+        return span
+
+    def annotate(self, analysis, sections=None):
+        """Add evidence_span to traces and location_span to risk factors, and list the segments
+
+        Traces are matched to sections by position when sections are given,
+        otherwise by their section label; risk factors by their description,
+        else by the heading of their category's section.
+        """
+        for number, trace in enumerate(analysis.get('thinking_traces') or []):
+            if not isinstance(trace, dict):
+                continue
+            if sections is not None:
+                section = sections[number] if number < len(sections) else None
+            else:
+                label = str(trace.get('section') or '')
+                section = label if label in self.section_categories else map_heading(label, self.aliases)
+            trace['evidence_span'] = self.locate(trace.get('evidence'), section) or self.heading_span(section)
+        for risk in analysis.get('risk_factors') or []:
+            if isinstance(risk, dict):
+                section = self.section_of(risk.get('category'))
+                risk['location_span'] = self.locate(risk.get('description'), section) or self.heading_span(section)
+        analysis['segments'] = [
+            {"section": section, "heading": heading, "start": start, "end": end, "page": self.page(start)}
+            for start, end, heading, section in self.segments
+        ]
@@ -0,0 +1,86 @@
+import threading
+
+
+class Flight:
+    """Events of one running analysis, replayed to every subscriber that joins it"""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self._changed = threading.Condition()
+
+    def publish(self, event):
+        with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    def close(self):
+        with self._changed:
+            self.done = True
+            self._changed.notify_all()
+
+    def follow(self):
+        """Yield every event published so far, then new ones until the flight closes (blocking)"""
+        index = 0
+        while True:
+            with self._changed:
+                while index >= len(self.events) and not self.done:
+                    self._changed.wait()
+                batch = self.events[index:]
+                index += len(batch)
+                done = self.done
+            yield from batch
+            if done and index >= len(self.events):
+                return
+
+
+class SingleFlight:
+    """In-process registry so identical concurrent analyses run once and are shared
+
+    The first caller for a key leads and publishes its events to the flight;
+    callers that join while it runs follow those events instead of running
+    the pipeline again. Counters record how much model work was saved.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.leaders = 0
+        self.followers = 0
+        self.model_calls_saved = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """Return (flight, is_leader) for key, starting a new flight if none is running"""
+        with self._lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                self.followers += 1
+                return flight, False
+            flight = Flight()
+            self.flights[key] = flight
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, key, flight):
+        """Close a flight and stop new callers joining it"""
+        with self._lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+        flight.close()
+
+    def record_saved(self, usage):
+        """Count the model calls and tokens a follower did not have to spend"""
+        with self._lock:
+            self.model_calls_saved += usage.get('model_calls', 0)
+            self.tokens_saved += usage.get('total_tokens', 0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self.flights),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "model_calls_saved": self.model_calls_saved,
+                "tokens_saved": self.tokens_saved
+            }
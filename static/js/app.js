@@ -2,6 +2,20 @@
 
 let currentAnalysisData = null;
 
+// Minimum time between rendered thinking results. The server sends events as
+// soon as they are ready, so pacing for readability happens here instead.
+const THINKING_RESULT_INTERVAL_MS = 400;
+let pacedUpdates = [];
+let pacingTimer = null;
+
+// Risk factors streamed in before the complete event arrives
+let partialRiskFactors = [];
+
+// The running analysis job and the id of its last event received, used to
+// resume the event stream if the connection drops
+const MAX_STREAM_RECONNECTS = 5;
+let currentJob = null;
+
 // DOM elements
 const uploadArea = document.getElementById('uploadArea');
 const fileInput = document.getElementById('fileInput');
@@ -80,6 +94,8 @@ function uploadFile(file) {
     formData.append('file', file);
 
     // Show progress and thinking traces
+    resetPacedUpdates();
+    partialRiskFactors = [];
     showProgress();
     showThinkingTraces();
     showInfo('Starting analysis...', 'info');
@@ -87,55 +103,98 @@ function uploadFile(file) {
     console.log('Uploading file:', file.name);
 
     // Use streaming endpoint for real-time analysis
+    const job = { id: null, lastEventId: null, finished: false };
+    currentJob = job;
     fetch('/stream-analysis', {
         method: 'POST',
         body: formData
     })
-    .then(response => {
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let buffer = '';
-        
-        function processStream() {
-            return reader.read().then(({ done, value }) => {
-                if (done) {
-                    return;
-                }
-                
-                buffer += decoder.decode(value, { stream: true });
-                const lines = buffer.split('\n');
-                buffer = lines.pop(); // Keep incomplete line in buffer
-                
-                for (const line of lines) {
-                    if (line.startsWith('data: ')) {
-                        try {
-                            const data = JSON.parse(line.slice(6));
-                            console.log('Stream data:', data);
-                            handleStreamData(data);
-                        } catch (e) {
-                            console.error('Error parsing stream data:', e);
-                        }
-                    }
-                }
-                
-                return processStream();
-            });
+    .then(response => readEventStream(response, job))
+    .then(() => resumeEventStream(job, 0), error => {
+        console.error('Upload error:', error);
+        if (job.id && !job.finished) {
+            // The analysis keeps running on the server; pick up where we left off
+            return resumeEventStream(job, 0);
         }
-        
-        return processStream();
+        throw error;
     })
     .catch(error => {
-        console.error('Upload error:', error);
         hideProgress();
         hideThinkingTraces();
         showInfo('Error uploading file: ' + error.message, 'danger');
     });
 }
 
+// Read SSE messages from a response, recording the job and last event id
+function readEventStream(response, job) {
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    function processStream() {
+        return reader.read().then(({ done, value }) => {
+            if (done) {
+                return;
+            }
+            
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop(); // Keep incomplete line in buffer
+            
+            for (const line of lines) {
+                if (line.startsWith('id: ')) {
+                    job.lastEventId = line.slice(4);
+                } else if (line.startsWith('data: ')) {
+                    try {
+                        const data = JSON.parse(line.slice(6));
+                        console.log('Stream data:', data);
+                        if (data.type === 'job') {
+                            job.id = data.job_id;
+                        } else {
+                            if (data.type === 'complete' || data.type === 'error') {
+                                job.finished = true;
+                            }
+                            handleStreamData(data);
+                        }
+                    } catch (e) {
+                        console.error('Error parsing stream data:', e);
+                    }
+                }
+            }
+            
+            return processStream();
+        });
+    }
+    
+    return processStream();
+}
+
+// Reconnect to a job's events after the stream ended early, replaying from the last event seen
+function resumeEventStream(job, attempt) {
+    if (job.finished || !job.id || job !== currentJob) {
+        return;
+    }
+    if (attempt >= MAX_STREAM_RECONNECTS) {
+        throw new Error('Lost connection to the analysis');
+    }
+    
+    showInfo('Connection lost, reconnecting...', 'warning');
+    const delay = Math.min(8000, 500 * 2 ** attempt);
+    const resumedFrom = job.lastEventId;
+    // Count the attempt as failed unless new events arrived
+    const next = () => resumeEventStream(job, job.lastEventId !== resumedFrom ? 0 : attempt + 1);
+    return new Promise(resolve => setTimeout(resolve, delay))
+        .then(() => fetch(`/jobs/${encodeURIComponent(job.id)}/events`, {
+            headers: job.lastEventId ? { 'Last-Event-ID': job.lastEventId } : {}
+        }))
+        .then(response => readEventStream(response, job))
+        .then(next, next);
+}
+
 // Handle streaming data
 function handleStreamData(data) {
     switch(data.type) {
@@ -158,19 +217,31 @@ function handleStreamData(data) {
             addThinkingSection(data.section, data.message);
             break;
 
+        case 'thinking_delta':
+            appendThinkingDelta(data.section, data.delta);
+            break;
+
         case 'thinking_result':
-            updateThinkingSection(data.section, data.trace);
+            enqueuePacedUpdate(() => updateThinkingSection(data.section, data.trace));
+            break;
+
+        case 'risk_factor':
+            addPartialRiskFactor(data.risk);
             break;
 
         case 'complete':
-            hideProgress();
-            hideThinkingTraces();
-            currentAnalysisData = data.data;
-            displayResults(data.data);
-            showInfo('Analysis completed successfully!', 'success');
+            // Wait for pending section results so none are skipped
+            enqueuePacedUpdate(() => {
+                hideProgress();
+                hideThinkingTraces();
+                currentAnalysisData = data.data;
+                displayResults(data.data);
+                showInfo('Analysis completed successfully!', 'success');
+            });
             break;
 
         case 'error':
+            resetPacedUpdates();
             hideProgress();
             hideThinkingTraces();
             showInfo('Error: ' + data.message, 'danger');
@@ -178,6 +249,34 @@ function handleStreamData(data) {
     }
 }
 
+// Queue a UI update so consecutive updates are spaced out
+function enqueuePacedUpdate(update) {
+    pacedUpdates.push(update);
+    if (!pacingTimer) {
+        runNextPacedUpdate();
+    }
+}
+
+// Run the next queued update and schedule the one after it
+function runNextPacedUpdate() {
+    const update = pacedUpdates.shift();
+    if (!update) {
+        pacingTimer = null;
+        return;
+    }
+    update();
+    pacingTimer = setTimeout(runNextPacedUpdate, THINKING_RESULT_INTERVAL_MS);
+}
+
+// Drop any queued updates
+function resetPacedUpdates() {
+    pacedUpdates = [];
+    if (pacingTimer) {
+        clearTimeout(pacingTimer);
+        pacingTimer = null;
+    }
+}
+
 // Display analysis results
 function displayResults(data) {
     console.log('Displaying results:', data);
@@ -261,6 +360,27 @@ function displayResults(data) {
     console.log('Results displayed successfully');
 }
 
+// Show a risk factor as soon as it streams in, ahead of the full results
+function addPartialRiskFactor(risk) {
+    partialRiskFactors.push(risk);
+    currentAnalysisData = { risk_factors: partialRiskFactors };
+
+    let container = document.getElementById('partialRiskFactors');
+    if (!container) {
+        resultsContent.innerHTML = `
+            <div class="fade-in-up">
+                <h5 class="mb-3">
+                    <span class="spinner-border spinner-border-sm text-primary me-2"></span>
+                    Risk Factors Found So Far
+                </h5>
+                <div class="row" id="partialRiskFactors"></div>
+            </div>
+        `;
+        container = document.getElementById('partialRiskFactors');
+    }
+    container.insertAdjacentHTML('beforeend', createRiskCard(risk, partialRiskFactors.length - 1));
+}
+
 // Create risk factor card
 function createRiskCard(risk, index) {
     const severityClass = getSeverityClass(risk.severity);
@@ -268,7 +388,7 @@ function createRiskCard(risk, index) {
     
     return `
         <div class="col-lg-6 mb-3">
-            <div class="card risk-card ${risk.severity.toLowerCase()}" onclick="showRiskDetails(${index})">
+            <div class="card risk-card ${(risk.severity || '').toLowerCase()}" onclick="showRiskDetails(${index})">
                 <div class="card-body">
                     <div class="d-flex align-items-start">
                         <div class="risk-category-icon ${getCategoryClass(risk.category)}">
@@ -281,6 +401,7 @@ function createRiskCard(risk, index) {
                             </div>
                             <p class="small text-muted mb-2">${risk.description || 'No description available'}</p>
                             ${risk.location ? `<small class="text-muted"><i class="fas fa-map-marker-alt me-1"></i>${risk.location}</small>` : ''}
+                            ${risk.location_span ? `<small class="text-muted d-block"><i class="fas fa-file-alt me-1"></i>${formatSpan(risk.location_span)}</small>` : ''}
                         </div>
                     </div>
                 </div>
@@ -289,6 +410,13 @@ function createRiskCard(risk, index) {
     `;
 }
 
+// Describe where in the report a span of evidence was found
+function formatSpan(span) {
+    if (!span) return '';
+    const where = span.page ? `page ${span.page}` : `characters ${span.start}-${span.end}`;
+    return span.match === 'section' ? `${span.heading}, ${where}` : where;
+}
+
 // Get severity class for styling
 function getSeverityClass(severity) {
     switch(severity?.toLowerCase()) {
@@ -378,13 +506,18 @@ function showRiskDetails(index) {
 function exportReport() {
     if (!currentAnalysisData) return;
     
-    fetch('/export', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(currentAnalysisData)
-    })
+    // Stored analyses are exported by id; otherwise send the results back
+    const request = currentAnalysisData.id
+        ? fetch(`/analyses/${encodeURIComponent(currentAnalysisData.id)}/export`)
+        : fetch('/export', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(currentAnalysisData)
+        });
+    
+    request
     .then(response => response.blob())
     .then(blob => {
         const url = window.URL.createObjectURL(blob);
@@ -483,6 +616,7 @@ function toggleThinkingTraces() {
                         <div class="mb-3">
                             <strong>Evidence:</strong>
                             <p class="mb-0">${trace.evidence}</p>
+                            ${trace.evidence_span ? `<small class="text-muted">${formatSpan(trace.evidence_span)}</small>` : ''}
                         </div>
                     ` : ''}
                     
@@ -538,6 +672,7 @@ function addThinkingSection(section, message) {
                             <div class="spinner-border spinner-border-sm text-primary me-2"></div>
                             <span>${message}</span>
                         </div>
+                        <pre class="thinking-stream small text-muted mb-0 mt-2 d-none"></pre>
                         <div class="thinking-result d-none"></div>
                     </div>
                 </div>
@@ -547,6 +682,16 @@ function addThinkingSection(section, message) {
     }
 }
 
+// Append streamed model output to a section while it is being analyzed
+function appendThinkingDelta(section, delta) {
+    const sectionElement = thinkingContent.querySelector(`[data-section="${section}"]`);
+    if (sectionElement) {
+        const streamElement = sectionElement.querySelector('.thinking-stream');
+        streamElement.classList.remove('d-none');
+        streamElement.textContent += delta;
+    }
+}
+
 // Update thinking section with results
 function updateThinkingSection(section, trace) {
     const sectionElement = thinkingContent.querySelector(`[data-section="${section}"]`);
@@ -554,6 +699,9 @@ function updateThinkingSection(section, trace) {
         const statusElement = sectionElement.querySelector('.thinking-status');
         const resultElement = sectionElement.querySelector('.thinking-result');
         
+        // Replace the raw streamed output with the parsed trace
+        sectionElement.querySelector('.thinking-stream').classList.add('d-none');
+        
         // Update status
         statusElement.innerHTML = `
             <div class="text-success">
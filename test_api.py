@@ -3,6 +3,8 @@ import os
 import openai
 from dotenv import load_dotenv
 
+import llm_client
+
 # Load environment variables
 load_dotenv()
 
@@ -15,9 +17,8 @@ def test_api():
     
     try:
         # Simple test call
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
+        response = llm_client.chat(
+            [
                 {"role": "user", "content": "Say 'Hello, API is working!' in JSON format: {\"message\": \"Hello, API is working!\"}"}
             ],
             max_tokens=50
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+from app import RISK_CATEGORIES, SECTION_CATEGORIES
+from segmenter import ReportSegments
+
+REPORT = """PROPERTY INSPECTION REPORT
+Property: 12 Elm Street
+
+STRUCTURAL ASSESSMENT
+Foundation: a major crack runs along the north foundation wall.
+
+ELECTRICAL SYSTEMS:
+The breaker panel has double-tapped circuits and ungrounded outlets.
+
+3. ROOFING
+Several shingles are missing above the garage.
+"""
+
+
+def segment_names(text):
+    return [(heading, section) for _, _, heading, section in ReportSegments(text, SECTION_CATEGORIES, RISK_CATEGORIES).segments]
+
+
+def test_segments():
+    assert segment_names(REPORT) == [
+        ("PROPERTY INSPECTION REPORT", None),
+        ("STRUCTURAL ASSESSMENT", "Structural Assessment"),
+        ("ELECTRICAL SYSTEMS", "Electrical Systems"),
+        ("ROOFING", "Structural Assessment"),
+    ]
+
+
+def test_crlf_segments():
+    text = REPORT.replace("\n", "\r\n")
+    assert segment_names(text) == segment_names(REPORT)
+
+    segments = ReportSegments(text, SECTION_CATEGORIES, RISK_CATEGORIES)
+    excerpt = segments.excerpt("Electrical Systems", 3000)
+    assert excerpt == "The breaker panel has double-tapped circuits and ungrounded outlets."
+
+    span = segments.locate("double-tapped circuits and ungrounded outlets", "Electrical Systems")
+    assert text[span["start"]:span["end"]].lower() == "double-tapped circuits and ungrounded outlets"
+
+
+if __name__ == "__main__":
+    test_segments()
+    test_crlf_segments()
+    print("✅ Segmenter tests passed")
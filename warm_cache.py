@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Pre-fill the per-section trace cache for a folder of inspection reports.
+
+Every PDF and text file in the folder is run through the section analyses
+used by /stream-analysis. Sections that are already cached are skipped, so
+re-running after a prompt change only pays for the sections that changed.
+
+Usage:
+    python warm_cache.py reports/
+"""
+import argparse
+import os
+
+import app as app_module
+from ingestion import decode_text
+
+
+def read_report(path):
+    """Extract text from a PDF or text report on disk"""
+    if path.lower().endswith('.pdf'):
+        with open(path, 'rb') as f:
+            return app_module.extract_text_from_pdf(f)
+    return decode_text(path)
+
+
+def warm_folder(folder):
+    """Run the section analyses for every report in folder"""
+    paths = sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(('.pdf', '.txt'))
+    )
+
+    for index, path in enumerate(paths, start=1):
+        text = read_report(path)
+        stats_before = app_module.section_cache.stats()
+        for _ in app_module.iterate_async(app_module.run_section_analyses(text, app_module.ANALYSIS_SECTIONS)):
+            pass
+        stats_after = app_module.section_cache.stats()
+        print(
+            f"[{index}/{len(paths)}] {os.path.basename(path)}: "
+            f"{stats_after['hits'] - stats_before['hits']} cached, "
+            f"{stats_after['misses'] - stats_before['misses']} analyzed"
+        )
+
+    print(f"Section cache: {app_module.section_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fill the per-section trace cache")
+    parser.add_argument('folder', help='Folder containing PDF or text inspection reports')
+    args = parser.parse_args()
+    warm_folder(args.folder)
+
+
+if __name__ == '__main__':
+    main()